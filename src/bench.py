@@ -0,0 +1,377 @@
+"""!
+@file bench.py
+    This file times the code that runs on every camera frame and every control
+    period: cam2setpoint with and without its refinement stage, find_targets,
+    MLX_Cam.get_array and get_csv, RawImage.read and RegisterMap get/set
+    against a fake I2C bus, Encoder.read, CLController.run,
+    MotorDriver.set_duty_cycle, and passing a pair of setpoints through two
+    Shares and through one SharedRecord, and setting and reading flags of a
+    SharedRecord a task waits on.  It runs as-is on the board and on a PC
+    (where host/shims stand in for pyb and friends) and prints one JSON object
+    with the time and memory allocated per call of each as its last line.
+
+    Results can be saved as a baseline, one section per platform, and later
+    runs are compared against the baseline for their platform; anything
+    slower by more than TIME_TOLERANCE or allocating more than
+    ALLOC_TOLERANCE extra bytes per call is flagged as a regression.
+    @code
+    python bench.py --save-baseline        # on the PC, from the src directory
+    python bench.py --out bench.json       # later, flags regressions
+    @endcode
+    On the PC the baseline is kept in host/bench_baseline.json, which isn't
+    copied to the board.
+    On the board, copy bench.py over and run
+    @code
+    import bench
+    bench.run(save_baseline=True)
+    @endcode
+    The motor driver and encoder are set up on timer 5 (A0, A1, enable A4)
+    and timer 8 (C6, C7), which the turret doesn't use, so nothing moves.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+import sys
+try:
+    # on a PC, put the MicroPython stand-ins in place first
+    import host
+    host.install()
+except ImportError:
+    host = None
+import gc
+import json
+import struct
+import pyb
+import utime
+import task_share
+from mlx90640.regmap import RegisterMap, CameraInterface, REGISTER_MAP
+from mlx90640.image import RawImage, PIX_DATA_ADDRESS
+from mlx90640.calibration import IMAGE_SIZE
+from mlx_cam import MLX_Cam
+from cam2setpoint import cam2setpoint, find_targets
+from cam2turret import cam2turret
+from frame_filter import FrameFilter, MotionDetector
+from motor_drivers.encoder_reader import Encoder
+from motor_drivers.motor_driver import MotorDriver
+from motor_drivers.controller import CLController
+from shared_record import SharedRecord
+
+try:
+    from time import perf_counter
+except ImportError:
+    perf_counter = None
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+## File the baselines are kept in, one section per platform.  On a PC it is
+#  kept with the host tools, so it isn't copied to the board with the source
+BASELINE_FILE = "bench_baseline.json"
+if host is not None:
+    import os
+    BASELINE_FILE = os.path.join(host.HOST_DIR, BASELINE_FILE)
+## How many times each benchmark is run, the best run counting
+REPEATS = 5
+## How many more times a slow benchmark is run before it counts as a regression
+CONFIRM_RUNS = 2
+## How much slower than the baseline (as a fraction) counts as a regression
+TIME_TOLERANCE = 0.2
+## How many more bytes per call than the baseline count as a regression
+ALLOC_TOLERANCE = 16
+
+
+class FakeBus:
+    """!
+    This class implements a stand-in for an I2C bus with an MLX90640 on it
+    which holds every register as a 16-bit word and never changes them by
+    itself.  It lets the camera driver run without a camera, on the board or
+    on a PC.
+    """
+
+    def __init__(self, pixels=None):
+        """!
+        Creates the bus.
+        @param pixels - the 768 pixel values to put in the camera RAM
+        """
+        self.words = {0x8000: 0x0008, 0x800D: 0x1901}
+        if pixels is not None:
+            for idx in range(IMAGE_SIZE):
+                self.words[PIX_DATA_ADDRESS + idx] = pixels[idx] & 0xFFFF
+
+    def scan(self):
+        return [0x33]
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+        return buf
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        for n in range(0, len(buf), 2):
+            struct.pack_into(">H", buf, n, self.words.get(memaddr + n//2, 0))
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        for n in range(0, len(buf), 2):
+            self.words[memaddr + n//2] = struct.unpack_from(">H", buf, n)[0]
+
+
+def _time_us(fun, count):
+    """!
+    Times count calls of fun with the best clock available.
+    @returns the total time in microseconds
+    """
+    if perf_counter is not None:
+        start = perf_counter()
+        for n in range(count):
+            fun()
+        return (perf_counter() - start)*1000000
+    start = utime.ticks_us()
+    for n in range(count):
+        fun()
+    return utime.ticks_diff(utime.ticks_us(), start)
+
+
+def _alloc_bytes(fun):
+    """!
+    Measures the memory one call of fun allocates.  On the board that is the
+    growth of the heap with the garbage collector off; on a PC it is the peak
+    growth of the traced heap, since freed memory is reused straight away.
+    @returns the number of bytes
+    """
+    gc.collect()
+    if tracemalloc is not None:
+        # tracing slows everything down, so it is only on for this one call
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            fun()
+            return tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+    gc.disable()
+    try:
+        before = gc.mem_alloc()
+        fun()
+        return gc.mem_alloc() - before
+    finally:
+        gc.enable()
+
+
+def bench(fun, count, repeats=REPEATS):
+    """!
+    This function measures one hot path.  The time is the best of several
+    runs, since anything else going on can only make a run slower.
+    @param fun - a function taking no arguments which makes one call
+    @param count - how many calls to time in each run
+    @param repeats - how many runs to take the best of
+    @returns a dictionary with the time per call in us, the bytes allocated
+             per call and the number of calls timed in each run
+    """
+    # the first call can import or allocate things the rest don't
+    fun()
+    best = None
+    for n in range(repeats):
+        gc.collect()
+        total = _time_us(fun, count)
+        if best is None or total < best:
+            best = total
+    return {"us": best/count, "bytes": _alloc_bytes(fun), "calls": count}
+
+
+def _test_frame():
+    """!
+    Makes a repeatable camera frame: a warm background with a hot blob.
+    @returns a list of the 768 pixel values in camera RAM order
+    """
+    pixels = []
+    for row in range(24):
+        for col in range(32):
+            hot = 8 <= row < 18 and 12 <= col < 20
+            pixels.append(200 + (row*7 + col*13) % 40 if hot else 60 + (row*3 + col*5) % 30)
+    return pixels
+
+
+def make_benchmarks(scale=1):
+    """!
+    This function sets up every benchmark.
+    @param scale - multiplies the number of calls timed
+    @returns a list of (name, function, calls) tuples
+    """
+    pixels = _test_frame()
+    bus = FakeBus(pixels)
+    camera = MLX_Cam(bus)
+    iface = CameraInterface(bus, 0x33)
+    raw = RawImage()
+    raw.read(iface)
+    frame = camera.get_array(raw.pix)
+    registers = RegisterMap(iface, REGISTER_MAP)
+    frame_filter = FrameFilter()
+    frame_filter.update(frame)
+    motion_detector = MotionDetector()
+    motion_detector.update(frame)
+
+    def set_register():
+        registers["refresh_rate"] = 4
+
+    enc_timer = pyb.Timer(8, prescaler=0, period=65535)
+    encoder = Encoder(pyb.Pin(pyb.Pin.cpu.C6, pyb.Pin.IN), pyb.Pin(pyb.Pin.cpu.C7, pyb.Pin.IN),
+                      enc_timer, conversion_factor=16*256*4/360)
+    con = CLController(25, 0.1, 2, 180)
+    motor = MotorDriver(pyb.Pin(pyb.Pin.cpu.A4, mode=pyb.Pin.OPEN_DRAIN, pull=pyb.Pin.PULL_UP, value=1),
+                        pyb.Pin(pyb.Pin.cpu.A0, pyb.Pin.OUT_PP),
+                        pyb.Pin(pyb.Pin.cpu.A1, pyb.Pin.OUT_PP),
+                        pyb.Timer(5, freq=20000))
+    effort = [20]
+    yaw_share = task_share.Share("f", name="Bench yaw setpoint")
+    pitch_share = task_share.Share("f", name="Bench pitch setpoint")
+    setpoints = SharedRecord((("yaw", "f"), ("pitch", "f")), name="Bench setpoints")
+    status = SharedRecord((("run", "B"), ("yaw_done", "B"), ("pitch_done", "B"),
+                           ("returning", "B")), name="Bench status")
+    done = [0]
+
+    class Waiter:
+        # stands in for a task waiting on the status, so set() looks for changes
+        def go(self):
+            pass
+
+    status.wake(Waiter(), "yaw_done", "pitch_done")
+
+    def shares_put_get():
+        yaw_share.put(12.5)
+        pitch_share.put(4.0)
+        return yaw_share.get(), pitch_share.get()
+
+    def record_put_get():
+        setpoints.put(12.5, 4.0)
+        return setpoints.get()
+
+    def record_set_get():
+        # flip the flags as the motor and trigger tasks do, so every call wakes
+        done[0] ^= 1
+        status.set("yaw_done", done[0], "pitch_done", done[0])
+        return status.get("yaw_done")
+
+    def set_duty():
+        # alternate the effort so the hardware is written every call, and
+        # leave the driver disabled afterwards
+        effort[0] = 41 - effort[0]
+        motor.set_duty_cycle(effort[0])
+        motor.disable()
+
+    return [
+        ("cam2setpoint", lambda: cam2setpoint(frame), 100*scale),
+        ("cam2setpoint refine", lambda: cam2setpoint(frame, refine=True), 100*scale),
+        ("find_targets", lambda: find_targets(frame), 100*scale),
+        ("cam2turret", lambda: cam2turret(-12.5, 4.0), 5000*scale),
+        ("FrameFilter.update", lambda: frame_filter.update(frame), 1000*scale),
+        ("MotionDetector.update", lambda: motion_detector.update(frame), 1000*scale),
+        ("MLX_Cam.get_array", lambda: camera.get_array(raw.pix), 100*scale),
+        ("MLX_Cam.get_csv", lambda: list(camera.get_csv(raw.pix)), 100*scale),
+        ("RawImage.read", lambda: raw.read(iface), 100*scale),
+        ("RegisterMap.get", lambda: registers["refresh_rate"], 1000*scale),
+        ("RegisterMap.set", set_register, 1000*scale),
+        ("Encoder.read", encoder.read, 5000*scale),
+        ("CLController.run", lambda: con.run(90.0), 5000*scale),
+        ("MotorDriver.set_duty_cycle", set_duty, 5000*scale),
+        ("Share put/get pair", shares_put_get, 5000*scale),
+        ("SharedRecord put/get", record_put_get, 5000*scale),
+        ("SharedRecord set/get field", record_set_get, 5000*scale),
+    ]
+
+
+def run_all(benchmarks):
+    """!
+    This function runs every benchmark.
+    @param benchmarks - the list from make_benchmarks()
+    @returns a dictionary of results keyed by benchmark name
+    """
+    results = {}
+    for name, fun, count in benchmarks:
+        results[name] = bench(fun, count)
+    return results
+
+
+def compare(results, baseline):
+    """!
+    This function checks results against a baseline.
+    @param results - the results from run_all()
+    @param baseline - the baseline results for the same platform
+    @returns a list of (name, what, baseline value, new value) regressions
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["us"] > base["us"]*(1 + TIME_TOLERANCE):
+            regressions.append((name, "us", base["us"], result["us"]))
+        if result["bytes"] > base["bytes"] + ALLOC_TOLERANCE:
+            regressions.append((name, "bytes", base["bytes"], result["bytes"]))
+    return regressions
+
+
+def platform():
+    """!
+    Names the platform so the board and the PC keep separate baselines.
+    @returns a name such as "pyboard" or "linux"
+    """
+    return sys.platform
+
+
+def run(baseline_file=BASELINE_FILE, save_baseline=False, out=None, scale=1):
+    """!
+    This function runs the suite, prints the results as JSON, and either
+    saves them as the baseline for this platform or compares them with it.
+    @param baseline_file - the baseline file
+    @param save_baseline - store these results as the new baseline
+    @param out - a file to also write the JSON results to
+    @param scale - multiplies the number of calls timed
+    @returns the list of regressions found
+    """
+    benchmarks = make_benchmarks(scale)
+    results = run_all(benchmarks)
+    try:
+        with open(baseline_file) as file:
+            baselines = json.load(file)
+    except OSError:
+        baselines = {}
+    name = platform()
+    regressions = [] if save_baseline else compare(results, baselines.get(name, {}))
+    if any(r[1] == "us" for r in regressions):
+        # a slow run can be a one off, so time anything slow again before
+        # calling it a regression
+        slow = [r[0] for r in regressions if r[1] == "us"]
+        for bench_name, fun, count in benchmarks:
+            if bench_name in slow:
+                for n in range(CONFIRM_RUNS):
+                    again = bench(fun, count)
+                    results[bench_name]["us"] = min(results[bench_name]["us"], again["us"])
+        regressions = compare(results, baselines.get(name, {}))
+    report = {"platform": name, "implementation": sys.implementation.name,
+              "results": results,
+              "regressions": [{"name": r[0], "what": r[1], "baseline": r[2], "now": r[3]}
+                              for r in regressions]}
+    for r in regressions:
+        print(f"REGRESSION {r[0]}: {r[1]} {r[2]:.1f} -> {r[3]:.1f}")
+    print(json.dumps(report))
+    if out:
+        with open(out, "w") as file:
+            json.dump(report, file)
+    if save_baseline:
+        baselines[name] = results
+        with open(baseline_file, "w") as file:
+            json.dump(baselines, file)
+    return regressions
+
+
+if __name__ == "__main__":
+    # argparse isn't on the board, so the few options are picked out by hand
+    args = sys.argv[1:]
+    out = args[args.index("--out") + 1] if "--out" in args else None
+    baseline_file = args[args.index("--baseline") + 1] if "--baseline" in args else BASELINE_FILE
+    scale = int(args[args.index("--scale") + 1]) if "--scale" in args else 1
+    regressions = run(baseline_file, "--save-baseline" in args, out, scale)
+    if regressions:
+        sys.exit(1)
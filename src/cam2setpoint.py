@@ -7,60 +7,501 @@
 @author Sean Nakashimo
 @date   2024-March-13 
 """
+from array import array
+import struct
 from ulab import numpy as np
 import utime
 # The following code was written by hand in matlab but converted to python using ChatGPT
-def cam2setpoint(im):
+## The background image subtracted from every frame to filter out the noise
+#  and set the datum for imaging.  It is int16 so the filtered image is too,
+#  and its pixels can be binned as small ints without making floats
+NOISE_FILTER = np.array([[0,85,49,85,48,85,55,85,48,85,70,85,61,85,72,85,69,85,85,85,74,85,85,85,85,85,85,85,85,85,85,85],
+                         [0,77,32,85,29,74,36,85,46,82,43,85,53,85,52,85,65,85,59,85,66,75,68,85,78,85,67,85,84,85,79,85],
+                         [0,85,18,85,21,85,40,85,25,85,58,85,50,85,66,85,54,85,71,85,60,85,85,85,69,85,84,85,78,85,85,85],
+                         [0,74,26,85,35,80,43,85,49,81,43,85,59,85,57,85,61,85,64,85,73,85,63,85,85,85,75,85,84,85,79,85],
+                         [0,85,45,85,39,85,61,85,51,85,75,85,55,85,85,85,66,85,85,85,77,85,85,85,80,85,85,85,85,85,85,85],
+                         [0,83,23,85,43,85,41,85,46,85,55,85,67,85,62,85,62,85,72,85,79,85,75,85,81,85,83,85,85,85,78,85],
+                         [0,85,41,85,34,85,54,85,35,85,62,85,48,85,66,85,63,85,79,85,66,85,79,85,75,85,85,85,85,85,85,85],
+                         [0,57,9,85,30,61,30,85,31,80,39,85,43,66,36,85,56,75,54,85,54,78,54,85,65,84,61,85,76,75,60,85],
+                         [0,85,47,85,38,85,58,85,49,85,69,85,51,85,67,85,67,85,84,85,77,85,85,85,85,85,85,85,85,85,85,85],
+                         [0,70,24,85,34,73,37,85,49,71,42,85,54,69,47,85,67,81,59,85,72,85,70,85,71,79,69,85,81,78,80,85],
+                         [0,85,50,85,30,85,64,85,52,85,80,85,57,85,79,85,68,85,85,85,78,85,85,85,85,85,85,85,85,85,85,85],
+                         [0,81,25,85,36,77,43,85,57,85,50,85,62,79,65,85,67,85,65,85,67,85,64,85,79,82,82,85,85,85,74,85],
+                         [0,85,34,85,32,85,57,85,42,85,68,85,54,85,75,85,64,85,85,85,74,85,85,85,85,85,85,85,85,85,85,85],
+                         [0,74,26,85,34,72,29,85,48,71,40,85,48,69,57,85,58,62,57,85,64,78,56,85,69,73,58,85,75,71,72,85],
+                         [0,85,41,85,33,85,58,85,47,85,73,85,51,85,70,85,58,85,82,85,72,85,85,85,84,85,85,85,85,85,85,85],
+                         [0,64,16,85,37,65,39,85,34,61,36,85,44,67,50,85,49,70,45,85,57,67,51,85,71,74,54,85,71,64,62,85],
+                         [0,85,39,85,35,85,59,85,46,85,65,85,61,85,71,85,56,85,85,85,80,85,85,85,77,85,85,85,85,85,85,85],
+                         [0,65,27,85,32,65,28,85,41,59,36,85,49,58,49,85,43,68,50,85,55,69,55,85,53,56,62,85,74,61,66,85],
+                         [0,85,42,85,41,85,54,85,40,85,62,85,49,85,68,85,53,85,80,85,67,85,85,85,74,85,85,85,85,85,85,85],
+                         [0,51,12,78,39,42,25,85,38,41,30,85,40,56,27,85,36,47,45,85,44,48,41,85,63,52,55,85,59,52,56,66],
+                         [0,85,50,85,43,85,69,85,33,85,73,85,54,85,73,85,57,85,77,85,72,85,85,85,75,85,85,85,78,85,85,85],
+                         [0,55,33,85,38,57,33,85,40,56,38,85,43,47,42,85,54,65,47,85,57,56,44,85,55,53,54,85,65,42,62,79],
+                         [0,68,35,73,9,70,35,85,27,85,51,85,38,85,45,85,36,80,57,85,36,80,69,85,46,85,60,85,60,85,85,84],
+                         [0,56,12,62,16,36,28,81,28,42,28,76,45,43,33,85,26,35,31,74,27,31,30,66,42,36,40,61,54,24,44,54]],
+                        dtype=np.int16)
+## File holding the angle of every pixel column and row, written by
+#  host/calibrate_angles.py and kept next to this file.  It starts with
+#  ANGLE_MAGIC and the number of columns and rows as two uint16s, then holds
+#  the column angles then the row angles as little endian float32s
+ANGLE_FILE = "cam_angles.bin"
+ANGLE_MAGIC = b"MLXA"
+
+def load_angles(filename=None):
+    """!
+    This function loads the pixel angle table.  Without a table the angles
+    are spread evenly over the nominal 55 by 35 degree field of view.
+    @param filename: the table file, by default ANGLE_FILE next to this file
+    @returns a list of the 32 column angles, left to right, and a list of
+             the 24 row angles, top to bottom, in degrees
+    """
+    if filename is None:
+        try:
+            filename = __file__[:__file__.rfind("/") + 1] + ANGLE_FILE
+        except NameError:
+            # frozen into the firmware, so look in the current directory
+            filename = ANGLE_FILE
+    try:
+        with open(filename, "rb") as file:
+            data = file.read()
+    except OSError:
+        return list(np.linspace(-27.5, 27.5, 32)), list(np.linspace(17.5, -17.5, 24))
+    magic, cols, rows = struct.unpack_from("<4sHH", data, 0)
+    if magic != ANGLE_MAGIC or cols != 32 or rows != 24:
+        raise ValueError(f"{filename} is not a 32 x 24 pixel angle table")
+    angles = struct.unpack_from("<" + "f" * (cols + rows), data, 8)
+    return list(angles[:cols]), list(angles[cols:])
+
+## The angle of each column and row of pixels
+COL_ANGLES, ROW_ANGLES = load_angles()
+## X-Y planes to map camera pixels to camera angles, from the angle table.
+#  These and the noise filter are made once when the module is imported, not
+#  on every frame
+X_PLANE = np.array([COL_ANGLES] * 24)
+Y_PLANE = np.array([ROW_ANGLES] * 32).T
+## Pixels in an image
+IMAGE_PIXELS = 24 * 32
+
+## The histogram has HIST_BINS bins each 2**HIST_SHIFT wide, covering 0 to 255
+#  of the filtered image; anything colder than the noise filter goes in bin 0
+HIST_SHIFT = 3
+HIST_BINS = 32
+## Confidence is the product of three scores, each from 0 to 1.  Contrast is
+#  how far the warmest PATCH_ROWS x PATCH_COLS patch stands above the mean of
+#  its rows, in filtered counts, and scores 0 at CONTRAST_LOW rising to 1 at
+#  CONTRAST_HIGH.  Every image is scaled to its own hottest pixel, so the
+#  hottest bin less the median says little, and the top rows and right edge
+#  are warm in every image, which levelling the rows takes out.  The blank
+#  and nothing images recorded come in at 10 to 34, people at 39 to 83
+PATCH_ROWS = 8
+PATCH_COLS = 3
+CONTRAST_LOW = 20
+CONTRAST_HIGH = 50
+## Area, the pixels above the threshold, scores 0 below AREA_MIN, 1 up to
+#  AREA_GOOD, falling to 0 at AREA_MAX; an empty image spreads its threshold
+#  over more of the image than a person covers (117 to 172 pixels against
+#  49 to 145 recorded), but not by enough to tell them apart, so AREA_GOOD
+#  is above both and the score only turns down a threshold spread all over
+AREA_MIN = 8
+AREA_GOOD = 200
+AREA_MAX = 400
+## Compactness, the area over that of a disk with the same spread (1 for a
+#  disk, near 0 for specks all over), scores 1 from COMPACT_GOOD up.  The
+#  people recorded score as low as the empty images (0.12 against 0.14),
+#  so COMPACT_GOOD is below both
+COMPACT_GOOD = 0.05
+## When a motion mask is given and at least this many pixels above the
+#  threshold moved, only those are taken to be the person
+MOTION_MIN = 4
+## The most targets find_targets() looks for.  A target after the first
+#  must cover at least SECOND_AREA of the first's area, score at least
+#  SECOND_CONFIDENCE of its confidence, with the contrast taken in its own
+#  window, and be MIN_SEPARATION degrees from every target before it
+MAX_TARGETS = 3
+SECOND_AREA = 0.7
+SECOND_CONFIDENCE = 0.5
+MIN_SEPARATION = 10
+## Below this confidence the image is taken to have nobody in it, which with
+#  the settings above is a contrast of 37.25.  These are the settings
+#    python -m host.vision_sweep --patch-rows 8 --patch-cols 3 --area-good 200
+#        --area-max 400 --compact-good 0.05 --cross-validate
+#  picks: every empty image is at least 10% below the cut and the people
+#  are 3.8% above it.  With the area and compactness scores turned down and
+#  the patch size fixed, holding each recorded file out in turn and
+#  sweeping on the rest picks settings which call every image of the file
+#  held out right; fitting those as well, or the patch size, gets one of
+#  the files wrong every time.  Sweep again with new captures
+MIN_CONFIDENCE = 0.575
+## When more than one target is wanted, each is the centroid of the WINDOW
+#  pixel square around its own warmest patch, so the first isn't pulled
+#  toward the others; one target is the centroid of the whole image
+WINDOW = 20
+## The column and row of every pixel and their squares, for the spread of
+#  the pixels above the threshold, and the spread of a pixel's own square
+#  about its middle
+PIXEL_COLS = np.array([list(range(32))] * 24)
+PIXEL_ROWS = np.array([[r] * 32 for r in range(24)])
+PIXEL_COLS2 = PIXEL_COLS * PIXEL_COLS
+PIXEL_ROWS2 = PIXEL_ROWS * PIXEL_ROWS
+PIXEL_SPREAD = 2 / 12
+## The refinement stage upsamples the (2*REFINE_RADIUS+1) pixel square around
+#  the centroid REFINE_FACTOR times with bilinear interpolation
+REFINE_RADIUS = 3
+REFINE_FACTOR = 4
+REFINE_SIZE = 2 * REFINE_RADIUS + 1
+REFINE_FINE = REFINE_FACTOR * (REFINE_SIZE - 1) + 1
+## Histogram buffer, made once and filled in on every frame
+_hist = array("H", [0] * HIST_BINS)
+
+def _ramp(value, low, high):
+    """!
+    Scales a value to 0 at low and 1 at high, clipped to 0 to 1.
+    """
+    if value <= low:
+        return 0.0
+    if value >= high:
+        return 1.0
+    return (value - low) / (high - low)
+
+def _bilinear_kernel():
+    """!
+    Makes the matrix which upsamples REFINE_SIZE samples to REFINE_FINE by
+    bilinear interpolation, so a square patch P is upsampled by K P K^T.
+    """
+    kernel = np.zeros((REFINE_FINE, REFINE_SIZE))
+    for i in range(REFINE_FINE):
+        j = i // REFINE_FACTOR
+        frac = (i - j * REFINE_FACTOR) / REFINE_FACTOR
+        kernel[i, j] = 1.0 - frac
+        if frac:
+            kernel[i, j + 1] = frac
+    return kernel
+
+## The upsampling matrix and its transpose, and the position of every fine
+#  sample in pixels from the corner of the patch
+REFINE_KERNEL = _bilinear_kernel()
+REFINE_KERNEL_T = REFINE_KERNEL.transpose()
+REFINE_COLS = np.array([np.linspace(0, REFINE_SIZE - 1, REFINE_FINE)] * REFINE_FINE)
+REFINE_ROWS = REFINE_COLS.transpose()
+
+def _nearest(angles, value):
+    """!
+    Finds the entry of an angle table nearest an angle.
+    @returns its index
+    """
+    best = 0
+    for i in range(1, len(angles)):
+        if abs(angles[i] - value) < abs(angles[best] - value):
+            best = i
+    return best
+
+def _interpolate(angles, index):
+    """!
+    Interpolates an angle table at a fractional index.
+    @returns the angle
+    """
+    i = min(int(index), len(angles) - 2)
+    return angles[i] + (index - i) * (angles[i + 1] - angles[i])
+
+def refine_centroid(boy_temp, X_temp, Y_temp, threshold):
+    """!
+    This function sharpens the centroid by upsampling only the pixels around
+    it.  The square of REFINE_SIZE pixels nearest the centroid is upsampled
+    with the precomputed bilinear kernel and the centroid is taken again over
+    the fine samples, each weighted by how far it is above the threshold.
+    The plain centroid counts a pixel as all in or all out of the blob, so
+    its edges jump a whole pixel at a time and arms and hands pull it off the
+    body; here the weights fall smoothly to nothing at the edge of the blob
+    and only the middle of the blob counts.
+    @param boy_temp: the filtered image
+    @param X_temp: the X angle of the centroid
+    @param Y_temp: the Y angle of the centroid
+    @param threshold: the threshold the blob was found with
+    @returns the refined X and Y angles
+    """
+    # the patch's corner, kept inside the image
+    row = _nearest(ROW_ANGLES, Y_temp) - REFINE_RADIUS
+    col = _nearest(COL_ANGLES, X_temp) - REFINE_RADIUS
+    row = min(max(row, 0), 24 - REFINE_SIZE)
+    col = min(max(col, 0), 32 - REFINE_SIZE)
+    patch = np.array(boy_temp[row:row + REFINE_SIZE, col:col + REFINE_SIZE], dtype=np.float)
+    fine = np.dot(np.dot(REFINE_KERNEL, patch), REFINE_KERNEL_T) - threshold
+    fine = fine * (fine > 0)
+    total = np.sum(fine)
+    if total <= 0:
+        return X_temp, Y_temp
+    fine_col = col + np.sum(fine * REFINE_COLS) / total
+    fine_row = row + np.sum(fine * REFINE_ROWS) / total
+    return _interpolate(COL_ANGLES, fine_col), _interpolate(ROW_ANGLES, fine_row)
+
+def _patch_sums(boy_temp):
+    """!
+    Finds how far each patch of the filtered image stands above the rest of
+    its rows.  Each row has its mean taken off, then the patches are summed
+    with PATCH_ROWS shifted slices down the image and PATCH_COLS across it,
+    all whole array operations.
+    @returns the sum of each patch, by the row and column of its corner, in
+             filtered counts
+    """
+    level = boy_temp - np.mean(boy_temp, axis=1).reshape((24, 1))
+    rows = 24 - PATCH_ROWS + 1
+    down = level[0:rows, :]
+    for r in range(1, PATCH_ROWS):
+        down = down + level[r:r + rows, :]
+    cols = 32 - PATCH_COLS + 1
+    patch = down[:, 0:cols]
+    for c in range(1, PATCH_COLS):
+        patch = patch + down[:, c:c + cols]
+    return patch
+
+def _histogram(boy_temp):
+    """!
+    Histograms the filtered image into _hist in one pass: the pixels are
+    sorted once, and each bin edge is found by bisecting the sorted pixels
+    from the edge before it, so no Python loop runs over the pixels and no
+    array is made per bin.
+    @returns the median and hottest bins
+    """
+    hist = _hist
+    values = boy_temp.flatten()
+    values.sort()
+    below = 0
+    for b in range(1, HIST_BINS):
+        edge = b << HIST_SHIFT
+        # the first pixel at or above the edge
+        lo = below
+        hi = IMAGE_PIXELS
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if values[mid] < edge:
+                lo = mid + 1
+            else:
+                hi = mid
+        hist[b - 1] = lo - below
+        below = lo
+    hist[HIST_BINS - 1] = IMAGE_PIXELS - below
+    count = 0
+    median = 0
+    while count + hist[median] < IMAGE_PIXELS // 2:
+        count += hist[median]
+        median += 1
+    top = HIST_BINS - 1
+    while hist[top] == 0:
+        top -= 1
+    return median, top
+
+def _otsu_split(median, top):
+    """!
+    Finds Otsu's threshold over the bins of _hist from the median up: the
+    split which makes the two classes' means furthest apart for their sizes.
+    @returns the split, which is the hottest bin of the background, and
+             the number of pixels above it
+    """
+    hist = _hist
+    total = 0
+    total_sum = 0
+    for b in range(median, HIST_BINS):
+        total += hist[b]
+        total_sum += b * hist[b]
+    back = 0
+    back_sum = 0
+    best = -1
+    split = median
+    for b in range(median, top):
+        back += hist[b]
+        back_sum += b * hist[b]
+        front = total - back
+        diff = back_sum / back - (total_sum - back_sum) / front
+        var = back * front * diff * diff
+        if var > best:
+            best = var
+            split = b
+    # the area above the threshold is what is left of the histogram
+    area = 0
+    for b in range(split + 1, HIST_BINS):
+        area += hist[b]
+    return split, area
+
+def _patch_window(patches, best):
+    """!
+    Finds the WINDOW pixel square centered on a patch, moved in from the
+    edges so it is always the same size.
+    @param patches: the patch sums from _patch_sums()
+    @param best: the patch, as an index into the flattened patch sums
+    @returns the first row and column of the window in pixels
+    """
+    width = patches.shape[1]
+    row = best // width + PATCH_ROWS // 2 - WINDOW // 2
+    col = best % width + PATCH_COLS // 2 - WINDOW // 2
+    return min(max(row, 0), 24 - WINDOW), min(max(col, 0), 32 - WINDOW)
+
+def _compactness(mask, area, row=0, col=0, height=24, width=32):
+    """!
+    Scores the pixels set in a window of a mask on how compact they are: the
+    area over that of a disk with the same spread.
+    @param mask: a 24 x 32 mask, such as the pixels above the threshold
+    @param area: the pixels set in the window
+    @returns the score, 0 to 1
+    """
+    window = mask[row:row + height, col:col + width]
+    mean_x = np.sum(window * PIXEL_COLS[row:row + height, col:col + width]) / area
+    mean_y = np.sum(window * PIXEL_ROWS[row:row + height, col:col + width]) / area
+    spread = (np.sum(window * PIXEL_COLS2[row:row + height, col:col + width]) / area - mean_x * mean_x
+              + np.sum(window * PIXEL_ROWS2[row:row + height, col:col + width]) / area - mean_y * mean_y
+              + PIXEL_SPREAD)
+    return _ramp(area / (2 * 3.14159265 * spread), 0, COMPACT_GOOD)
+
+def cam2setpoint(im, min_confidence=MIN_CONFIDENCE, refine=False, motion=None):
     """! 
     This class implements the cam for use with our turret.
     It does some computer vision stuff to calculate the location of a
     person in front of the camera with respect to the field of view
-    of the camera.
+    of the camera.  The person is told from the background with a threshold
+    worked out for each image from a histogram of the filtered image: Otsu's
+    method splits the warmer half of the histogram into background and
+    person.  How sure it is that there is a person is scored from the
+    contrast of the warmest patch, the area above the threshold and how
+    compact that area is.  The contrast is scored first, so most empty
+    images are turned away before the histogram is made.  If a motion mask
+    is given, warm pixels which moved are taken over warm pixels which
+    didn't.
     @param im: complete thermal image read from camera
+    @param min_confidence: the least confidence to return a target for
+    @param refine: sharpen the centroid with refine_centroid()
+    @param motion: the pixels which moved since the last image, from
+        MotionDetector.update(), or None
     @returns X_temp, the angle to aim at in the X direction
     @returns Y_temp, the angle to aim at in the Y direction
+    @returns confidence, from 0 to 1, that there is a person there
+    @returns None instead if the confidence is below min_confidence
+    """
+    targets = find_targets(im, 1, min_confidence, refine, motion)
+    # Return the two angles of the camera where the person is in the Field of view
+    return targets[0] if targets else None
+
+def find_targets(im, max_targets=MAX_TARGETS, min_confidence=MIN_CONFIDENCE, refine=False, motion=None):
+    """!
+    This function finds every person in the image, for engaging more than
+    one target.  The image is scored the same way as in cam2setpoint(), and
+    with one target wanted it is the centroid of the whole image, as in
+    cam2setpoint().  With more, the first target is the centroid of the
+    window around the warmest patch.  Then the patches overlapping its
+    window are cleared, the warmest patch left is taken with the window
+    around it as the next target, and so on until max_targets are found or
+    no patch left is warm enough.  Each later target has its contrast
+    taken from its own patch and its area and compactness scored on its own
+    window, has to cover at least SECOND_AREA of the first target's area,
+    score at least SECOND_CONFIDENCE of its confidence, and be
+    MIN_SEPARATION degrees from every target before it, so the arm or the
+    warm chair next to someone isn't taken for another person.
+    @param im: complete thermal image read from camera
+    @param max_targets: the most targets to return
+    @param min_confidence: the least confidence to return a target for
+    @param refine: sharpen the centroids with refine_centroid()
+    @param motion: the pixels which moved since the last image, from
+        MotionDetector.update(), or None
+    @returns a list of (X angle, Y angle, confidence) tuples, busiest first,
+             empty if nobody is found
     """
-    #filtering the noise, setting datum for imaging
-    noisefilt = np.array([[0,85,49,85,48,85,55,85,48,85,70,85,61,85,72,85,69,85,85,85,74,85,85,85,85,85,85,85,85,85,85,85],
-                            [0,77,32,85,29,74,36,85,46,82,43,85,53,85,52,85,65,85,59,85,66,75,68,85,78,85,67,85,84,85,79,85],
-                            [0,85,18,85,21,85,40,85,25,85,58,85,50,85,66,85,54,85,71,85,60,85,85,85,69,85,84,85,78,85,85,85],
-                            [0,74,26,85,35,80,43,85,49,81,43,85,59,85,57,85,61,85,64,85,73,85,63,85,85,85,75,85,84,85,79,85],
-                            [0,85,45,85,39,85,61,85,51,85,75,85,55,85,85,85,66,85,85,85,77,85,85,85,80,85,85,85,85,85,85,85],
-                            [0,83,23,85,43,85,41,85,46,85,55,85,67,85,62,85,62,85,72,85,79,85,75,85,81,85,83,85,85,85,78,85],
-                            [0,85,41,85,34,85,54,85,35,85,62,85,48,85,66,85,63,85,79,85,66,85,79,85,75,85,85,85,85,85,85,85],
-                            [0,57,9,85,30,61,30,85,31,80,39,85,43,66,36,85,56,75,54,85,54,78,54,85,65,84,61,85,76,75,60,85],
-                            [0,85,47,85,38,85,58,85,49,85,69,85,51,85,67,85,67,85,84,85,77,85,85,85,85,85,85,85,85,85,85,85],
-                            [0,70,24,85,34,73,37,85,49,71,42,85,54,69,47,85,67,81,59,85,72,85,70,85,71,79,69,85,81,78,80,85],
-                            [0,85,50,85,30,85,64,85,52,85,80,85,57,85,79,85,68,85,85,85,78,85,85,85,85,85,85,85,85,85,85,85],
-                            [0,81,25,85,36,77,43,85,57,85,50,85,62,79,65,85,67,85,65,85,67,85,64,85,79,82,82,85,85,85,74,85],
-                            [0,85,34,85,32,85,57,85,42,85,68,85,54,85,75,85,64,85,85,85,74,85,85,85,85,85,85,85,85,85,85,85],
-                            [0,74,26,85,34,72,29,85,48,71,40,85,48,69,57,85,58,62,57,85,64,78,56,85,69,73,58,85,75,71,72,85],
-                            [0,85,41,85,33,85,58,85,47,85,73,85,51,85,70,85,58,85,82,85,72,85,85,85,84,85,85,85,85,85,85,85],
-                            [0,64,16,85,37,65,39,85,34,61,36,85,44,67,50,85,49,70,45,85,57,67,51,85,71,74,54,85,71,64,62,85],
-                            [0,85,39,85,35,85,59,85,46,85,65,85,61,85,71,85,56,85,85,85,80,85,85,85,77,85,85,85,85,85,85,85],
-                            [0,65,27,85,32,65,28,85,41,59,36,85,49,58,49,85,43,68,50,85,55,69,55,85,53,56,62,85,74,61,66,85],
-                            [0,85,42,85,41,85,54,85,40,85,62,85,49,85,68,85,53,85,80,85,67,85,85,85,74,85,85,85,85,85,85,85],
-                            [0,51,12,78,39,42,25,85,38,41,30,85,40,56,27,85,36,47,45,85,44,48,41,85,63,52,55,85,59,52,56,66],
-                            [0,85,50,85,43,85,69,85,33,85,73,85,54,85,73,85,57,85,77,85,72,85,85,85,75,85,85,85,78,85,85,85],
-                            [0,55,33,85,38,57,33,85,40,56,38,85,43,47,42,85,54,65,47,85,57,56,44,85,55,53,54,85,65,42,62,79],
-                            [0,68,35,73,9,70,35,85,27,85,51,85,38,85,45,85,36,80,57,85,36,80,69,85,46,85,60,85,60,85,85,84],
-                            [0,56,12,62,16,36,28,81,28,42,28,76,45,43,33,85,26,35,31,74,27,31,30,66,42,36,40,61,54,24,44,54]])
-    # Hardcoded X-Y planes to map camera pixels to camera angles
-    X_plane = np.array([np.linspace(-27.5, 27.5, 32)] * 24)
-    Y_plane = np.array([np.linspace(17.5, -17.5, 24)] * 32).T
+    targets = []
     # Subtract out noise
-    boy_temp = im-noisefilt
-    # normalize the filtered image
-    boy_temp = boy_temp / np.max(boy_temp) * 255
+    boy_temp = im-NOISE_FILTER
+    # Nothing stands out from the background, so don't move.  The other
+    # scores can only take the confidence down, so this is the same as
+    # scoring it all, only sooner
+    patches = _patch_sums(boy_temp)
+    contrast = _ramp(np.max(patches) / (PATCH_ROWS * PATCH_COLS), CONTRAST_LOW, CONTRAST_HIGH)
+    if contrast < min_confidence:
+        return targets
+    median, top = _histogram(boy_temp)
+    split, area = _otsu_split(median, top)
+    if area < AREA_MIN:
+        return targets
+    confidence = contrast * (1.0 - _ramp(area, AREA_GOOD, AREA_MAX))
+    if confidence < min_confidence:
+        return targets
     # Threshold the image to create a binary image of only the pixels corresponding to a person
-    binboy_temp = boy_temp > 255/2
+    threshold = (split + 1) << HIST_SHIFT
+    binboy_temp = boy_temp >= threshold
+    # A person moving shows up in the motion mask, so if enough of the warm
+    # pixels moved, leave out the warm things that are standing still
+    if motion is not None:
+        moving = binboy_temp * motion
+        moved = np.sum(moving)
+        if moved >= MOTION_MIN:
+            binboy_temp = moving
+            area = moved
+    confidence = confidence * _compactness(binboy_temp, area)
+    if confidence < min_confidence:
+        return targets
     # Heat centroid calc for finding center of the person
-    ROI_temp = boy_temp * binboy_temp
+    if max_targets == 1:
+        targets.append(_window_centroid(boy_temp, binboy_temp, 0, 0, threshold, refine, 24, 32)
+                       + (confidence,))
+        return targets
+    # Looking for more than one person, each is the centroid of their own
+    # window, or the first would be pulled toward the others
+    patches = patches / (PATCH_ROWS * PATCH_COLS)
+    best = int(np.argmax(patches))
+    row, col = _patch_window(patches, best)
+    first_area = np.sum(binboy_temp[row:row + WINDOW, col:col + WINDOW])
+    if first_area == 0:
+        # what moved is away from the warmest patch, so aim at all of it
+        targets.append(_window_centroid(boy_temp, binboy_temp, 0, 0, threshold, refine, 24, 32)
+                       + (confidence,))
+        return targets
+    targets.append(_window_centroid(boy_temp, binboy_temp, row, col, threshold, refine)
+                   + (confidence,))
+    least_confidence = max(min_confidence, SECOND_CONFIDENCE * confidence)
+    while len(targets) < max_targets:
+        # a later window overlapping this one mustn't count its pixels again,
+        # nor its patches be taken for another person
+        binboy_temp[row:row + WINDOW, col:col + WINDOW] = 0
+        patches[max(row - PATCH_ROWS + 1, 0):row + WINDOW, max(col - PATCH_COLS + 1, 0):col + WINDOW] = 0
+        best = int(np.argmax(patches))
+        width = patches.shape[1]
+        # the contrast only takes the confidence down, so once the warmest
+        # patch left is too cold nothing after it will do
+        contrast = _ramp(patches[best // width, best % width], CONTRAST_LOW, CONTRAST_HIGH)
+        if contrast < least_confidence:
+            break
+        row, col = _patch_window(patches, best)
+        area = np.sum(binboy_temp[row:row + WINDOW, col:col + WINDOW])
+        if area >= SECOND_AREA * first_area:
+            # the contrast of the patch, not of the whole image, so warm
+            # noise next to the first person doesn't borrow theirs
+            confidence = (contrast * (1.0 - _ramp(area, AREA_GOOD, AREA_MAX))
+                          * _compactness(binboy_temp, area, row, col, WINDOW, WINDOW))
+            if confidence >= least_confidence:
+                X_temp, Y_temp = _window_centroid(boy_temp, binboy_temp, row, col, threshold, refine)
+                if _separated(targets, X_temp, Y_temp):
+                    targets.append((X_temp, Y_temp, confidence))
+    return targets
+
+def _window_centroid(boy_temp, binboy_temp, row, col, threshold, refine, height=WINDOW, width=WINDOW):
+    """!
+    Finds the heat centroid of the pixels above the threshold in the window
+    starting at a row and column in pixels, by default WINDOW square.
+    @returns the X and Y angles
+    """
+    ROI_temp = boy_temp[row:row + height, col:col + width] * binboy_temp[row:row + height, col:col + width]
     ROIsum_temp = np.sum(ROI_temp)
-    X_temp = np.sum(ROI_temp * X_plane) / ROIsum_temp
-    Y_temp = np.sum(ROI_temp * Y_plane) / ROIsum_temp
-    # Return the two angles of the camera where the person is in the Field of view
+    X_temp = np.sum(ROI_temp * X_PLANE[row:row + height, col:col + width]) / ROIsum_temp
+    Y_temp = np.sum(ROI_temp * Y_PLANE[row:row + height, col:col + width]) / ROIsum_temp
+    if refine:
+        X_temp, Y_temp = refine_centroid(boy_temp, X_temp, Y_temp, threshold)
     return X_temp, Y_temp
+
+def _separated(targets, X_temp, Y_temp):
+    """!
+    Tells whether a target is at least MIN_SEPARATION degrees from every
+    target already found.
+    """
+    for X_other, Y_other, confidence in targets:
+        if (X_temp - X_other) ** 2 + (Y_temp - Y_other) ** 2 < MIN_SEPARATION * MIN_SEPARATION:
+            return False
+    return True
+
 if __name__=="__main__":
     noisefilt = np.array([[64,157,82,136,82,133,85,144,72,139,82,131,72,141,95,133,85,136,103,139,92,144,110,146,110,151,123,144,121,162,139,159],
                             [66,100,79,113,79,90,69,128,77,87,69,108,74,92,72,105,87,92,79,108,79,92,90,123,103,97,105,128,118,115,113,136],
@@ -85,7 +526,7 @@ if __name__=="__main__":
                             [46,118,72,110,64,123,82,118,54,108,72,118,61,108,103,139,82,121,97,139,103,139,105,126,87,110,103,121,87,113,108,105],
                             [28,59,38,66,48,48,36,72,36,36,30,61,33,43,48,97,66,61,66,82,66,61,51,69,54,38,48,69,48,41,56,59],
                             [54,113,77,100,56,103,77,108,64,108,77,105,59,115,92,136,72,128,103,123,79,118,103,118,82,108,95,110,100,110,110,113],
-                            [0,25,0,30,12,12,2,33,12,15,7,33,18,20,20,54,25,25,28,48,25,23,12,43,33,12,5,30,30,12,28,28]])
+                            [0,25,0,30,12,12,2,33,12,15,7,33,18,20,20,54,25,25,28,48,25,23,12,43,33,12,5,30,30,12,28,28]], dtype=np.uint8)
     starttime = utime.ticks_us()
     cam2setpoint(noisefilt)
     totaltime = utime.ticks_diff(utime.ticks_us(), starttime)
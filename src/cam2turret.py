@@ -0,0 +1,99 @@
+"""!
+@file cam2turret.py
+    This file converts the camera angles cam2setpoint() finds into the yaw
+    and pitch motor setpoints that aim the turret at the target.  The
+    mapping is a low order polynomial in both camera angles, fitted on a PC
+    by host/fit_mapping.py from pairs of camera angles and the setpoints that
+    hit the target, and kept next to this file in MAP_FILE.  Without the file
+    the hand tuned mapping, 16*yaw + 11.5 and pitch/2 + 2, is used.
+
+    Each polynomial is kept in Horner form, so it is worked out with one
+    multiply and one add per coefficient and no powers:
+    P(x, y) = (...(R_d(y)*x + R_d-1(y))*x + ...)*x + R_0(y), where R_i(y) is
+    the polynomial in y multiplying x^i, itself worked out in Horner form.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+import struct
+
+## File holding the fitted mapping.  It starts with MAP_MAGIC and the degree
+#  and number of coefficients per axis as two uint16s, then holds the yaw
+#  coefficients then the pitch coefficients as little endian float32s, in
+#  Horner order: for i from the degree down to 0, the coefficients of
+#  x^i*y^j for j from the degree - i down to 0
+MAP_FILE = "cam2turret.bin"
+MAP_MAGIC = b"MLXP"
+## The hand tuned mapping, 16*x + 11.5 and y/2 + 2, in Horner rows
+HAND_YAW = ((16.0,), (0.0, 11.5))
+HAND_PITCH = ((0.0,), (0.5, 2.0))
+
+def horner_rows(coefficients, degree):
+    """!
+    This function splits a flat list of coefficients in Horner order into
+    the rows horner() works through.
+    @param coefficients - the (degree + 1)*(degree + 2)/2 coefficients
+    @param degree - the degree of the polynomial
+    @returns a tuple of degree + 1 tuples, the first holding one coefficient
+             and the last degree + 1
+    """
+    rows = []
+    start = 0
+    for i in range(degree, -1, -1):
+        rows.append(tuple(coefficients[start:start + degree - i + 1]))
+        start += degree - i + 1
+    return tuple(rows)
+
+def load_mapping(filename=None):
+    """!
+    This function loads the fitted mapping.
+    @param filename - the mapping file, by default MAP_FILE next to this file
+    @returns the yaw and pitch polynomials as Horner rows, the hand tuned
+             ones if there is no file
+    """
+    if filename is None:
+        try:
+            filename = __file__[:__file__.rfind("/") + 1] + MAP_FILE
+        except NameError:
+            # frozen into the firmware, so look in the current directory
+            filename = MAP_FILE
+    try:
+        with open(filename, "rb") as file:
+            data = file.read()
+    except OSError:
+        return HAND_YAW, HAND_PITCH
+    magic, degree, count = struct.unpack_from("<4sHH", data, 0)
+    if magic != MAP_MAGIC or count != (degree + 1) * (degree + 2) // 2:
+        raise ValueError(f"{filename} is not a camera to turret mapping")
+    coefficients = struct.unpack_from("<" + "f" * (2 * count), data, 8)
+    return horner_rows(coefficients[:count], degree), horner_rows(coefficients[count:], degree)
+
+## The yaw and pitch polynomials, loaded once when the module is imported
+YAW_ROWS, PITCH_ROWS = load_mapping()
+
+def horner(rows, x, y):
+    """!
+    This function works out a polynomial in x and y kept as Horner rows.
+    @param rows - the rows, as horner_rows() makes them
+    @param x - the camera X angle
+    @param y - the camera Y angle
+    @returns the polynomial's value
+    """
+    total = 0.0
+    for row in rows:
+        inner = 0.0
+        for c in row:
+            inner = inner * y + c
+        total = total * x + inner
+    return total
+
+def cam2turret(yaw_angle, pitch_angle):
+    """!
+    This function finds the motor setpoints that aim at a target.
+    @param yaw_angle - the target's camera X angle from cam2setpoint(), degrees
+    @param pitch_angle - the target's camera Y angle from cam2setpoint(), degrees
+    @returns the yaw and pitch motor setpoints
+    """
+    return (horner(YAW_ROWS, yaw_angle, pitch_angle),
+            horner(PITCH_ROWS, yaw_angle, pitch_angle))
@@ -0,0 +1,11 @@
+"""!
+@file conftest.py
+    Makes pytest run the turret modules on the PC by installing the
+    MicroPython stand-ins from host/shims before any test is collected.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-20
+"""
+import host
+host.install()
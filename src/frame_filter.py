@@ -0,0 +1,137 @@
+"""!
+@file frame_filter.py
+    This file contains a temporal filter for the camera images.  Each image
+    the camera gives is read out as two half frames, and every pixel carries
+    a few counts of noise, which makes the centroid jitter from one image to
+    the next.  The filter keeps an exponential moving average of every pixel
+    and hands that to cam2setpoint() instead of the raw image.  Pixels which
+    change by more than a threshold between images, such as where someone
+    has just moved, follow the new image with a faster alpha so the target
+    doesn't smear or lag behind.
+
+    It also contains a motion detector, which differences each raw image
+    with the last one, for cam2setpoint() to tell a moving person from warm
+    things standing still.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+from ulab import numpy as np
+
+class FrameFilter:
+    """!
+    This class implements a per-pixel exponential moving average of the
+    camera images.  The average is kept in one float array made when the
+    filter is made and updated in place.  ulab has no int32 type, so a
+    float32 array on the board is what stands in for an int32 fixed point
+    accumulator; it takes the same 3 kB.  The difference, the alpha of each
+    pixel and the uint8 image handed back have buffers of their own made
+    with it too, so an update works in place and allocates no image sized
+    arrays but the mask of pixels that moved.
+    """
+
+    def __init__(self, alpha=0.5, motion_alpha=1.0, motion_threshold=32, rows=24, cols=32):
+        """!
+        Creates a filter.
+        @param alpha - how much of each new image goes into the average,
+                       from 0 (none) to 1 (no filtering)
+        @param motion_alpha - the alpha used for pixels that changed by more
+                              than motion_threshold
+        @param motion_threshold - the change in counts taken to be motion
+                                  rather than noise; None or 0 to always use
+                                  alpha
+        @param rows - the number of rows in an image
+        @param cols - the number of columns in an image
+        """
+        self.alpha = alpha
+        self.motion_alpha = motion_alpha
+        self.motion_threshold = motion_threshold
+        ## The average of every pixel
+        self.average = np.zeros((rows, cols))
+        self._diff = np.zeros((rows, cols))
+        self._gain = np.zeros((rows, cols))
+        self._out = np.zeros((rows, cols), dtype=np.uint8)
+        self._primed = False
+
+    def reset(self):
+        """!
+        Forgets the average, so the next image is taken as it is, such as
+        after the turret has turned and the whole scene has moved.
+        """
+        self._primed = False
+
+    def update(self, im):
+        """!
+        This method adds an image to the average.
+        @param im - the image as MLX_Cam.get_array() returns it
+        @returns the filtered image as a uint8 array, for cam2setpoint(); it
+                 is the filter's own buffer, so the next update changes it
+        """
+        diff = self._diff
+        diff[:, :] = im
+        diff -= self.average
+        if not self._primed:
+            # the first image is taken as it is
+            self._primed = True
+        elif self.motion_threshold:
+            # squared in the gain buffer to find the pixels that moved, so
+            # abs() doesn't make a float copy of the image
+            gain = self._gain
+            gain[:, :] = diff
+            gain *= diff
+            gain[:, :] = gain > self.motion_threshold * self.motion_threshold
+            gain *= self.motion_alpha - self.alpha
+            gain += self.alpha
+            diff *= gain
+        else:
+            diff *= self.alpha
+        self.average += diff
+        # rounded to the nearest count, as the pixels are never negative
+        diff[:, :] = self.average
+        diff += 0.5
+        self._out[:, :] = diff
+        return self._out
+
+class MotionDetector:
+    """!
+    This class implements a motion channel for the camera images: which
+    pixels changed by more than a threshold since the last image.  Someone
+    who moves shows up in it the first image after they move, and warm
+    things which don't move, such as a radiator or a laptop, never do.  The
+    last image is kept in one int16 array made when the detector is made.
+    """
+
+    def __init__(self, threshold=40, rows=24, cols=32):
+        """!
+        Creates a motion detector.
+        @param threshold - the change in counts between images taken to be
+                           motion rather than noise
+        @param rows - the number of rows in an image
+        @param cols - the number of columns in an image
+        """
+        self.threshold = threshold
+        ## The last image
+        self.previous = np.zeros((rows, cols), dtype=np.int16)
+        self._primed = False
+
+    def reset(self):
+        """!
+        Forgets the last image, such as after the turret has turned and
+        every pixel has changed.
+        """
+        self._primed = False
+
+    def update(self, im):
+        """!
+        This method compares an image with the last one and keeps it.
+        @param im - the raw image as MLX_Cam.get_array() returns it
+        @returns an array with 1 where the pixel moved and 0 where it didn't,
+                 or None for the first image as there's nothing to compare
+        """
+        moved = None
+        if self._primed:
+            moved = abs(im - self.previous) > self.threshold
+        self.previous[:, :] = im
+        self._primed = True
+        return moved
@@ -0,0 +1,60 @@
+"""!
+@file host/__init__.py
+    This package contains the host-side (CPython) tools for the turret.  None of
+    it is copied to the board.  The shims subdirectory holds stand-ins for the
+    MicroPython-only modules the turret code imports, so that the motor drivers,
+    controller, camera driver and main program can be run against simulated
+    hardware on a PC.  Run a board script on the PC with host/run.py.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-20
+"""
+import builtins
+import gc
+import os
+import sys
+import tracemalloc
+
+## Directory holding the MicroPython stand-in modules
+SHIM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shims")
+## Directory holding the turret source (what gets copied to the board)
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+## Directory the host tools keep their caches, baselines and reference runs
+#  in, this one, so they are never copied to the board with the source
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+## Heap size reported by gc.mem_alloc() + gc.mem_free(), that of the STM32L476
+HEAP_SIZE = 96*1024
+
+def _mem_alloc():
+    # only known when tracemalloc is running, otherwise nothing is counted
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+def _mem_free():
+    return max(HEAP_SIZE - _mem_alloc(), 0)
+
+def _threshold(amount=None):
+    if amount is None:
+        return -1
+
+def install():
+    """!
+    Puts the MicroPython stand-in modules and the turret source on the import
+    path.  Call this before importing any of the turret modules on a PC.
+    """
+    for path in (SRC_DIR, SHIM_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    # the MicroPython compiler makes const() a builtin, and the mlx90640
+    # driver uses it without importing it
+    if not hasattr(builtins, "const"):
+        from micropython import const
+        builtins.const = const
+    # gc is a real module on both, but only MicroPython reports heap use
+    if not hasattr(gc, "mem_free"):
+        gc.mem_alloc = _mem_alloc
+        gc.mem_free = _mem_free
+        gc.threshold = _threshold
@@ -0,0 +1,149 @@
+"""!
+@file calibrate_angles.py
+    This file makes the pixel angle table cam2setpoint.py loads from
+    cam_angles.bin.  Without a table cam2setpoint.py spreads the angles evenly
+    over the nominal 55 by 35 degree field of view, which ignores the lens
+    distortion of the MLX90640 and any offset between where the camera and
+    the turret point.
+
+    The calibration images are taken like any other with mlx_cam.py, but of a
+    small hot target (a mug of hot water works) at known angles:
+    -# Set the turret at its zero position, facing the target area, and put
+       the target in front of it, far enough away that the distance between
+       the camera and the barrel doesn't matter.
+    -# Capture an image and label it with the angles the turret has to turn
+       through to aim at the target, in degrees and in the same sense as
+       cam2setpoint() gives them, such as "cal yaw=-12.5 pitch=4" (jog the
+       turret onto the target and read the encoders, or measure them).
+    -# Repeat with the target spread over the whole field of view, at least
+       a dozen places, edges included.
+    -# Fit the table and copy cam_angles.bin to the board next to
+       cam2setpoint.py:
+    @code
+    python -m host.calibrate_angles cal_ims.txt --out cam_angles.bin
+    @endcode
+    The target is found in each image to a fraction of a pixel, then a
+    polynomial in the column is fitted to the yaw angles and one in the row
+    to the pitch angles, and evaluated at every column and row.  A table of
+    the nominal angles can be written with --nominal.
+
+    The table holds one angle per column and one per row, which takes up the
+    distortion along each axis and the offset between camera and turret;
+    the camera being rolled relative to the turret is not taken up.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-22
+"""
+import re
+import struct
+import numpy
+import host
+host.install()
+
+from cam2setpoint import NOISE_FILTER, ANGLE_MAGIC
+from host.mlx_device import iter_frames, NUM_ROWS, NUM_COLS
+
+## The nominal column and row angles cam2setpoint.py uses without a table
+NOMINAL_COLS = numpy.linspace(-27.5, 27.5, NUM_COLS)
+NOMINAL_ROWS = numpy.linspace(17.5, -17.5, NUM_ROWS)
+## Finds the angles in a calibration image's label
+LABEL_PATTERN = re.compile(r"yaw\s*=\s*(-?[\d.]+).*pitch\s*=\s*(-?[\d.]+)")
+
+
+def read_points(filenames):
+    """!
+    This function reads the calibration images and finds the target in each.
+    Images whose labels don't give angles are skipped.
+    @param filenames - recorded image files
+    @returns a list of (col, row, yaw, pitch, label) tuples, col and row being
+             where the target is in pixels
+    """
+    points = []
+    for filename in filenames:
+        for label, frame in iter_frames(filename):
+            match = LABEL_PATTERN.search(label)
+            if match:
+                col, row = spot_position(frame)
+                points.append((col, row, float(match.group(1)), float(match.group(2)), label))
+    return points
+
+
+def spot_position(frame):
+    """!
+    This function finds a small hot target in an image to a fraction of a
+    pixel, as the centroid of how far each pixel is above halfway between
+    the median and the hottest pixel.
+    @param frame - 24 rows of 32 values, as MLX_Cam.get_array() gives them
+    @returns the (col, row) of the target in pixels
+    """
+    boy = numpy.asarray(frame, dtype=float) - numpy.asarray(NOISE_FILTER, dtype=float)
+    level = (boy.max() + numpy.median(boy))/2
+    weight = numpy.clip(boy - level, 0, None)
+    rows, cols = numpy.indices(weight.shape)
+    return (weight*cols).sum()/weight.sum(), (weight*rows).sum()/weight.sum()
+
+
+def fit(points, degree=3):
+    """!
+    This function fits the angle table to the calibration points.
+    @param points - the points from read_points()
+    @param degree - the degree of the polynomials in column and row
+    @returns arrays of the 32 column angles and 24 row angles
+    """
+    cols, rows, yaws, pitches = (numpy.array([p[n] for p in points]) for n in range(4))
+    if len(points) <= degree:
+        raise ValueError(f"{len(points)} points can't fit a degree {degree} polynomial")
+    yaw_fit = numpy.polynomial.Polynomial.fit(cols, yaws, degree)
+    pitch_fit = numpy.polynomial.Polynomial.fit(rows, pitches, degree)
+    return yaw_fit(numpy.arange(NUM_COLS)), pitch_fit(numpy.arange(NUM_ROWS))
+
+
+def table_error(points, col_angles, row_angles):
+    """!
+    This function measures how well a table gives the angles of the points.
+    @param points - the points from read_points()
+    @param col_angles - the 32 column angles
+    @param row_angles - the 24 row angles
+    @returns the RMS yaw and pitch errors in degrees
+    """
+    yaw = numpy.array([numpy.interp(p[0], numpy.arange(NUM_COLS), col_angles) - p[2] for p in points])
+    pitch = numpy.array([numpy.interp(p[1], numpy.arange(NUM_ROWS), row_angles) - p[3] for p in points])
+    return numpy.sqrt(numpy.mean(yaw**2)), numpy.sqrt(numpy.mean(pitch**2))
+
+
+def write_table(filename, col_angles, row_angles):
+    """!
+    This function writes an angle table in the format cam2setpoint.py loads.
+    @param filename - the file to write
+    @param col_angles - the 32 column angles
+    @param row_angles - the 24 row angles
+    """
+    with open(filename, "wb") as file:
+        file.write(struct.pack("<4sHH", ANGLE_MAGIC, NUM_COLS, NUM_ROWS))
+        file.write(struct.pack(f"<{NUM_COLS + NUM_ROWS}f", *col_angles, *row_angles))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Fit the pixel angle table for cam2setpoint.py")
+    parser.add_argument("files", nargs="*", help="calibration images labeled yaw=... pitch=...")
+    parser.add_argument("--degree", type=int, default=3, help="degree of the fitted polynomials")
+    parser.add_argument("--out", default="cam_angles.bin", help="table file to write")
+    parser.add_argument("--nominal", action="store_true", help="write the nominal table instead")
+    args = parser.parse_args()
+
+    if args.nominal:
+        write_table(args.out, NOMINAL_COLS, NOMINAL_ROWS)
+        print(f"wrote the nominal table to {args.out}")
+    else:
+        points = read_points(args.files)
+        col_angles, row_angles = fit(points, args.degree)
+        for col, row, yaw, pitch, label in points:
+            print(f"{label:32s} target at col {col:5.2f} row {row:5.2f}")
+        before = table_error(points, NOMINAL_COLS, NOMINAL_ROWS)
+        after = table_error(points, col_angles, row_angles)
+        print(f"{len(points)} points, RMS error yaw {before[0]:.2f} -> {after[0]:.2f} deg, "
+              f"pitch {before[1]:.2f} -> {after[1]:.2f} deg")
+        write_table(args.out, col_angles, row_angles)
+        print(f"wrote {args.out}")
@@ -0,0 +1,270 @@
+"""!
+@file corpus.py
+    This file contains a store for recorded camera images which is read
+    without parsing.  The text files written by mlx_cam.py (test_ims.txt and
+    the like) are converted once into two files: a .bin file holding every
+    image back to back as 24 x 32 little endian int16 values, in the same
+    (mirrored) orientation as in the text files, and a .idx file holding the
+    byte offset, label and source file of each image.  The .bin file is
+    memory mapped, so any image, run of images or labeled subset is a numpy
+    slice, and new images are appended to the end of both files, so a reader
+    can stream them as they are captured.
+
+    Build a store from the recorded files, then list and read it:
+    @code
+    python -m host.corpus build frames test_ims.txt new_test_ims.txt test_ims_light.txt blank_ims.txt
+    python -m host.corpus list frames "jojo*"
+    @endcode
+    @code
+    from host.corpus import FrameCorpus
+    corpus = FrameCorpus("frames")
+    blanks = corpus.subset("blank*", "nothing*")     # an (N, 24, 32) array
+    for label, frame in corpus.stream(follow=True):  # waits for new images
+        ...
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-22
+"""
+import fnmatch
+import os
+import struct
+import time
+import numpy as np
+import host
+from host.mlx_device import iter_frames, NUM_ROWS, NUM_COLS
+
+## Type the pixel values are stored as
+FRAME_DTYPE = np.dtype("<i2")
+## Bytes taken by one image in the .bin file
+FRAME_BYTES = NUM_ROWS*NUM_COLS*FRAME_DTYPE.itemsize
+## Start of the .idx file: a magic number, the format version and the image
+#  size, so a store made for other images isn't read by mistake
+INDEX_MAGIC = b"MLXI"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sHHH")
+## Each image's entry in the .idx file: the byte offset in the .bin file and
+#  the lengths of the label and source name, which follow it as UTF-8
+INDEX_ENTRY = struct.Struct("<QHH")
+
+
+class FrameCorpus:
+    """!
+    This class implements a store of labeled camera images kept in a memory
+    mapped .bin file with a .idx index beside it.  Images are numbered in the
+    order they were added; corpus[n] is image n as a (24, 32) int16 array and
+    corpus[a:b] is a run of them, both read straight from the mapped file.
+    """
+
+    def __init__(self, path, create=False):
+        """!
+        Opens a store.
+        @param path - the store's path without the .bin or .idx extension,
+                      relative to the src directory if it isn't found as given
+        @param create - make an empty store if there isn't one, instead of
+                        raising FileNotFoundError
+        """
+        if not os.path.exists(path + ".idx") and not os.path.isabs(path) and not create:
+            path = os.path.join(host.SRC_DIR, path)
+        self.path = path
+        self.bin_file = path + ".bin"
+        self.idx_file = path + ".idx"
+        if not os.path.exists(self.idx_file):
+            if not create:
+                raise FileNotFoundError(f"no image store at {self.idx_file}")
+            with open(self.idx_file, "wb") as file:
+                file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, NUM_ROWS, NUM_COLS))
+            open(self.bin_file, "wb").close()
+        ## The label of each image
+        self.labels = []
+        ## The file each image was read from
+        self.sources = []
+        ## The byte offset of each image in the .bin file
+        self.offsets = []
+        self._index_pos = 0
+        self._map = None
+        self.refresh()
+
+    def refresh(self):
+        """!
+        Reads any index entries added since the store was opened or last
+        refreshed, such as ones appended by another process.  Only whole
+        entries whose image is already in the .bin file are taken.
+        @returns the number of new images
+        """
+        with open(self.idx_file, "rb") as file:
+            data = file.read()
+        pos = self._index_pos
+        if pos == 0:
+            magic, version, rows, cols = INDEX_HEADER.unpack_from(data, 0)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or (rows, cols) != (NUM_ROWS, NUM_COLS):
+                raise ValueError(f"{self.idx_file} is not a {NUM_ROWS}x{NUM_COLS} image index")
+            pos = INDEX_HEADER.size
+        bin_size = os.path.getsize(self.bin_file)
+        count = len(self.labels)
+        while pos + INDEX_ENTRY.size <= len(data):
+            offset, label_len, source_len = INDEX_ENTRY.unpack_from(data, pos)
+            end = pos + INDEX_ENTRY.size + label_len + source_len
+            if end > len(data) or offset + FRAME_BYTES > bin_size:
+                break
+            if offset != len(self.offsets)*FRAME_BYTES:
+                raise ValueError(f"{self.idx_file} entry {len(self.offsets)} is out of order")
+            text = data[pos + INDEX_ENTRY.size:end].decode()
+            self.labels.append(text[:label_len])
+            self.sources.append(text[label_len:])
+            self.offsets.append(offset)
+            pos = end
+        self._index_pos = pos
+        if len(self.labels) != count:
+            self._map = None
+        return len(self.labels) - count
+
+    @property
+    def frames(self):
+        """!
+        Every image in the store as one (N, 24, 32) int16 array mapped from
+        the .bin file.  It is read only; use append() to add images.
+        """
+        if self._map is None:
+            if self.labels:
+                self._map = np.memmap(self.bin_file, dtype=FRAME_DTYPE, mode="r",
+                                      shape=(len(self.labels), NUM_ROWS, NUM_COLS))
+            else:
+                # an empty file can't be mapped
+                self._map = np.zeros((0, NUM_ROWS, NUM_COLS), dtype=FRAME_DTYPE)
+        return self._map
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, key):
+        return self.frames[key]
+
+    def select(self, *patterns):
+        """!
+        This method finds the images with matching labels.
+        @param patterns - shell style patterns such as "jojo*" or "blank?";
+                          an image matching any of them is selected
+        @returns an array of the image numbers, in order
+        """
+        return np.array([n for n, label in enumerate(self.labels)
+                         if any(fnmatch.fnmatchcase(label, p) for p in patterns)], dtype=np.intp)
+
+    def subset(self, *patterns):
+        """!
+        This method reads the images with matching labels.
+        @param patterns - label patterns as for select()
+        @returns an (N, 24, 32) int16 array, which is a view of the mapped
+                 file if the images are next to each other and a copy if not
+        """
+        numbers = self.select(*patterns)
+        if len(numbers) and numbers[-1] - numbers[0] == len(numbers) - 1:
+            return self.frames[numbers[0]:numbers[-1] + 1]
+        return self.frames[numbers]
+
+    def append(self, label, frame, source=""):
+        """!
+        This method adds an image to the end of the store.  The image goes
+        into the .bin file before its entry goes into the .idx file, so a
+        reader never sees an entry without its image.
+        @param label - the image's label
+        @param frame - 24 rows of 32 values, as a list or an array
+        @param source - where the image came from, such as a file name
+        @returns the new image's number
+        """
+        pixels = np.asarray(frame).astype(FRAME_DTYPE)
+        if pixels.shape != (NUM_ROWS, NUM_COLS):
+            raise ValueError(f"image is {pixels.shape}, not ({NUM_ROWS}, {NUM_COLS})")
+        self.refresh()
+        offset = len(self.labels)*FRAME_BYTES
+        with open(self.bin_file, "r+b") as file:
+            file.seek(offset)
+            file.write(pixels.tobytes())
+        label_bytes = label.encode()
+        source_bytes = source.encode()
+        with open(self.idx_file, "ab") as file:
+            file.write(INDEX_ENTRY.pack(offset, len(label_bytes), len(source_bytes))
+                       + label_bytes + source_bytes)
+        self.refresh()
+        return len(self.labels) - 1
+
+    def extend(self, frames, source=""):
+        """!
+        This method adds images to the end of the store.
+        @param frames - (label, frame) tuples, from a list or a generator
+        @param source - where the images came from
+        @returns the number of images added
+        """
+        count = 0
+        for label, frame in frames:
+            self.append(label, frame, source)
+            count += 1
+        return count
+
+    def stream(self, start=0, follow=False, poll=0.5):
+        """!
+        This generator yields the images in the store one at a time.
+        @param start - the number of the first image
+        @param follow - keep waiting for new images once the end is reached,
+                        like tail -f, instead of stopping there
+        @param poll - how often to look for new images when following, in s
+        @returns a generator of (label, frame) tuples
+        """
+        n = start
+        while True:
+            while n < len(self.labels):
+                yield self.labels[n], self.frames[n]
+                n += 1
+            if not follow:
+                return
+            while not self.refresh():
+                time.sleep(poll)
+
+
+def build(path, files):
+    """!
+    This function converts recorded image text files into a new store,
+    replacing any store already at the path.
+    @param path - the store's path without extension
+    @param files - the text files to convert, in order
+    @returns the new FrameCorpus
+    """
+    for filename in (path + ".bin", path + ".idx"):
+        if os.path.exists(filename):
+            os.remove(filename)
+    corpus = FrameCorpus(path, create=True)
+    for filename in files:
+        corpus.extend(iter_frames(filename), os.path.basename(filename))
+    return corpus
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build, extend or list a recorded image store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="convert text files into a new store")
+    build_parser.add_argument("store", help="store path without extension")
+    build_parser.add_argument("files", nargs="+", help="recorded image text files")
+    append_parser = commands.add_parser("append", help="add text files to the end of a store")
+    append_parser.add_argument("store")
+    append_parser.add_argument("files", nargs="+")
+    list_parser = commands.add_parser("list", help="list the images in a store")
+    list_parser.add_argument("store")
+    list_parser.add_argument("patterns", nargs="*", default=["*"], help="label patterns")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        corpus = build(args.store, args.files)
+        print(f"{len(corpus)} images in {corpus.bin_file}")
+    elif args.command == "append":
+        corpus = FrameCorpus(args.store, create=True)
+        for filename in args.files:
+            corpus.extend(iter_frames(filename), os.path.basename(filename))
+        print(f"{len(corpus)} images in {corpus.bin_file}")
+    else:
+        corpus = FrameCorpus(args.store)
+        for n in corpus.select(*args.patterns):
+            frame = corpus[n]
+            print(f"{n:4d}  {corpus.sources[n]:20s} {corpus.labels[n]:28s} "
+                  f"min {frame.min():4d}  max {frame.max():4d}")
@@ -0,0 +1,494 @@
+"""!
+@file engagement.py
+    This file runs the five generator tasks of main.py, unchanged, through
+    whole engagements on a PC: the turret starts at home facing away, the
+    camera sees a recorded image, the turret turns, aims and fires.  The tasks
+    are scheduled by cotask the same way as on the board, but the virtual
+    clock only moves when something takes time (a camera transfer on the I2C
+    bus, or a modeled task run time) or when no task is ready, in which case
+    it jumps straight to the next task release or timer interrupt.  The
+    motors are the plant models from plant.py, stepped along with the clock,
+    and the camera is either the MLX90640 model from mlx_device.py or a
+    faster stand-in which hands the camera task the recorded image directly.
+
+    Each engagement measures the time from start to the shot, the aim error
+    at the shot, how often each task missed its deadline and how long the
+    scheduler itself took.  Most of the PC time goes in main.py's own task
+    code and cotask, which run as they would on the board, so one core
+    manages some tens of engagements a second, not thousands; more cores
+    multiply that.  Run every image in the recorded files through an
+    engagement, spread over every core:
+    @code
+    python -m host.engagement test_ims.txt new_test_ims.txt
+    python -m host.engagement test_ims.txt --camera device --out runs.json
+    @endcode
+    With more than one person in view the turret shoots each in turn.  A
+    scene of several people is made from recorded images of one person each,
+    by taking the hottest of the images at every pixel, and --shots 0 runs
+    it until the turret is home again, timing every shot:
+    @code
+    python -m host.engagement new_test_ims.txt --scene "jojo left+jojo right" --shots 0
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+import contextlib
+import json
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+import host
+host.install()
+
+import cotask
+import machine
+import pyb
+import task_share
+import utime
+from ulab import numpy as np
+from host.plant import SimulatedAxis
+from host.mlx_device import MLX90640Device, read_frames
+
+import main
+
+## Pins and timers of the two axes as they are set up in main.py
+YAW_SETUP = {"belt_ratio": 1, "pwm_timer": 1, "encoder_timer": 3,
+             "pins": ("G12", "E9", "E11", "A6", "B5")}
+PITCH_SETUP = {"belt_ratio": 4, "pwm_timer": 4, "encoder_timer": 2,
+               "pins": ("G14", "B6", "B7", "A15", "B3")}
+## Motor model parameters used unless fitted ones are given.  With the nominal
+#  MotorModel the yaw gain in main.py (kp 35, every 15 ms) only limit cycles,
+#  so yaw gets a stiffer motor constant until it is fitted with sysid.py
+YAW_MODEL = {"k_motor": 0.1}
+PITCH_MODEL = {}
+## The trigger servo's timer and the 50 Hz period of its PWM in us
+SERVO_TIMER = 15
+SERVO_PERIOD_US = 20000
+## The task names used in main.py, in the order they are created there
+TASK_NAMES = ("camera", "yaw", "pitch", "trigger", "timing")
+
+## The result of one engagement.  Times are in ms of virtual time; fire_time
+#  and aim errors are those of the first shot, None if the turret never
+#  fired.  A shot is timed and its aim taken when it leaves the barrel,
+#  main.FIRE_DELAY after the trigger task fires the servo.  shots holds
+#  (time, yaw error, pitch error) for every shot and
+#  end_time is when the run stopped.  misses and runs hold a count per task,
+#  latency the mean us from each task being released or woken to it
+#  running, and sched_us is the mean PC time per scheduler call which was not spent
+#  in a task.
+Engagement = namedtuple("Engagement", ("label", "fire_time", "first_command",
+                                       "yaw_error", "pitch_error", "shots", "end_time",
+                                       "misses", "runs", "latency", "sched_us", "pc_time"))
+
+
+class FrameCamera:
+    """!
+    This class implements a stand-in for MLX_Cam which skips the I2C bus: a
+    subpage is ready every subpage period, as has_data says, and after both
+    have been read get_array() returns the recorded image as it was saved.
+    It has the parts of the MLX_Cam and MLX90640 interface the camera task in
+    main.py uses.
+    """
+    ## The frame the next camera made will show, set by the runner
+    frame = None
+
+    def __init__(self, i2c, address=0x33):
+        self._camera = self
+        self.refresh_rate = 2.0
+        self._array = np.array(FrameCamera.frame, dtype=np.uint8)
+        self._start = utime.ticks_us()
+        self._subpage = 0
+
+    @property
+    def has_data(self):
+        return utime.ticks_diff(utime.ticks_us(), self._start) >= int(1000000/self.refresh_rate)
+
+    def get_image_nonblocking(self):
+        if not self.has_data:
+            return None
+        # only the newest subpage is kept, as in the camera's RAM
+        subpage_us = int(1000000/self.refresh_rate)
+        late = utime.ticks_diff(utime.ticks_us(), self._start)
+        self._start = utime.ticks_add(self._start, late - late % subpage_us)
+        self._subpage ^= 1
+        # both subpages have to be read to make an image; the real camera
+        # hands back its RawImage, which is always true
+        return self if self._subpage == 0 else None
+
+    def get_array(self, image, limits=None):
+        return self._array
+
+
+class _TimedTask(cotask.Task):
+    """!
+    This class implements a cotask Task which counts deadline misses, adds a
+    modeled run time to the clock and keeps the PC time spent in the task.
+    A run is a deadline miss if it starts after the task's next release.  It
+    also keeps the response latency, the time from a periodic task's release
+    or an event task's go() to the start of the run.
+    """
+
+    def __init__(self, run_fun, cost_us=0, totals=None, **kwargs):
+        super().__init__(run_fun, **kwargs)
+        self.cost_us = cost_us
+        # the runs and PC time of every task of the engagement, shared by
+        # them so the runner needn't add them up after every call
+        self.totals = [0, 0.0] if totals is None else totals
+        self.misses = 0
+        self.runs = 0
+        self.pc_time = 0.0
+        self.latency_us = 0
+        self._woken_us = 0
+
+    def go(self):
+        if not self.go_flag:
+            self._woken_us = utime.ticks_us()
+        super().go()
+
+    def schedule(self):
+        if not self.ready():
+            return False
+        now = utime.ticks_us()
+        # ready() has already moved the release time on to the next period
+        if self.period is not None:
+            self.latency_us += utime.ticks_diff(now, self._next_run) + self.period
+            if utime.ticks_diff(now, self._next_run) > 0:
+                self.misses += 1
+        else:
+            self.latency_us += utime.ticks_diff(now, self._woken_us)
+        self.go_flag = False
+        start = time.perf_counter()
+        next(self._run_gen)
+        elapsed = time.perf_counter() - start
+        self.pc_time += elapsed
+        self.runs += 1
+        self.totals[0] += 1
+        self.totals[1] += elapsed
+        if self.cost_us:
+            utime.advance_us(self.cost_us)
+        return True
+
+
+class EngagementRunner:
+    """!
+    This class implements the discrete event runner.  It puts fresh shares,
+    a fresh planner and fresh plants in place for every engagement, then runs
+    the scheduler until the turret fires or the time limit is reached.
+    """
+
+    def __init__(self, camera="frames", bus_freq=400000, dt=0.0005, timeout=10.0,
+                 task_costs=None, yaw_model=None, pitch_model=None, shots=1):
+        """!
+        Sets up the runner.
+        @param camera - "frames" to hand the camera task images directly or
+                        "device" to read them from the MLX90640 model over I2C
+        @param bus_freq - the I2C bus frequency for the camera model in Hz
+        @param dt - the time step of the motor models in s
+        @param timeout - give up on an engagement after this many s
+        @param task_costs - the time each run of a task takes on the board in us,
+                            a dictionary keyed by the names in TASK_NAMES
+        @param yaw_model - keyword arguments for the yaw MotorModel
+        @param pitch_model - keyword arguments for the pitch MotorModel
+        @param shots - stop after this many shots, or 0 to run until main.py
+                       ends the program
+        """
+        self.camera = camera
+        self.bus_freq = bus_freq
+        self.dt_us = int(round(dt*1000000))
+        self.timeout_us = int(timeout*1000000)
+        self.task_costs = task_costs or {}
+        self.yaw_model = YAW_MODEL if yaw_model is None else yaw_model
+        self.pitch_model = PITCH_MODEL if pitch_model is None else pitch_model
+        self.shots = shots
+        self._axes = ()
+        self._pending = 0
+        self._plant_us = 0
+        self._hook = None
+        self._commands = []
+        self._shots = []
+        self._shot_due = None
+        self._totals = [0, 0.0]
+        self._periodic = ()
+        self._servo = None
+
+    def _step_plants(self, old_us, new_us):
+        # the motors move along with the clock whatever moved it; no task runs
+        # while the clock moves, so the voltages hold and the steps are taken
+        # in one go per axis, up to the shot leaving the barrel if it does
+        self._pending += new_us - old_us
+        dt_us = self.dt_us
+        dt = dt_us/1000000
+        while self._pending >= dt_us:
+            steps = self._pending//dt_us
+            if self._shot_due is not None:
+                steps = min(steps, max(-(-(self._shot_due - self._plant_us)//dt_us), 1))
+            for axis in self._axes:
+                axis.run(steps, dt)
+            self._pending -= steps*dt_us
+            self._plant_us += steps*dt_us
+            if self._shot_due is not None and self._plant_us >= self._shot_due:
+                self._shot_due = None
+                self._record_shot()
+
+    def _record_shot(self):
+        # the true axis angles, not what the encoders read
+        yaw_axis, pitch_axis = self._axes
+        self._shots.append((self._plant_us/1000,
+                            main.HOME_YAW + yaw_axis.get_angle() - main.motor_setpoints.get("yaw"),
+                            main.HOME_PITCH + pitch_axis.get_angle() - main.motor_setpoints.get("pitch")))
+
+    def _command_move(self, yaw_setpoint, pitch_setpoint):
+        self._commands.append((utime.ticks_ms(), yaw_setpoint, pitch_setpoint))
+        self._main_command_move(yaw_setpoint, pitch_setpoint)
+
+    def _setup(self, frame):
+        """!
+        Makes the shares, planner, plants and tasks for one engagement, the
+        same way the bottom of main.py does, with main.make_shares().
+        """
+        utime.reset()
+        machine.detach_all()
+        task_share.share_list.clear()
+        self._commands = []
+        main.make_shares()
+
+        # the plants are made before the tasks so the tasks' drivers take over
+        # the same pins and timers, the way they would on the board
+        self._axes = (SimulatedAxis(**YAW_SETUP, **self.yaw_model),
+                      SimulatedAxis(**PITCH_SETUP, **self.pitch_model))
+        self._pending = 0
+        self._plant_us = 0
+        self._shots = []
+        self._shot_due = None
+        if self.camera == "device":
+            main.Cam = self._main_cam
+            MLX90640Device([frame], bus_freq=self.bus_freq).attach()
+        else:
+            FrameCamera.frame = frame
+            main.Cam = FrameCamera
+
+        tasks = cotask.TaskList()
+        self._totals = [0, 0.0]
+        self._servo = None
+        funs = (main.camera_handler_fun, main.yaw_motor_fun, main.pitch_motor_fun,
+                main.trigger_fun, main.timing_handler_fun)
+        periods = (None, 15, 15, None, None)
+        priorities = (5, 9, 9, 10, 10)
+        self.tasks = []
+        for name, fun, period, priority in zip(TASK_NAMES, funs, periods, priorities):
+            task = _TimedTask(fun, cost_us=self.task_costs.get(name, 0), totals=self._totals,
+                              name=name, priority=priority, period=period, profile=False)
+            tasks.append(task)
+            self.tasks.append(task)
+        self._periodic = [task for task in self.tasks if task.period is not None]
+        main.task1, main.task2, main.task3, main.task4, main.task5 = self.tasks
+        main.wake_on_events()
+        return tasks
+
+    def _next_event(self):
+        # us until the next periodic task release or timer callback
+        now = utime.now_us()
+        ticks = utime.ticks_us()
+        waits = [utime.ticks_diff(task._next_run, ticks) for task in self._periodic]
+        for timer in pyb.Timer._timers.values():
+            if timer._callback is not None and not timer._encoder:
+                period_us = timer._tick_us()*(timer._period + 1)
+                overflows = (now - timer._start_us)//period_us + 1
+                waits.append(int(timer._start_us + overflows*period_us) - now)
+        return min(waits) if waits else self.timeout_us - now
+
+    def _fired(self):
+        # the trigger task sets the servo to its fire angle when it shoots
+        if self._servo is None:
+            self._servo = pyb.Timer(SERVO_TIMER).channel(1)
+            if self._servo is None:
+                return False
+        pulse_us = self._servo.duty()*SERVO_PERIOD_US
+        fire_us = main.TRIGGER_FIRE_ANGLE/180*2000 + 500
+        return pulse_us >= fire_us - 1
+
+    def run(self, frame, label=None):
+        """!
+        This method runs one engagement against one camera image.
+        @param frame - the image the camera sees, 24 rows of 32 values
+        @param label - a name for the engagement
+        @returns an Engagement
+        """
+        self._main_command_move = main.command_move
+        self._main_cam = main.Cam
+        main.command_move = self._command_move
+        self._hook = self._step_plants
+        start = time.perf_counter()
+        sched_time = 0.0
+        sched_calls = 0
+        fired = False
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                tasks = self._setup(frame)
+                utime.add_advance_hook(self._hook)
+                totals = self._totals
+                while utime.now_us() < self.timeout_us:
+                    runs, task_time = totals
+                    call_start = time.perf_counter()
+                    try:
+                        tasks.pri_sched()
+                    except KeyboardInterrupt:
+                        break
+                    sched_time += time.perf_counter() - call_start - (totals[1] - task_time)
+                    sched_calls += 1
+                    if totals[0] == runs:
+                        # nothing was ready, jump to the next release or the
+                        # next timer interrupt, which may wake a task
+                        utime.advance_us(max(self._next_event(), 0) + 1)
+                    elif self._fired() != fired:
+                        fired = not fired
+                        if fired:
+                            self._shot_due = utime.now_us() + main.FIRE_DELAY*1000
+                    if self.shots and len(self._shots) >= self.shots:
+                        break
+        finally:
+            utime.remove_advance_hook(self._hook)
+            main.command_move = self._main_command_move
+            main.Cam = self._main_cam
+        # the first move toward the target is the first one after command_move(0, 0)
+        first = self._commands[1][0] if len(self._commands) > 1 else None
+        shots = self._shots
+        fire_time, yaw_error, pitch_error = shots[0] if shots else (None, None, None)
+        return Engagement(label, fire_time, first, yaw_error, pitch_error, shots,
+                          utime.now_us()/1000,
+                          {task.name: task.misses for task in self.tasks},
+                          {task.name: task.runs for task in self.tasks},
+                          {task.name: task.latency_us/max(task.runs, 1) for task in self.tasks},
+                          sched_time/max(sched_calls, 1)*1000000,
+                          time.perf_counter() - start)
+
+
+def _run_job(job):
+    settings, label, frame = job
+    return EngagementRunner(**settings).run(frame, label)
+
+
+def run_all(frames, processes=None, **settings):
+    """!
+    This function runs one engagement per image, spread over a process pool.
+    @param frames - a list of (label, frame) tuples from read_frames()
+    @param processes - how many worker processes to use, default one per core
+    @param settings - keyword arguments for EngagementRunner
+    @returns a list of Engagement results in the order of the frames
+    """
+    jobs = [(settings, label, frame) for label, frame in frames]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        return [_run_job(job) for job in jobs]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_run_job, jobs)
+
+
+def make_scene(frames, labels):
+    """!
+    This function makes an image of several people from recorded images of
+    one person each, as the hottest of the images at every pixel.
+    @param frames - a list of (label, frame) tuples from read_frames()
+    @param labels - the labels of the images to put together; the first
+                    image with each label is used
+    @returns a (label, frame) tuple, labeled with the labels joined by +
+    """
+    by_label = {}
+    for label, frame in frames:
+        by_label.setdefault(label, frame)
+    missing = [label for label in labels if label not in by_label]
+    if missing:
+        raise KeyError(f"no recorded image labeled {', '.join(missing)}")
+    scene = [[max(pixels) for pixels in zip(*rows)]
+             for rows in zip(*(by_label[label] for label in labels))]
+    return "+".join(labels), scene
+
+
+def summarize(results):
+    """!
+    This function works out the totals over a set of engagements.
+    @param results - Engagement results
+    @returns a dictionary of summary statistics
+    """
+    fired = [r for r in results if r.fire_time is not None]
+    times = sorted(r.fire_time for r in fired)
+    misses = {name: sum(r.misses[name] for r in results) for name in TASK_NAMES}
+    runs = {name: sum(r.runs[name] for r in results) for name in TASK_NAMES}
+    last = [r.shots[-1][0] for r in fired]
+    return {
+        "engagements": len(results),
+        "fired": len(fired),
+        "mean_time_to_fire_ms": sum(times)/len(times) if times else None,
+        "median_time_to_fire_ms": times[len(times)//2] if times else None,
+        "max_time_to_fire_ms": times[-1] if times else None,
+        "mean_abs_yaw_error": (sum(abs(r.yaw_error) for r in fired)/len(fired)
+                               if fired else None),
+        "mean_abs_pitch_error": (sum(abs(r.pitch_error) for r in fired)/len(fired)
+                                 if fired else None),
+        "mean_shots": sum(len(r.shots) for r in results)/max(len(results), 1),
+        "mean_time_to_last_shot_ms": sum(last)/len(last) if last else None,
+        "mean_end_time_ms": sum(r.end_time for r in results)/max(len(results), 1),
+        "deadline_miss_rate": {name: misses[name]/max(runs[name], 1) for name in TASK_NAMES},
+        "mean_runs": {name: runs[name]/max(len(results), 1) for name in TASK_NAMES},
+        "mean_latency_us": {name: sum(r.latency[name]*r.runs[name] for r in results)/max(runs[name], 1)
+                            for name in TASK_NAMES},
+        "mean_sched_overhead_us": sum(r.sched_us for r in results)/max(len(results), 1),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Simulate turret engagements against recorded images")
+    parser.add_argument("files", nargs="*", default=["test_ims.txt"], help="recorded image files")
+    parser.add_argument("--camera", choices=("frames", "device"), default="frames",
+                        help="hand images straight to the camera task or model the I2C camera")
+    parser.add_argument("--repeat", type=int, default=1, help="run every image this many times")
+    parser.add_argument("--timeout", type=float, default=10.0, help="give up after this many s")
+    parser.add_argument("--dt", type=float, default=0.0005, help="motor model time step in s")
+    parser.add_argument("--cost", action="append", default=[], metavar="TASK=US",
+                        help="board run time of a task in us, such as camera=20000")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--plant-yaw", help="JSON motor fit of the yaw axis from host/sysid.py")
+    parser.add_argument("--plant-pitch", help="JSON motor fit of the pitch axis from host/sysid.py")
+    parser.add_argument("--shots", type=int, default=1,
+                        help="stop after this many shots, 0 to run until the turret is home")
+    parser.add_argument("--scene", action="append", default=[], metavar="LABEL+LABEL",
+                        help="run a scene made of the images with these labels instead")
+    parser.add_argument("--out", help="JSON file to write every engagement to")
+    args = parser.parse_args()
+
+    models = []
+    for filename in (args.plant_yaw, args.plant_pitch):
+        if filename:
+            with open(filename) as file:
+                models.append(json.load(file)["model_args"])
+        else:
+            models.append(None)
+
+    frames = [frame for filename in args.files for frame in read_frames(filename)]
+    if args.scene:
+        frames = [make_scene(frames, scene.split("+")) for scene in args.scene]
+    frames *= args.repeat
+    costs = {name: int(us) for name, us in (c.split("=") for c in args.cost)}
+    starttime = time.perf_counter()
+    results = run_all(frames, args.processes, camera=args.camera, dt=args.dt,
+                      timeout=args.timeout, task_costs=costs,
+                      yaw_model=models[0], pitch_model=models[1], shots=args.shots)
+    totaltime = time.perf_counter() - starttime
+    for r in results:
+        fire = "no shot" if r.fire_time is None else f"{r.fire_time:8.1f} ms"
+        aim = "" if r.fire_time is None else f"  aim error {r.yaw_error:6.2f}, {r.pitch_error:6.2f} deg"
+        print(f"{r.label:<28} {fire}{aim}  misses {sum(r.misses.values())}")
+        for shot in r.shots[1:]:
+            print(f"{'':<28} {shot[0]:8.1f} ms  aim error {shot[1]:6.2f}, {shot[2]:6.2f} deg")
+    summary = summarize(results)
+    print(json.dumps(summary, indent=2))
+    print(f"{len(results)} engagements in {totaltime:.2f} s, "
+          f"{len(results)/totaltime:.1f} engagements/s")
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump({"summary": summary, "engagements": [r._asdict() for r in results]},
+                      file, indent=2)
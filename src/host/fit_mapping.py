@@ -0,0 +1,176 @@
+"""!
+@file fit_mapping.py
+    This file fits the camera to turret mapping cam2turret.py uses, in place
+    of hand tuning the gains and offsets in main.py.  It takes pairs of the
+    camera angles cam2setpoint() gave for a target and the yaw and pitch
+    motor setpoints which hit it, fits a polynomial in both camera angles to
+    each setpoint by least squares, and writes the coefficients to the
+    cam2turret.bin file cam2turret.py loads.
+
+    Record the pairs with the turret on its stand:
+    -# Put a target in view and run main.py; camera_handler_fun prints the
+       camera angles of each target it finds.
+    -# Jog the turret until it hits the target and note the yaw and pitch
+       motor setpoints (the encoder angles of the two axes).
+    -# Write each pair as a line "x, y, yaw, pitch" in a text file, and
+       repeat with the target spread over the field of view.
+    The true setpoints can instead be given for recorded images in the
+    truth file vision_sweep.py uses, in which case the camera angles come
+    from running cam2setpoint() on the images.
+    @code
+    python -m host.fit_mapping --pairs aim_pairs.txt --degree 2
+    python -m host.fit_mapping --truth aim_truth.json test_ims.txt new_test_ims.txt
+    python -m host.fit_mapping --hand
+    @endcode
+    A fit is only written if it beats the hand tuned mapping on the pairs;
+    pass --force to write it anyway, or --hand to write the hand tuned one.
+    Refitting takes a second, so the mapping can be redone whenever the
+    camera is moved.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+import json
+import struct
+import numpy
+import host
+host.install()
+
+from cam2setpoint import cam2setpoint
+from cam2turret import MAP_FILE, MAP_MAGIC, HAND_YAW, HAND_PITCH, horner_rows, horner
+
+
+def read_pairs(filename):
+    """!
+    This function reads recorded pairs of camera angles and setpoints.
+    @param filename - a text file with a line "x, y, yaw, pitch" per pair;
+                      blank lines and lines starting with # are skipped
+    @returns an (N, 4) array of the pairs
+    """
+    pairs = []
+    with open(filename) as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                pairs.append([float(value) for value in line.split(",")])
+    return numpy.array(pairs).reshape(-1, 4)
+
+
+def truth_pairs(truth, images):
+    """!
+    This function makes pairs from recorded images and the setpoints which
+    hit the target in them.  Images without a setpoint, or where
+    cam2setpoint() finds nothing, are skipped.
+    @param truth - a dictionary of true [yaw, pitch] setpoints by image name
+    @param images - (source, label, frame) tuples from vision_eval.load_images()
+    @returns an (N, 4) array of the pairs
+    """
+    from ulab import numpy as np
+    from host.vision_eval import frame_keys
+    pairs = []
+    with numpy.errstate(all="ignore"):
+        for key, (source, label, frame) in zip(frame_keys(images), images):
+            if key in truth:
+                target = cam2setpoint(np.array(frame, dtype=np.uint8))
+                if target is not None:
+                    pairs.append([target[0], target[1], truth[key][0], truth[key][1]])
+    return numpy.array(pairs).reshape(-1, 4)
+
+
+def terms(x, y, degree):
+    """!
+    This function works out every term of a polynomial in x and y.
+    @param x - camera X angles
+    @param y - camera Y angles
+    @param degree - the degree of the polynomial
+    @returns an (N, terms) array of x^i*y^j, in the Horner order
+             cam2turret.py keeps the coefficients in
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    return numpy.stack([x**i * y**j for i in range(degree, -1, -1)
+                        for j in range(degree - i, -1, -1)], axis=-1)
+
+
+def fit(pairs, degree=2):
+    """!
+    This function fits the mapping to the pairs by least squares.
+    @param pairs - the (N, 4) array of pairs
+    @param degree - the degree of the polynomials
+    @returns flat lists of the yaw and pitch coefficients, in Horner order
+    """
+    matrix = terms(pairs[:, 0], pairs[:, 1], degree)
+    if len(pairs) < matrix.shape[1]:
+        raise ValueError(f"{len(pairs)} pairs can't fit a degree {degree} mapping "
+                         f"of {matrix.shape[1]} terms")
+    yaw = numpy.linalg.lstsq(matrix, pairs[:, 2], rcond=None)[0]
+    pitch = numpy.linalg.lstsq(matrix, pairs[:, 3], rcond=None)[0]
+    return list(yaw), list(pitch)
+
+
+def rms_error(pairs, yaw_rows, pitch_rows):
+    """!
+    This function measures how well a mapping hits the pairs, working it out
+    the same way cam2turret() does.
+    @param pairs - the (N, 4) array of pairs
+    @param yaw_rows - the yaw polynomial as Horner rows
+    @param pitch_rows - the pitch polynomial as Horner rows
+    @returns the RMS yaw and pitch setpoint errors
+    """
+    yaw = [horner(yaw_rows, x, y) - sp for x, y, sp, _ in pairs]
+    pitch = [horner(pitch_rows, x, y) - sp for x, y, _, sp in pairs]
+    return numpy.sqrt(numpy.mean(numpy.square(yaw))), numpy.sqrt(numpy.mean(numpy.square(pitch)))
+
+
+def write_mapping(filename, degree, yaw, pitch):
+    """!
+    This function writes a mapping in the format cam2turret.py loads.
+    @param filename - the file to write
+    @param degree - the degree of the polynomials
+    @param yaw - the flat list of yaw coefficients, in Horner order
+    @param pitch - the flat list of pitch coefficients, in Horner order
+    """
+    with open(filename, "wb") as file:
+        file.write(struct.pack("<4sHH", MAP_MAGIC, degree, len(yaw)))
+        file.write(struct.pack(f"<{2*len(yaw)}f", *yaw, *pitch))
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Fit the camera to turret mapping for cam2turret.py")
+    parser.add_argument("sources", nargs="*", help="recorded images for --truth")
+    parser.add_argument("--pairs", help='text file of "x, y, yaw, pitch" lines')
+    parser.add_argument("--truth", help="JSON of true [yaw, pitch] setpoints by image name")
+    parser.add_argument("--degree", type=int, default=2, help="degree of the polynomials")
+    parser.add_argument("--out", default=MAP_FILE, help="mapping file to write")
+    parser.add_argument("--force", action="store_true", help="write the fit even if it is worse")
+    parser.add_argument("--hand", action="store_true", help="write the hand tuned mapping instead")
+    args = parser.parse_args()
+
+    if args.hand:
+        write_mapping(args.out, 1, [c for row in HAND_YAW for c in row],
+                      [c for row in HAND_PITCH for c in row])
+        print(f"wrote the hand tuned mapping to {args.out}")
+        sys.exit(0)
+    pairs = numpy.zeros((0, 4))
+    if args.pairs:
+        pairs = numpy.concatenate([pairs, read_pairs(args.pairs)])
+    if args.truth:
+        from host.vision_eval import DEFAULT_FILES, load_images
+        with open(args.truth) as file:
+            truth = json.load(file)
+        pairs = numpy.concatenate([pairs, truth_pairs(truth, load_images(args.sources or DEFAULT_FILES))])
+    if not len(pairs):
+        parser.error("no pairs; give --pairs or --truth")
+    yaw, pitch = fit(pairs, args.degree)
+    before = rms_error(pairs, HAND_YAW, HAND_PITCH)
+    after = rms_error(pairs, horner_rows(yaw, args.degree), horner_rows(pitch, args.degree))
+    print(f"{len(pairs)} pairs, RMS error yaw {before[0]:.2f} -> {after[0]:.2f}, "
+          f"pitch {before[1]:.2f} -> {after[1]:.2f}")
+    if sum(after) >= sum(before) and not args.force:
+        print(f"the fit is no better than the hand tuned mapping, so {args.out} was not written")
+        sys.exit(1)
+    write_mapping(args.out, args.degree, yaw, pitch)
+    print(f"wrote {args.out}")
@@ -0,0 +1,354 @@
+"""!
+@file mlx_device.py
+    This file contains a model of the MLX90640 thermal camera as seen from the
+    I2C bus, for running the camera driver and main.py on a PC.  The model
+    holds the camera's 16-bit register file, EEPROM and pixel RAM and answers
+    the same 16-bit addressed reads and writes the driver makes.  New subpages
+    are measured on the virtual utime clock at the refresh rate set in the
+    control register; each one is written into RAM in the chess or interleaved
+    layout chosen by the control register, after which last_subpage and
+    data_available are set in the status register.  The frames measured are
+    replayed from the recorded image files (test_ims.txt and the like).
+
+    Every transaction and byte on the bus is counted, so a change to the
+    driver can be measured exactly:
+    @code
+    from host.mlx_device import MLX90640Device, read_frames
+    device = MLX90640Device(read_frames("test_ims.txt"))
+    device.attach()
+    ...  # run the driver
+    print(device.get_counts())
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+import os
+import host
+host.install()
+
+import machine
+import utime
+
+## Rows and columns of pixels
+NUM_ROWS = 24
+NUM_COLS = 32
+## Word addresses of the parts of the camera's memory
+RAM_ADDRESS = 0x0400
+RAM_SIZE = 0x0340
+PIX_DATA_ADDRESS = 0x0400
+EEPROM_ADDRESS = 0x2400
+EEPROM_SIZE = 0x0340
+STATUS_ADDRESS = 0x8000
+CONTROL_ADDRESS = 0x800D
+I2C_CONFIG_ADDRESS = 0x800F
+I2C_ADDRESS_ADDRESS = 0x8010
+## Power on values of the registers, from the datasheet: 2 Hz, 18 bit ADC,
+#  chess pattern, subpages enabled, I2C address 0x33
+CONTROL_DEFAULT = 0x1901
+STATUS_DEFAULT = 0x0010
+I2C_ADDRESS_DEFAULT = 0xBE33
+## Status register bits the driver may write (data_available, overwrite
+#  enable and start of measurement); last_subpage is read only
+STATUS_WRITABLE = 0x0038
+## Nominal values of the auxiliary RAM words the driver reads
+AUX_DEFAULTS = {0x0700: 19000, 0x0708: -60, 0x070A: 6400, 0x0720: 1700,
+                0x0728: -60, 0x072A: -13000}
+## The address of the device on the bus
+DEFAULT_ADDRESS = 0x33
+## Bits on the wire around each transaction's data: start, the device address,
+#  the two register address bytes, a repeated start and the address again,
+#  each byte taking 9 bits with its acknowledge
+OVERHEAD_BITS = 2 + 4*9
+
+
+def iter_frames(filename):
+    """!
+    This generator reads recorded camera images from a text file in which
+    each image is a label line followed by 24 rows of 32 comma separated
+    values, as written out by mlx_cam.py, with images separated by blank
+    lines.  Images are yielded as they are read, so a file still being
+    captured to can be read as far as it goes.
+    @param filename - the file to read, relative to the src directory if it
+                      isn't found as given
+    @returns a generator of (label, frame) tuples, each frame a list of 24
+             rows of 32 ints as they appear in the file
+    """
+    if not os.path.exists(filename):
+        filename = os.path.join(host.SRC_DIR, filename)
+    label = None
+    rows = []
+    with open(filename) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if line[0].isdigit() or line[0] == "-":
+                rows.append([int(v) for v in line.split(",")])
+                if len(rows) == NUM_ROWS:
+                    yield label, rows
+                    rows = []
+            else:
+                label = line
+                rows = []
+
+
+def read_frames(filename):
+    """!
+    This function reads every recorded camera image in a text file.
+    @param filename - the file to read, as for iter_frames()
+    @returns a list of (label, frame) tuples
+    """
+    return list(iter_frames(filename))
+
+
+def frame_to_pixels(frame):
+    """!
+    This function turns an image as saved by mlx_cam.py back into the pixel
+    order of the camera's RAM.  MLX_Cam.get_array() mirrors the columns, so
+    this mirrors them back.
+    @param frame - 24 rows of 32 values
+    @returns a list of the 768 pixel values in RAM order
+    """
+    pixels = []
+    for row in frame:
+        pixels.extend(int(v) for v in reversed(row))
+    return pixels
+
+
+def chess_subpage(idx):
+    # same as ChessPattern.get_sp() in mlx90640/image.py
+    return (idx//32 - (idx//64)*2) ^ (idx - (idx//2)*2)
+
+
+def interleaved_subpage(idx):
+    # same as InterleavedPattern.get_sp() in mlx90640/image.py
+    return idx//32 - (idx//64)*2
+
+
+class MLX90640Device:
+    """!
+    This class implements the MLX90640 as an I2C device model for the
+    machine.I2C stand-in.  Registers are 16 bits wide, addresses are word
+    addresses and data goes over the bus most significant byte first.
+    """
+
+    def __init__(self, frames, loop=True, eeprom=None, bus_freq=None):
+        """!
+        Creates a camera at power on.  The first subpage is measured one
+        refresh period after the camera is created.
+        @param frames - the images to replay, a list of frames (24 rows of 32
+                        values) or of (label, frame) tuples from read_frames()
+        @param loop - start again from the first frame after the last one,
+                      otherwise keep measuring the last frame
+        @param eeprom - 832 16-bit words of calibration data, zeros by default
+        @param bus_freq - if given, move the virtual clock forward by the time
+                          each transaction would take on a bus running at this
+                          frequency in Hz
+        """
+        self.labels = []
+        self.frames = []
+        for frame in frames:
+            if isinstance(frame, tuple):
+                label, frame = frame
+            else:
+                label = None
+            self.labels.append(label)
+            self.frames.append(frame_to_pixels(frame))
+        if not self.frames:
+            raise ValueError("at least one frame is needed")
+        self.loop = loop
+        self.bus_freq = bus_freq
+        self.eeprom = list(eeprom) if eeprom is not None else [0]*EEPROM_SIZE
+        if len(self.eeprom) != EEPROM_SIZE:
+            raise ValueError(f"the EEPROM holds {EEPROM_SIZE} words")
+        self.ram = [0]*RAM_SIZE
+        for address, value in AUX_DEFAULTS.items():
+            self.ram[address - RAM_ADDRESS] = value & 0xFFFF
+        self.registers = {STATUS_ADDRESS: STATUS_DEFAULT,
+                          CONTROL_ADDRESS: CONTROL_DEFAULT,
+                          I2C_CONFIG_ADDRESS: 0,
+                          I2C_ADDRESS_ADDRESS: I2C_ADDRESS_DEFAULT}
+        ## The number of subpages measured since the camera was created
+        self.subpages = 0
+        ## The index of the frame whose pixels were read last
+        self.frame_read = 0
+        self._measure_start = utime.now_us()
+        self.reset_counts()
+
+    def attach(self, bus_id=1, address=DEFAULT_ADDRESS):
+        """!
+        Connects the camera to an I2C bus of the machine module stand-in.
+        @param bus_id - the bus number the turret code passes to I2C()
+        @param address - the address the camera answers to
+        """
+        machine.attach_device(bus_id, address, self)
+
+    def reset_counts(self):
+        """!
+        This method zeros the transaction and byte counters.
+        """
+        self.reads = 0
+        self.writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.pixel_reads = 0
+        self.status_reads = 0
+
+    def get_counts(self):
+        """!
+        This method returns the bus traffic since the counters were zeroed.
+        @returns a dictionary of transaction, byte and bus time counts, the
+                 bus time being in microseconds at 400 kHz unless a bus
+                 frequency was given
+        """
+        return {"reads": self.reads, "writes": self.writes,
+                "bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                "pixel_reads": self.pixel_reads, "status_reads": self.status_reads,
+                "subpages": self.subpages,
+                "bus_time_us": self.bus_time_us(self.bus_freq or 400000)}
+
+    def bus_time_us(self, freq):
+        """!
+        This method works out how long the counted traffic would keep the bus
+        busy.
+        @param freq - the bus frequency in Hz
+        @returns the time in microseconds
+        """
+        bits = ((self.reads + self.writes)*OVERHEAD_BITS
+                + (self.bytes_read + self.bytes_written)*9)
+        return bits*1000000/freq
+
+    def get_refresh_rate(self):
+        """!
+        This method returns the subpage rate set in the control register.
+        @returns the refresh rate in Hz
+        """
+        return 2.0**(((self.registers[CONTROL_ADDRESS] >> 7) & 0x7) - 1)
+
+    def get_label(self):
+        """!
+        This method returns the label of the frame whose pixels were read last.
+        """
+        return self.labels[self.frame_read]
+
+    def _frame_index(self, subpage_count):
+        n = subpage_count//2
+        if self.loop:
+            return n % len(self.frames)
+        return min(n, len(self.frames) - 1)
+
+    def _measure(self):
+        """!
+        Writes every subpage whose measurement has finished since the last
+        transaction into RAM.
+        """
+        period_us = 1000000/self.get_refresh_rate()
+        done = int((utime.now_us() - self._measure_start)//period_us)
+        # only the latest two subpages can still be seen in RAM
+        first = max(self.subpages, self.subpages + done - 2)
+        for count in range(first, self.subpages + done):
+            self._write_subpage(count)
+        if done:
+            self.subpages += done
+            self._measure_start += done*period_us
+
+    def _write_subpage(self, count):
+        control = self.registers[CONTROL_ADDRESS]
+        # with subpages disabled the camera measures subpage 0 every time
+        sp_id = count % 2 if control & 0x1 else 0
+        get_sp = chess_subpage if control & 0x1000 else interleaved_subpage
+        pixels = self.frames[self._frame_index(count)]
+        ram = self.ram
+        for idx in range(NUM_ROWS*NUM_COLS):
+            if get_sp(idx) == sp_id:
+                ram[idx] = pixels[idx] & 0xFFFF
+        status = self.registers[STATUS_ADDRESS]
+        self.registers[STATUS_ADDRESS] = (status & ~0x7) | 0x8 | sp_id
+
+    def _read_word(self, address):
+        if RAM_ADDRESS <= address < RAM_ADDRESS + RAM_SIZE:
+            if address < PIX_DATA_ADDRESS + NUM_ROWS*NUM_COLS:
+                self.pixel_reads += 1
+                self.frame_read = self._frame_index(max(self.subpages - 1, 0))
+            return self.ram[address - RAM_ADDRESS]
+        if EEPROM_ADDRESS <= address < EEPROM_ADDRESS + EEPROM_SIZE:
+            return self.eeprom[address - EEPROM_ADDRESS]
+        if address == STATUS_ADDRESS:
+            self.status_reads += 1
+        return self.registers.get(address, 0)
+
+    def _write_word(self, address, value):
+        if address == STATUS_ADDRESS:
+            status = self.registers[address]
+            self.registers[address] = (status & ~STATUS_WRITABLE) | (value & STATUS_WRITABLE)
+        elif address == CONTROL_ADDRESS:
+            # a new refresh rate starts a new measurement
+            if (value ^ self.registers[address]) & 0x0380:
+                self._measure_start = utime.now_us()
+            self.registers[address] = value
+        elif address in self.registers:
+            self.registers[address] = value
+        # RAM and EEPROM can't be written over I2C
+
+    def _bus(self, nbytes):
+        if self.bus_freq:
+            utime.advance_us((OVERHEAD_BITS + nbytes*9)*1000000/self.bus_freq)
+
+    def read(self, memaddr, nbytes):
+        """!
+        This method answers a memory read from the bus.
+        @param memaddr - the word address to start reading from
+        @param nbytes - the number of bytes to read
+        @returns the bytes read, most significant byte of each word first
+        """
+        self._measure()
+        self.reads += 1
+        self.bytes_read += nbytes
+        data = bytearray(nbytes + (nbytes & 1))
+        for n in range(0, nbytes, 2):
+            word = self._read_word(memaddr + n//2)
+            data[n] = word >> 8
+            data[n + 1] = word & 0xFF
+        self._bus(nbytes)
+        return data[:nbytes]
+
+    def write(self, memaddr, buf):
+        """!
+        This method answers a memory write from the bus.
+        @param memaddr - the word address to start writing at
+        @param buf - the bytes to write, most significant byte of each word first
+        """
+        self._measure()
+        self.writes += 1
+        self.bytes_written += len(buf)
+        for n in range(0, len(buf) - 1, 2):
+            self._write_word(memaddr + n//2, (buf[n] << 8) | buf[n + 1])
+        self._bus(len(buf))
+
+
+if __name__ == "__main__":
+    # read one image of each file through the real camera driver and count
+    # what it took on the bus
+    import sys
+    from mlx_cam import MLX_Cam
+    files = sys.argv[1:] or ["test_ims.txt", "new_test_ims.txt", "blank_ims.txt"]
+    for filename in files:
+        machine.detach_all()
+        device = MLX90640Device(read_frames(filename), bus_freq=400000)
+        device.attach()
+        camera = MLX_Cam(machine.I2C(1, freq=400000))
+        camera._camera.refresh_rate = 10.0
+        device.reset_counts()
+        starttime = utime.ticks_ms()
+        image = None
+        while not image:
+            image = camera.get_image_nonblocking()
+            utime.sleep_ms(1)
+        totaltime = utime.ticks_diff(utime.ticks_ms(), starttime)
+        counts = device.get_counts()
+        print(f"{filename}: '{device.get_label()}' in {totaltime} ms, "
+              f"{counts['reads']} reads, {counts['writes']} writes, "
+              f"{counts['bytes_read'] + counts['bytes_written']} bytes, "
+              f"{counts['bus_time_us']/1000:.1f} ms on the bus")
@@ -0,0 +1,303 @@
+"""!
+@file plant.py
+    This file contains a discrete-time model of one turret axis: the Ametek
+    Pittman motor, its 16:1 gearbox and the belt (or gear) stage to the axis.
+    The model drives the real Encoder, MotorDriver and CLController classes
+    through stand-in pyb timers: the motor's PWM timer is read every step to
+    get the applied voltage and the encoder timer counter is advanced (and
+    wrapped at 16 bits) from the motor shaft angle.  Time runs on the virtual
+    utime clock, so a simulated run takes a small fraction of real time.
+
+    Run it as a script from the src directory to benchmark a step response:
+    @code
+    python -m host.plant
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-20
+"""
+import math
+import host
+host.install()
+
+import pyb
+import utime
+from motor_drivers.encoder_reader import Encoder
+from motor_drivers.motor_driver import MotorDriver
+from motor_drivers.controller import CLController
+
+# these match get_conversion_factor() in main.py
+TICKS_PER_REV = 256 # ticks per rev of the encoder
+COUNTS_PER_TICK = 4 # number of edge counts per encoder tick
+MOTOR_GEARBOX = 16  # ratio of the gearboxes on the ametek pittman motor
+
+
+class MotorModel:
+    """!
+    This class implements the electromechanical model of a brushed DC motor
+    driving an inertia through a gear reduction.  Inductance is neglected as
+    the electrical time constant is far shorter than a control period.  The
+    default values are nominal for the kit motors and are meant to be replaced
+    by values fitted from step response logs.
+    """
+
+    def __init__(self, gear_ratio, supply=12.0, resistance=2.5, k_motor=0.0229,
+                 j_motor=1.6e-6, j_load=2.0e-3, viscous=1.0e-6, coulomb=4.0e-3):
+        """!
+        Creates a motor model at rest.
+        @param gear_ratio - the total reduction from the motor shaft to the axis
+        @param supply - the H-bridge supply voltage in V
+        @param resistance - the armature resistance in ohms
+        @param k_motor - the torque/back-emf constant in N*m/A (V*s/rad)
+        @param j_motor - the rotor and gearbox inertia in kg*m^2 at the motor shaft
+        @param j_load - the axis (turret) inertia in kg*m^2 at the axis
+        @param viscous - the viscous friction in N*m*s/rad at the motor shaft
+        @param coulomb - the dry friction torque in N*m at the motor shaft
+        @param theta - the motor shaft angle in rad
+        @param omega - the motor shaft velocity in rad/s
+        """
+        self.gear_ratio = gear_ratio
+        self.supply = supply
+        self.resistance = resistance
+        self.k_motor = k_motor
+        self.inertia = j_motor + j_load/(gear_ratio*gear_ratio)
+        self.viscous = viscous
+        self.coulomb = coulomb
+        self.theta = 0.0
+        self.omega = 0.0
+
+    def step(self, voltage, dt):
+        """!
+        This method advances the model by one time step using semi-implicit
+        Euler integration.
+        @param voltage - the voltage applied across the motor in V
+        @param dt - the length of the step in s
+        """
+        torque = self.k_motor*(voltage - self.k_motor*self.omega)/self.resistance
+        torque -= self.viscous*self.omega
+        # dry friction holds the motor still until the drive torque beats it
+        if self.omega > 0:
+            torque -= self.coulomb
+        elif self.omega < 0:
+            torque += self.coulomb
+        elif abs(torque) <= self.coulomb:
+            torque = 0.0
+        else:
+            torque -= math.copysign(self.coulomb, torque)
+        omega = self.omega + torque/self.inertia*dt
+        # don't let friction push the motor backwards through zero
+        if self.omega != 0 and (omega > 0) != (self.omega > 0):
+            omega = 0.0
+        self.omega = omega
+        self.theta += omega*dt
+
+    def get_axis_angle(self):
+        """!
+        This method returns the angle of the axis after the reduction.
+        @returns the axis angle in degrees
+        """
+        return math.degrees(self.theta)/self.gear_ratio
+
+
+class SimulatedAxis:
+    """!
+    This class implements one turret axis built from the real MotorDriver and
+    Encoder classes, wired to stand-in timers which a MotorModel reads and
+    drives.  The PWM timer plays the part of the motor H-bridge and the encoder
+    timer plays the part of the quadrature decoder.
+    """
+
+    def __init__(self, belt_ratio, pwm_timer=1, encoder_timer=3, pwm_freq=20000,
+                 model=None, pins=None, **model_args):
+        """!
+        Creates the axis, its motor driver and its encoder.
+        @param belt_ratio - the ratio of the belt, output/input
+        @param pwm_timer - the timer number used for the motor PWM
+        @param encoder_timer - the timer number used to count encoder edges
+        @param pwm_freq - the PWM frequency in Hz
+        @param model - a MotorModel to use, by default one is made from model_args
+        @param pins - the names of the (enable, in1, in2, encoder A, encoder B)
+                      pins, to share them with drivers made elsewhere such as
+                      in main.py; by default names are made up from the timers
+        @param model_args - keyword arguments passed on to MotorModel
+        """
+        self.model = model or MotorModel(MOTOR_GEARBOX*belt_ratio, **model_args)
+        # counts per degree of the axis, the same as get_conversion_factor()
+        self.conversion_factor = (COUNTS_PER_TICK*TICKS_PER_REV/360
+                                  * MOTOR_GEARBOX*belt_ratio)
+        self._counts_per_rad = COUNTS_PER_TICK*TICKS_PER_REV/(2*math.pi)
+        self._counts = 0
+        if pins is None:
+            pins = (f"EN{pwm_timer}", f"IN1_{pwm_timer}", f"IN2_{pwm_timer}",
+                    f"ENCA_{encoder_timer}", f"ENCB_{encoder_timer}")
+        self.en_pin = pyb.Pin(pins[0], mode=pyb.Pin.OPEN_DRAIN,
+                              pull=pyb.Pin.PULL_UP, value=1)
+        in1pin = pyb.Pin(pins[1], pyb.Pin.OUT_PP)
+        in2pin = pyb.Pin(pins[2], pyb.Pin.OUT_PP)
+        self.pwm_timer = pyb.Timer(pwm_timer, freq=pwm_freq)
+        self.motor = MotorDriver(self.en_pin, in1pin, in2pin, self.pwm_timer)
+        self.encoder_timer = pyb.Timer(encoder_timer, prescaler=0, period=65535)
+        self.encoder = Encoder(pyb.Pin(pins[3], pyb.Pin.IN),
+                               pyb.Pin(pins[4], pyb.Pin.IN),
+                               self.encoder_timer,
+                               conversion_factor=self.conversion_factor)
+        self._ch1 = self.pwm_timer.channel(1)
+        self._ch2 = self.pwm_timer.channel(2)
+
+    def get_voltage(self):
+        """!
+        This method works out the average voltage the H-bridge is applying
+        from the PWM compare values and the enable pin.
+        @returns the motor voltage in V
+        """
+        if not self.en_pin.value():
+            return 0.0
+        return (self._ch1.duty() - self._ch2.duty())*self.model.supply
+
+    def step(self, dt):
+        """!
+        This method advances the motor model and feeds the new shaft angle to
+        the encoder timer.  It does not move the clock, see simulate().
+        @param dt - the length of the step in s
+        """
+        voltage = self.get_voltage()
+        # a motor at rest with nothing driving it stays at rest
+        if voltage == 0 and self.model.omega == 0:
+            return
+        self.model.step(voltage, dt)
+        counts = int(math.floor(self.model.theta*self._counts_per_rad))
+        if counts != self._counts:
+            # the quadrature decoder counts edges and wraps at the period
+            timer = self.encoder_timer
+            timer.counter(timer.counter() + counts - self._counts)
+            self._counts = counts
+
+    def run(self, steps, dt):
+        """!
+        This method advances the motor model by several steps with the
+        voltage the H-bridge applies at the start, and feeds the encoder timer
+        once at the end.  Nothing can change the PWM or read the encoder in
+        between when no task runs, so this is the same as calling step()
+        steps times, only quicker.
+        @param steps - the number of steps
+        @param dt - the length of each step in s
+        """
+        voltage = self.get_voltage()
+        model = self.model
+        # a motor at rest with nothing driving it stays at rest
+        if steps <= 0 or (voltage == 0 and model.omega == 0):
+            return
+        step = model.step
+        for n in range(steps):
+            step(voltage, dt)
+        counts = int(math.floor(model.theta*self._counts_per_rad))
+        if counts != self._counts:
+            timer = self.encoder_timer
+            timer.counter(timer.counter() + counts - self._counts)
+            self._counts = counts
+
+    def get_angle(self):
+        """!
+        This method returns the true angle of the axis, which differs from the
+        encoder reading by the encoder's zero and its resolution.
+        @returns the axis angle in degrees since the simulation started
+        """
+        return self.model.get_axis_angle()
+
+
+def simulate(axes, duration, dt=0.0005):
+    """!
+    This function runs the plant models for a while and moves the virtual
+    clock along with them.
+    @param axes - a SimulatedAxis or a sequence of them
+    @param duration - how long to simulate for in s
+    @param dt - the physics time step in s
+    """
+    if isinstance(axes, SimulatedAxis):
+        axes = (axes,)
+    steps = max(int(round(duration/dt)), 1)
+    dt_us = int(round(dt*1000000))
+    for n in range(steps):
+        for axis in axes:
+            axis.step(dt)
+        utime.advance_us(dt_us)
+
+
+def step_response(controller, axis, setpoint, duration=2.0, period=0.015, dt=0.0005):
+    """!
+    This function runs a closed loop step response the same way the motor
+    tasks in main.py do: every period the encoder is read, the controller is
+    run and its effort is sent to the motor driver.
+    @param controller - the CLController (or anything with run() and set_setpoint())
+    @param axis - the SimulatedAxis being controlled
+    @param setpoint - the position to step to in degrees
+    @param duration - how long to run for in s
+    @param period - the control task period in s
+    @param dt - the physics time step in s
+    @returns a tuple of lists (times, positions, efforts), one entry per control period
+    """
+    controller.set_setpoint(setpoint)
+    times = []
+    positions = []
+    efforts = []
+    substeps = max(int(round(period/dt)), 1)
+    for n in range(int(round(duration/period))):
+        pos = axis.encoder.read()
+        eff = controller.run(pos)
+        axis.motor.set_duty_cycle(eff)
+        times.append(n*period)
+        positions.append(pos)
+        efforts.append(eff)
+        simulate(axis, substeps*dt, dt)
+    axis.motor.set_duty_cycle(0)
+    return times, positions, efforts
+
+
+def step_metrics(times, positions, start, setpoint, band=0.5):
+    """!
+    This function measures a step response.
+    @param times - the sample times in s
+    @param positions - the measured positions in degrees
+    @param start - the position before the step in degrees
+    @param setpoint - the position stepped to in degrees
+    @param band - how close (degrees) the position must stay to count as settled
+    @returns a tuple (settle_time, overshoot, steady_state_error).  The settle
+             time is in s (None if it never settles), the overshoot is in percent
+             of the step and the steady state error is the mean absolute error
+             over the last tenth of the run in degrees
+    """
+    step = setpoint - start
+    settle_time = None
+    for n in range(len(positions) - 1, -1, -1):
+        if abs(positions[n] - setpoint) > band:
+            if n + 1 < len(positions):
+                settle_time = times[n + 1]
+            break
+    else:
+        settle_time = times[0] if times else None
+    if step != 0:
+        peak = max((p - start)/step for p in positions) if positions else 0
+        overshoot = max(peak - 1, 0)*100
+    else:
+        overshoot = 0.0
+    tail = positions[-max(len(positions)//10, 1):]
+    ss_error = sum(abs(p - setpoint) for p in tail)/len(tail) if tail else 0.0
+    return settle_time, overshoot, ss_error
+
+
+if __name__ == "__main__":
+    import time
+    # the pitch axis from main.py, stepped from its home position to zero
+    axis = SimulatedAxis(4, pwm_timer=4, encoder_timer=2)
+    axis.encoder.set_pos(30)
+    con = CLController(25, 0.1, 2, 0)
+    duration = 10.0
+    starttime = time.perf_counter()
+    t, pos, eff = step_response(con, axis, 0, duration=duration)
+    totaltime = time.perf_counter() - starttime
+    settle, overshoot, ss_err = step_metrics(t, pos, 30, 0)
+    print(f"Settle time: {settle} s, overshoot: {overshoot:.1f} %, "
+          f"steady state error: {ss_err:.3f} deg")
+    print(f"Simulated {duration} s ({len(t)} control periods) in "
+          f"{totaltime*1000:.1f} ms, {duration/totaltime:.0f}x real time")
@@ -0,0 +1,76 @@
+"""!
+@file run.py
+    This file runs a turret script on the PC, unchanged, against the
+    MicroPython stand-ins in host/shims.  The script runs as __main__ just as
+    it does when the board runs it, so its test code at the bottom runs too.
+    By default the virtual clock only moves when the script sleeps; with
+    --real-time it follows the PC's clock (optionally sped up or slowed down),
+    which is what scripts that busy-wait on ticks_ms() need.  --camera puts a
+    simulated MLX90640 on I2C bus 1 which replays recorded images.
+
+    Run the motor driver test, then profile the main program for ten seconds
+    of simulated time:
+    @code
+    python -m host.run motor_drivers/motor_driver.py
+    python -m cProfile -s cumtime -m host.run --real-time 1 --stop 10 --camera test_ims.txt main.py
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-20
+"""
+import os
+import runpy
+import sys
+import host
+host.install()
+
+import utime
+
+
+def run(script, args=(), real_time=None, stop=None, camera=None):
+    """!
+    This function runs a script as __main__ under the stand-in modules.
+    @param script - the path of the script to run
+    @param args - the command line arguments to give the script
+    @param real_time - how fast the clock runs compared to the PC's clock, or
+                       None for a clock which only moves when the script sleeps
+    @param stop - stop the script after this many seconds of virtual time
+    @param camera - a list of image files for a simulated camera to replay
+    @returns the globals the script left behind
+    """
+    if camera:
+        from host.mlx_device import MLX90640Device, read_frames
+        frames = [frame for filename in camera for frame in read_frames(filename)]
+        MLX90640Device(frames, bus_freq=400000).attach()
+    if real_time is not None:
+        utime.follow_real_time(real_time)
+    if stop is not None:
+        end = int(stop*1000000)
+
+        def check(old_us, new_us):
+            if new_us >= end:
+                raise KeyboardInterrupt
+        utime.add_advance_hook(check)
+    # board scripts import their neighbours as top level modules
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    sys.argv = [script, *args]
+    return runpy.run_path(script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a turret script on the PC")
+    parser.add_argument("script", help="the script to run, such as main.py")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the script")
+    parser.add_argument("--real-time", type=float, default=None, metavar="RATE",
+                        help="make the clock follow the PC's clock at this rate")
+    parser.add_argument("--stop", type=float, default=None, metavar="SECONDS",
+                        help="interrupt the script after this much virtual time")
+    parser.add_argument("--camera", action="append", metavar="FILE",
+                        help="replay the images in this file from a simulated camera")
+    args = parser.parse_args()
+    try:
+        run(args.script, args.args, args.real_time, args.stop, args.camera)
+    except KeyboardInterrupt:
+        pass
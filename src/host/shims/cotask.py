@@ -0,0 +1,199 @@
+"""!
+@file cotask.py
+    Host stand-in for the ME405 cotask module (by JR Ridgely), which is not
+    part of this repository.  It has the same Task and TaskList interface and
+    scheduling rules as the board library: a task with a period becomes ready
+    when the clock passes its next run time, a task without one runs only
+    after go() is called, and pri_sched() runs the first ready task of the
+    highest priority, round robin within a priority.  Times come from utime,
+    so on the host they follow the virtual clock.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+import gc
+import utime
+import micropython
+
+
+class Task:
+    """!
+    This class implements a task, a generator function which runs one state
+    of its finite state machine each time it is scheduled.
+    """
+
+    def __init__(self, run_fun, name="NoName", priority=0, period=None,
+                 profile=False, trace=False, shares=()):
+        if shares:
+            self._run_gen = run_fun(shares)
+        else:
+            self._run_gen = run_fun()
+        self.name = name
+        self.priority = int(priority)
+        if period is not None:
+            self.period = int(period*1000)
+            self._next_run = utime.ticks_add(utime.ticks_us(), self.period)
+        else:
+            self.period = period
+            self._next_run = None
+        self._prof = profile
+        self.reset_profile()
+        self._prev_state = 0
+        self._trace = trace
+        self._tr_data = []
+        self._prev_time = utime.ticks_us()
+        self.go_flag = False
+
+    def schedule(self):
+        """!
+        Runs the task once if it is ready.
+        @returns True if the task ran
+        """
+        if self.ready():
+            self.go_flag = False
+            if self._prof:
+                stime = utime.ticks_us()
+            curr_state = next(self._run_gen)
+            if self._prof:
+                self._runs += 1
+                runt = utime.ticks_diff(utime.ticks_us(), stime)
+                # the first couple of runs do setup and aren't counted
+                if self._runs > 2:
+                    self._run_sum += runt
+                    if runt > self._slowest:
+                        self._slowest = runt
+            if self._trace:
+                try:
+                    if curr_state != self._prev_state:
+                        self._tr_data.append(
+                            (utime.ticks_diff(utime.ticks_us(), self._prev_time), curr_state))
+                except MemoryError:
+                    self._trace = False
+                    gc.collect()
+                self._prev_state = curr_state
+            return True
+        return False
+
+    @micropython.native
+    def ready(self):
+        """!
+        Checks whether the task's period has come around or go() was called.
+        @returns True if the task should run
+        """
+        if self.period is not None:
+            late = utime.ticks_diff(utime.ticks_us(), self._next_run)
+            if late > 0:
+                self.go_flag = True
+                self._next_run = utime.ticks_add(self._next_run, self.period)
+                if self._prof:
+                    self._late_sum += late
+                    if late > self._latest:
+                        self._latest = late
+        return self.go_flag
+
+    def set_period(self, new_period):
+        if new_period is None:
+            self.period = None
+        else:
+            self.period = int(new_period)*1000
+
+    def reset_profile(self):
+        self._runs = 0
+        self._run_sum = 0
+        self._slowest = 0
+        self._late_sum = 0
+        self._latest = 0
+
+    def get_trace(self):
+        tr_str = "Task " + self.name + ":"
+        if self._trace:
+            tr_str += "\n"
+            last_state = 0
+            total_time = 0.0
+            for item in self._tr_data:
+                total_time += item[0]/1000000.0
+                tr_str += "{: 12.6f}: {: 2d} -> {:d}\n".format(total_time, last_state, item[1])
+                last_state = item[1]
+        else:
+            tr_str += " not traced"
+        return tr_str
+
+    def go(self):
+        """!
+        Makes the task ready to run; used for tasks without a period.
+        """
+        self.go_flag = True
+
+    def __repr__(self):
+        rst = f"{self.name:<16s}{self.priority: 4d}"
+        try:
+            rst += f"{(self.period/1000.0): 10.1f}"
+        except TypeError:
+            rst += "         -"
+        rst += f"{self._runs: 8d}"
+        if self._prof and self._runs > 0:
+            avg_dur = (self._run_sum/self._runs)/1000.0
+            avg_late = (self._late_sum/self._runs)/1000.0
+            rst += f"{avg_dur: 10.3f}{(self._slowest/1000.0): 10.3f}"
+            if self.period is not None:
+                rst += f"{avg_late: 10.3f}{(self._latest/1000.0): 10.3f}"
+        return rst
+
+
+class TaskList:
+    """!
+    This class implements the list of tasks and the schedulers which run them.
+    The tasks are kept in lists by priority; each list holds the priority,
+    the index of the next task to try, then the tasks.
+    """
+
+    def __init__(self):
+        self.pri_list = []
+
+    def append(self, task):
+        new_pri = task.priority
+        for pri in self.pri_list:
+            if pri[0] == new_pri:
+                pri.append(task)
+                break
+        else:
+            self.pri_list.append([new_pri, 2, task])
+        self.pri_list.sort(key=lambda pri: pri[0], reverse=True)
+
+    @micropython.native
+    def rr_sched(self):
+        """!
+        Runs every ready task once, ignoring priorities.
+        """
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                task.schedule()
+
+    @micropython.native
+    def pri_sched(self):
+        """!
+        Runs the next ready task of the highest priority which has one.
+        """
+        for pri in self.pri_list:
+            tries = 2
+            length = len(pri)
+            while tries < length:
+                ran = pri[pri[1]].schedule()
+                tries += 1
+                pri[1] += 1
+                if pri[1] >= length:
+                    pri[1] = 2
+                if ran:
+                    return
+
+    def __repr__(self):
+        ret_str = "TASK             PRI    PERIOD    RUNS   AVG DUR   MAX DUR  AVG LATE  MAX LATE\n"
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                ret_str += str(task) + "\n"
+        return ret_str
+
+
+## The task list used by the turret program
+task_list = TaskList()
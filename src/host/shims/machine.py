@@ -0,0 +1,92 @@
+"""!
+@file machine.py
+    Host stand-in for the parts of the MicroPython machine module used by the
+    turret.  An I2C bus passes transactions on to whatever device models have
+    been attached to it with attach_device(); talking to an address with
+    nothing attached raises OSError(ENODEV) like the board does.  A device
+    model needs two methods, read(memaddr, nbytes) returning bytes and
+    write(memaddr, buf).
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+import errno
+import pyb
+import utime
+
+Pin = pyb.Pin
+
+## The device models on each bus, {bus id: {address: device}}
+_devices = {}
+
+def attach_device(bus_id, address, device):
+    """!
+    Connects a device model to an I2C bus.  Not part of machine.
+    @param bus_id - the bus number passed to I2C()
+    @param address - the 7-bit address the device answers to
+    @param device - the device model
+    """
+    _devices.setdefault(bus_id, {})[address] = device
+
+def detach_all():
+    """!
+    Removes every device model from every bus.  Not part of machine.
+    """
+    _devices.clear()
+
+
+class I2C:
+    """!
+    This class implements an I2C controller which forwards memory reads and
+    writes to the attached device models.
+    """
+    def __init__(self, bus_id=0, *, scl=None, sda=None, freq=400000, timeout=50000):
+        self.bus_id = bus_id
+        self.freq = freq
+        self.timeout = timeout
+
+    def init(self, *, scl=None, sda=None, freq=400000, timeout=50000):
+        self.freq = freq
+        self.timeout = timeout
+
+    def _device(self, addr):
+        try:
+            return _devices[self.bus_id][addr]
+        except KeyError:
+            raise OSError(errno.ENODEV) from None
+
+    def scan(self):
+        return sorted(_devices.get(self.bus_id, {}))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        return bytes(self._device(addr).read(memaddr, nbytes))
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        buf[:] = self._device(addr).read(memaddr, len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        self._device(addr).write(memaddr, bytes(buf))
+
+
+def freq():
+    return pyb.TIMER_SOURCE_FREQ
+
+def unique_id():
+    return b"host"
+
+def reset():
+    raise SystemExit
+
+def disable_irq():
+    return pyb.disable_irq()
+
+def enable_irq(state=True):
+    pyb.enable_irq(state)
+
+def idle():
+    pass
+
+def lightsleep(ms=None):
+    if ms:
+        utime.sleep_ms(ms)
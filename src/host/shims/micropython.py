@@ -0,0 +1,54 @@
+"""!
+@file micropython.py
+    Host stand-in for the MicroPython micropython module.  The code emitter
+    decorators do nothing and the memory functions report nothing useful.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-20
+"""
+
+def const(value):
+    """!
+    Returns the value unchanged, as const() does outside of the compiler.
+    @param value - the constant
+    """
+    return value
+
+def native(fun):
+    """!
+    Stand-in for the native code emitter decorator.
+    @param fun - the function to decorate
+    """
+    return fun
+
+def viper(fun):
+    """!
+    Stand-in for the viper code emitter decorator.
+    @param fun - the function to decorate
+    """
+    return fun
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+def schedule(fun, arg):
+    """!
+    Runs a scheduled callback straight away, as there are no interrupts on
+    the host to defer it from.
+    @param fun - the callback to run
+    @param arg - the argument passed to the callback
+    """
+    fun(arg)
+
+def heap_lock():
+    return 0
+
+def heap_unlock():
+    return 0
+
+def mem_info(*args):
+    pass
+
+def opt_level(*args):
+    return 0
@@ -0,0 +1,317 @@
+"""!
+@file pyb.py
+    Host stand-in for the parts of the MicroPython pyb module used by the
+    turret.  Pins remember their value and timers remember their registers
+    (prescaler, period, counter and channel compare values) so that a
+    simulation can read what the drivers wrote and write what the hardware
+    would have counted.  Asking for the same timer number twice gives back
+    the same timer, as it does on the board.  Timers count on the virtual
+    utime clock and their callbacks fire as the clock moves past each
+    overflow, except in encoder mode where a simulation sets the count.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-20
+"""
+import utime
+
+## Clock feeding the timers in Hz
+TIMER_SOURCE_FREQ = 80000000
+
+
+class _PinNames:
+    """!
+    Makes names like Pin.cpu.G12 or Pin.board.PC6 evaluate to the pin name.
+    """
+    def __getattr__(self, name):
+        return name
+
+
+class Pin:
+    """!
+    This class implements a GPIO pin which remembers its mode and value.
+    Like timers, every Pin made with the same name is the same pin, so a
+    simulation sees what any driver wrote to it.
+    """
+    cpu = _PinNames()
+    board = _PinNames()
+
+    IN = 0
+    OUT_PP = 1
+    OUT = OUT_PP
+    OUT_OD = 17
+    OPEN_DRAIN = OUT_OD
+    AF_PP = 2
+    AF_OD = 18
+    ALT = AF_PP
+    ALT_OPEN_DRAIN = AF_OD
+    ANALOG = 3
+    PULL_NONE = 0
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 0x10110000
+    IRQ_FALLING = 0x10210000
+
+    ## All of the pins which have been created, by name
+    _pins = {}
+
+    def __new__(cls, pin_id, *args, **kwargs):
+        pin = cls._pins.get(pin_id)
+        if pin is None:
+            pin = super().__new__(cls)
+            pin._value = None
+            cls._pins[pin_id] = pin
+        return pin
+
+    def __init__(self, pin_id, mode=IN, pull=PULL_NONE, value=None, alt=-1):
+        self.id = pin_id
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self._value = 1 if value else 0
+        elif self._value is None:
+            # a pin that was never driven reads its pull
+            self._value = 1 if pull == Pin.PULL_UP else 0
+
+    def init(self, mode=IN, pull=PULL_NONE, value=None, alt=-1):
+        self.__init__(self.id, mode, pull, value, alt)
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+
+    def high(self):
+        self._value = 1
+
+    def low(self):
+        self._value = 0
+
+    on = high
+    off = low
+
+    def name(self):
+        return self.id
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def __repr__(self):
+        return f"Pin({self.id})"
+
+
+class TimerChannel:
+    """!
+    This class implements one channel of a timer.  In the PWM and output
+    compare modes the compare register holds the pulse width in timer counts.
+    """
+    def __init__(self, timer, channel, mode, pin=None, pulse_width=0):
+        self.timer = timer
+        self.channel_num = channel
+        self.mode = mode
+        self.pin = pin
+        self.compare_value = pulse_width
+
+    def pulse_width(self, value=None):
+        if value is None:
+            return self.compare_value
+        self.compare_value = int(value)
+
+    def pulse_width_percent(self, value=None):
+        full = self.timer.period() + 1
+        if value is None:
+            return 100*self.compare_value/full
+        # clamp the same way the board does
+        if value <= 0:
+            self.compare_value = 0
+        elif value >= 100:
+            self.compare_value = full
+        else:
+            self.compare_value = int(value*full/100)
+
+    def duty(self):
+        """!
+        Returns the fraction of each period this channel's output is high.
+        Not part of pyb, this is for simulations to read the PWM output.
+        @returns the duty cycle from 0 to 1
+        """
+        return min(self.compare_value/(self.timer.period() + 1), 1.0)
+
+    compare = pulse_width
+    capture = pulse_width
+
+    def callback(self, fun):
+        self._callback = fun
+
+
+class Timer:
+    """!
+    This class implements a hardware timer.  The counter runs from the
+    virtual clock, or in encoder mode only moves when a plant model drives it
+    through counter().
+    """
+    UP = 0
+    DOWN = 16
+    CENTER = 32
+    PWM = 0
+    PWM_INVERTED = 1
+    OC_TIMING = 2
+    OC_ACTIVE = 3
+    OC_INACTIVE = 4
+    OC_TOGGLE = 5
+    OC_FORCED_ACTIVE = 6
+    OC_FORCED_INACTIVE = 7
+    IC = 8
+    ENC_A = 9
+    ENC_B = 10
+    ENC_AB = 11
+    HIGH = 0
+    LOW = 2
+    RISING = 0
+    FALLING = 2
+    BOTH = 10
+
+    ## All of the timers which have been created, by timer number
+    _timers = {}
+
+    def __new__(cls, timer_id, *args, **kwargs):
+        # the same timer number always refers to the same piece of hardware
+        timer = cls._timers.get(timer_id)
+        if timer is None:
+            timer = super().__new__(cls)
+            timer.id = timer_id
+            timer._prescaler = 0
+            timer._period = 0xFFFF
+            timer._counter = 0
+            timer._start_us = utime.now_us()
+            timer._encoder = False
+            timer._channels = {}
+            timer._callback = None
+            cls._timers[timer_id] = timer
+        return timer
+
+    def __init__(self, timer_id, *, freq=None, prescaler=None, period=None, **kwargs):
+        if freq is not None or prescaler is not None or period is not None:
+            self.init(freq=freq, prescaler=prescaler, period=period, **kwargs)
+
+    def init(self, *, freq=None, prescaler=None, period=None, **kwargs):
+        if freq is not None:
+            # find the smallest prescaler that lets the period fit the timer
+            ticks = int(self.source_freq()/freq)
+            prescaler = 0
+            while ticks//(prescaler + 1) > 0x10000:
+                prescaler += 1
+            period = max(ticks//(prescaler + 1) - 1, 0)
+        if prescaler is not None:
+            self._prescaler = prescaler
+        if period is not None:
+            self._period = period
+        self._counter = 0
+        self._start_us = utime.now_us()
+
+    def deinit(self):
+        self._channels = {}
+        self._callback = None
+
+    def source_freq(self):
+        return TIMER_SOURCE_FREQ
+
+    def freq(self, value=None):
+        if value is None:
+            return self.source_freq()/((self._prescaler + 1)*(self._period + 1))
+        self.init(freq=value)
+
+    def prescaler(self, value=None):
+        if value is None:
+            return self._prescaler
+        self._prescaler = value
+
+    def period(self, value=None):
+        if value is None:
+            return self._period
+        self._period = value
+
+    def _tick_us(self):
+        return (self._prescaler + 1)*1000000/self.source_freq()
+
+    def counter(self, value=None):
+        if value is None:
+            if self._encoder:
+                return self._counter
+            ticks = int((utime.now_us() - self._start_us)/self._tick_us())
+            return (self._counter + ticks) % (self._period + 1)
+        # the count register wraps at the period like the hardware does
+        self._counter = value % (self._period + 1)
+        self._start_us = utime.now_us()
+
+    def channel(self, channel, mode=None, pin=None, **kwargs):
+        if mode is None:
+            return self._channels.get(channel)
+        pulse_width = kwargs.get("pulse_width", kwargs.get("compare", 0))
+        ch = self._channels.get(channel)
+        if ch is None:
+            ch = TimerChannel(self, channel, mode, pin, pulse_width)
+            self._channels[channel] = ch
+        else:
+            # setting a channel up again reconfigures the same hardware
+            ch.__init__(self, channel, mode, pin, pulse_width)
+        if mode in (Timer.ENC_A, Timer.ENC_B, Timer.ENC_AB):
+            # in encoder mode the counter follows the encoder, not the clock
+            self._counter = self.counter()
+            self._encoder = True
+        return ch
+
+    def callback(self, fun):
+        self._callback = fun
+
+    def _advance(self, old_us, new_us):
+        """!
+        Calls the callback once for every overflow between two times.
+        """
+        period_us = self._tick_us()*(self._period + 1)
+        overflows = (int((new_us - self._start_us)//period_us)
+                     - int((old_us - self._start_us)//period_us))
+        # a long jump of the clock would otherwise call back millions of times
+        for n in range(min(overflows, 1000)):
+            if self._callback is None:
+                break
+            self._callback(self)
+
+    def __repr__(self):
+        return f"Timer({self.id}, prescaler={self._prescaler}, period={self._period})"
+
+
+def _advance_timers(old_us, new_us):
+    for timer in Timer._timers.values():
+        if timer._callback is not None and not timer._encoder:
+            timer._advance(old_us, new_us)
+
+utime.add_advance_hook(_advance_timers)
+
+
+def millis():
+    return utime.ticks_ms()
+
+def micros():
+    return utime.ticks_us()
+
+def elapsed_millis(start):
+    return utime.ticks_diff(utime.ticks_ms(), start)
+
+def elapsed_micros(start):
+    return utime.ticks_diff(utime.ticks_us(), start)
+
+def delay(ms):
+    utime.sleep_ms(ms)
+
+def udelay(us):
+    utime.sleep_us(us)
+
+def disable_irq():
+    return True
+
+def enable_irq(state=True):
+    pass
+
+def info(*args):
+    pass
@@ -0,0 +1,151 @@
+"""!
+@file task_share.py
+    Host stand-in for the ME405 task_share module (by JR Ridgely), which is
+    not part of this repository.  Shares hold one value in an array of the
+    given type code and queues hold a ring buffer of them, with the same
+    interface as on the board.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+import array
+import gc
+import pyb
+import micropython
+
+## Every share and queue which has been created, for show_all()
+share_list = []
+
+type_code_strings = {"b": "int8", "B": "uint8", "h": "int16", "H": "uint16",
+                     "i": "int(?)", "I": "uint(?)", "l": "int32", "L": "uint32",
+                     "q": "int64", "Q": "uint64", "f": "float", "d": "double"}
+
+
+def show_all():
+    """!
+    Makes a table of every share and queue, for diagnostics.
+    """
+    gen = (str(item) for item in share_list)
+    return "\n".join(gen)
+
+
+class BaseShare:
+    """!
+    This class implements what shares and queues have in common.
+    """
+
+    def __init__(self, type_code, thread_protect=True, name=None):
+        self._type_code = type_code
+        self._thread_protect = thread_protect
+        share_list.append(self)
+
+
+class Queue(BaseShare):
+    """!
+    This class implements a first in, first out buffer of values.
+    """
+    ser_num = 0
+
+    def __init__(self, type_code, size, thread_protect=False, overwrite=False, name=None):
+        super().__init__(type_code, thread_protect, name)
+        self._size = size
+        self._overwrite = overwrite
+        self._name = str(name) if name is not None else "Queue" + str(Queue.ser_num)
+        Queue.ser_num += 1
+        self._buffer = array.array(type_code, range(size))
+        self.clear()
+        self._max_full = 0
+
+    @micropython.native
+    def put(self, item, in_ISR=False):
+        if self.full():
+            if in_ISR:
+                return
+            if not self._overwrite:
+                while self.full():
+                    pass
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq()
+        self._buffer[self._wr_idx] = item
+        self._wr_idx += 1
+        if self._wr_idx >= self._size:
+            self._wr_idx = 0
+        self._num_items += 1
+        if self._num_items >= self._size:
+            self._num_items = self._size
+        if self._num_items > self._max_full:
+            self._max_full = self._num_items
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq(irq_state)
+
+    @micropython.native
+    def get(self, in_ISR=False):
+        while self.empty():
+            pass
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq()
+        to_return = self._buffer[self._rd_idx]
+        self._rd_idx += 1
+        if self._rd_idx >= self._size:
+            self._rd_idx = 0
+        self._num_items -= 1
+        if self._num_items < 0:
+            self._num_items = 0
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq(irq_state)
+        return to_return
+
+    def any(self):
+        return self._num_items > 0
+
+    def empty(self):
+        return self._num_items <= 0
+
+    def full(self):
+        return self._num_items >= self._size
+
+    def num_in(self):
+        return self._num_items
+
+    def clear(self):
+        self._rd_idx = 0
+        self._wr_idx = 0
+        self._num_items = 0
+
+    def __repr__(self):
+        return (f"{self._name:<16s}: queue<{type_code_strings[self._type_code]}> "
+                f"max full {self._max_full}/{self._size}")
+
+
+class Share(BaseShare):
+    """!
+    This class implements a single value which tasks share.
+    """
+    ser_num = 0
+
+    def __init__(self, type_code, thread_protect=True, name=None):
+        super().__init__(type_code, thread_protect, name)
+        self._buffer = array.array(type_code, [0])
+        self._name = str(name) if name is not None else "Share" + str(Share.ser_num)
+        Share.ser_num += 1
+
+    @micropython.native
+    def put(self, data, in_ISR=False):
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq()
+        self._buffer[0] = data
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq(irq_state)
+
+    @micropython.native
+    def get(self, in_ISR=False):
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq()
+        to_return = self._buffer[0]
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq(irq_state)
+        return to_return
+
+    def __repr__(self):
+        return f"{self._name:<16s}: share<{type_code_strings[self._type_code]}>"
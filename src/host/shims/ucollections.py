@@ -0,0 +1,9 @@
+"""!
+@file ucollections.py
+    Host stand-in for the MicroPython ucollections module.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+from collections import namedtuple, OrderedDict, deque
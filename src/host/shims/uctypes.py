@@ -0,0 +1,141 @@
+"""!
+@file uctypes.py
+    Host stand-in for the MicroPython uctypes module.  Layout descriptors are
+    encoded the same way as on the board (type in the top bits, then bitfield
+    length and position, then the byte offset), and struct() reads and writes
+    the fields straight from and to the bytearray it was given.  There are no
+    raw addresses on the host, so addressof() returns an integer which also
+    carries the buffer it came from.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+import struct as _struct
+
+LITTLE_ENDIAN = 0
+BIG_ENDIAN = 1
+NATIVE = 2
+
+_VAL_TYPE_BITS = 4
+_TYPE_SHIFT = 31 - _VAL_TYPE_BITS
+_OFFSET_BITS = 17
+_BITF_LEN_BITS = 5
+_BITF_OFF_BITS = 5
+
+def _type(value):
+    # the board keeps the type in the top bits of a 31-bit small int, so the
+    # bitfield types come out negative
+    value = value << (32 - _VAL_TYPE_BITS)
+    if value & 0x80000000:
+        value -= 1 << 32
+    return value >> 1
+
+UINT8, INT8, UINT16, INT16, UINT32, INT32, UINT64, INT64 = (_type(n) for n in range(8))
+BFUINT8, BFINT8, BFUINT16, BFINT16, BFUINT32, BFINT32 = (_type(n) for n in range(8, 14))
+FLOAT32 = _type(14)
+FLOAT64 = _type(15)
+VOID = UINT8
+
+BF_POS = _OFFSET_BITS
+BF_LEN = _OFFSET_BITS + _BITF_OFF_BITS
+
+## struct formats and sizes of the scalar types, by type number
+_SCALARS = {0: "B", 1: "b", 2: "H", 3: "h", 4: "I", 5: "i", 6: "Q", 7: "q", 14: "f", 15: "d"}
+## (size in bytes, signed) of the bitfield types, by type number
+_BITFIELDS = {8: (1, False), 9: (1, True), 10: (2, False), 11: (2, True),
+              12: (4, False), 13: (4, True)}
+_ENDIAN = {LITTLE_ENDIAN: "<", BIG_ENDIAN: ">", NATIVE: "="}
+
+
+class _Address(int):
+    """!
+    An address which remembers the buffer it points into.
+    """
+    def __new__(cls, buf):
+        address = super().__new__(cls, id(buf))
+        address.buf = buf
+        return address
+
+
+def addressof(obj):
+    """!
+    Returns the "address" of a buffer, for passing to struct().
+    @param obj - a bytearray or other writable buffer
+    """
+    return _Address(obj)
+
+
+def sizeof(layout, layout_type=NATIVE):
+    if isinstance(layout, struct):
+        layout = object.__getattribute__(layout, "_layout")
+    size = 0
+    for desc in layout.values():
+        kind = (desc >> _TYPE_SHIFT) & 0xF
+        offset = desc & ((1 << _OFFSET_BITS) - 1)
+        width = _BITFIELDS[kind][0] if kind in _BITFIELDS else _struct.calcsize(_SCALARS[kind])
+        size = max(size, offset + width)
+    return size
+
+
+def bytearray_at(addr, size):
+    return memoryview(addr.buf)[:size]
+
+
+def bytes_at(addr, size):
+    return bytes(addr.buf[:size])
+
+
+class struct:
+    """!
+    This class implements a structure laid over a buffer.  Reading an
+    attribute decodes the field from the buffer and writing one encodes it
+    back, so the buffer is always the only copy of the data.
+    """
+    def __init__(self, addr, descriptor, layout_type=NATIVE):
+        object.__setattr__(self, "_buf", addr.buf)
+        object.__setattr__(self, "_layout", descriptor)
+        object.__setattr__(self, "_endian", _ENDIAN[layout_type])
+
+    def _field(self, name):
+        try:
+            desc = object.__getattribute__(self, "_layout")[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        return (desc >> _TYPE_SHIFT) & 0xF, desc & ((1 << _OFFSET_BITS) - 1), desc
+
+    def __getattr__(self, name):
+        kind, offset, desc = self._field(name)
+        buf = object.__getattribute__(self, "_buf")
+        endian = object.__getattribute__(self, "_endian")
+        if kind in _SCALARS:
+            return _struct.unpack_from(endian + _SCALARS[kind], buf, offset)[0]
+        size, signed = _BITFIELDS[kind]
+        raw = int.from_bytes(buf[offset:offset + size], "big" if endian == ">" else "little")
+        pos = (desc >> BF_POS) & ((1 << _BITF_OFF_BITS) - 1)
+        length = (desc >> BF_LEN) & ((1 << _BITF_LEN_BITS) - 1)
+        value = (raw >> pos) & ((1 << length) - 1)
+        if signed and value & (1 << (length - 1)):
+            value -= 1 << length
+        return value
+
+    def __setattr__(self, name, value):
+        kind, offset, desc = self._field(name)
+        buf = object.__getattribute__(self, "_buf")
+        endian = object.__getattribute__(self, "_endian")
+        if kind in _SCALARS:
+            fmt = endian + _SCALARS[kind]
+            if kind not in (14, 15):
+                # stores are truncated to the field width, like the board
+                value = int(value) & ((1 << (8*_struct.calcsize(fmt))) - 1)
+                fmt = fmt.upper() if fmt[-1].islower() else fmt
+            _struct.pack_into(fmt, buf, offset, value)
+            return
+        size, signed = _BITFIELDS[kind]
+        order = "big" if endian == ">" else "little"
+        pos = (desc >> BF_POS) & ((1 << _BITF_OFF_BITS) - 1)
+        length = (desc >> BF_LEN) & ((1 << _BITF_LEN_BITS) - 1)
+        mask = ((1 << length) - 1) << pos
+        raw = int.from_bytes(buf[offset:offset + size], order)
+        raw = (raw & ~mask) | ((int(value) << pos) & mask)
+        buf[offset:offset + size] = raw.to_bytes(size, order)
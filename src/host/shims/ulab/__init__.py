@@ -0,0 +1,9 @@
+"""!
+@file ulab/__init__.py
+    Host stand-in for the ulab package, backed by NumPy.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+from . import numpy
@@ -0,0 +1,27 @@
+"""!
+@file ulab/numpy.py
+    Host stand-in for ulab.numpy.  Everything comes from NumPy, except that
+    array() makes float arrays by default the way ulab does, so that integer
+    images subtract and divide the same way on the PC as on the board.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-21
+"""
+import numpy as _np
+from numpy import *
+from numpy import uint8, int8, uint16, int16, float32
+
+## ulab's name for its float type, which NumPy no longer has
+float = _np.float64
+
+def array(obj, dtype=None, **kwargs):
+    """!
+    Makes an array the way ulab does: lists become float arrays unless a
+    dtype is given, arrays keep their own dtype.
+    @param obj - an iterable or an array
+    @param dtype - the element type of the new array
+    """
+    if dtype is None and not isinstance(obj, _np.ndarray):
+        dtype = float
+    return _np.array(obj, dtype=dtype, **kwargs)
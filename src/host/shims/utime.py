@@ -0,0 +1,133 @@
+"""!
+@file utime.py
+    Host stand-in for the MicroPython utime module.  Time does not pass on its
+    own: the clock is virtual and only moves when a sleep is called or when a
+    simulation advances it with advance_us() or advance_ms().  It can also be
+    told to follow the PC's clock with follow_real_time(), for running the
+    turret program as-is.  The ticks functions wrap the same way they do on
+    the board.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-20
+"""
+import time as _time
+
+## The ticks counters wrap at this value, as on the board
+TICKS_PERIOD = 1 << 30
+_TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+## The virtual time since reset in microseconds
+_now_us = 0
+## Functions called with (old time, new time) whenever the clock moves
+_hooks = []
+## (PC time, virtual time, rate) when following the PC's clock, else None
+_follow = None
+
+def add_advance_hook(fun):
+    """!
+    Registers a function to be called as fun(old_us, new_us) every time the
+    clock moves, which is how timer callbacks are made to fire.
+    @param fun - the function to call
+    """
+    _hooks.append(fun)
+
+def remove_advance_hook(fun):
+    """!
+    Unregisters a function added with add_advance_hook().
+    @param fun - the function to stop calling
+    """
+    if fun in _hooks:
+        _hooks.remove(fun)
+
+def _move_to(us):
+    global _now_us
+    old = _now_us
+    _now_us = us
+    for fun in _hooks:
+        fun(old, us)
+
+def _sync():
+    if _follow is not None:
+        host_start, start, rate = _follow
+        now = start + int((_time.perf_counter() - host_start)*1000000*rate)
+        if now > _now_us:
+            _move_to(now)
+
+def follow_real_time(rate=1.0):
+    """!
+    Makes the clock run by itself, following the PC's clock.
+    @param rate - how many virtual seconds pass per real second, or None to
+                  go back to a clock which only moves when told to
+    """
+    global _follow
+    _sync()
+    _follow = None if rate is None else (_time.perf_counter(), _now_us, rate)
+
+def advance_us(us):
+    """!
+    Moves the virtual clock forward.
+    @param us - the number of microseconds to advance by
+    """
+    global _follow
+    _sync()
+    _move_to(_now_us + int(us))
+    if _follow is not None:
+        # a sleep jumps ahead instead of waiting for the PC to catch up
+        _follow = (_time.perf_counter(), _now_us, _follow[2])
+
+def advance_ms(ms):
+    """!
+    Moves the virtual clock forward.
+    @param ms - the number of milliseconds to advance by
+    """
+    advance_us(ms*1000)
+
+def now_us():
+    """!
+    Returns the unwrapped virtual time, for use by simulations.
+    @returns the time since reset in microseconds
+    """
+    _sync()
+    return _now_us
+
+def reset(us=0):
+    """!
+    Sets the virtual clock back to a given time.
+    @param us - the time to reset the clock to in microseconds
+    """
+    global _now_us, _follow
+    _now_us = int(us)
+    if _follow is not None:
+        _follow = (_time.perf_counter(), _now_us, _follow[2])
+
+def ticks_us():
+    _sync()
+    return _now_us & _TICKS_MAX
+
+def ticks_ms():
+    _sync()
+    return (_now_us // 1000) & _TICKS_MAX
+
+def ticks_cpu():
+    return ticks_us()
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+def time():
+    _sync()
+    return _now_us // 1000000
+
+def sleep(seconds):
+    advance_us(seconds*1000000)
+
+def sleep_ms(ms):
+    advance_us(ms*1000)
+
+def sleep_us(us):
+    advance_us(us)
@@ -0,0 +1,199 @@
+"""!
+@file sysid.py
+    This file fits a motor model to a step response log written by the
+    StepLogger in motor_drivers/step_logger.py.  The axis velocity is modeled
+    as a first order (gain and time constant) or second order (gain, natural
+    frequency and damping) response to the motor effort, with a dry friction
+    term, and the model is fit by linear least squares over the whole log at
+    once.  The fit gives controller gains for a chosen damping directly and
+    can be written out as MotorModel parameters for host/plant.py and
+    host/tuner.py.
+
+    Fit a log from the pitch axis (belt ratio 4) and save the fit:
+    @code
+    python -m host.sysid step_log.bin --belt-ratio 4 --out pitch_fit.json
+    python -m host.tuner pitch --plant pitch_fit.json
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-20
+"""
+import json
+import math
+import struct
+from collections import namedtuple
+import numpy as np
+
+## Must match LOG_MAGIC in motor_drivers/step_logger.py
+LOG_MAGIC = b"STEP"
+## ticks_us() on the board wraps at this value
+TICKS_PERIOD = 1 << 30
+## The motor gearbox ratio, as in get_conversion_factor() in main.py
+MOTOR_GEARBOX = 16
+
+## The time, setpoint, position and effort columns of a step log
+StepLog = namedtuple("StepLog", ("t", "setpoint", "position", "effort"))
+
+## A fitted velocity model.  gain is in (deg/s)/% effort, tau in s, wn in rad/s
+#  and friction in % effort.  For a first order fit zeta and wn are None and for
+#  a second order fit tau is the equivalent first order time constant 2*zeta/wn.
+MotorFit = namedtuple("MotorFit", ("order", "gain", "tau", "zeta", "wn", "friction",
+                                   "dt", "r_squared"))
+
+
+def load_log(filename):
+    """!
+    This function reads a binary step log.
+    @param filename - the log file written by StepLogger.dump()
+    @returns a StepLog of numpy arrays, with time in seconds from the first sample
+    """
+    with open(filename, "rb") as file:
+        raw = file.read()
+    magic, count = struct.unpack_from("<4sI", raw)
+    if magic != LOG_MAGIC:
+        raise ValueError(f"{filename} is not a step log")
+    ticks = np.frombuffer(raw, dtype="<i4", count=count, offset=8).astype(np.int64)
+    data = np.frombuffer(raw, dtype="<f4", count=3*count, offset=8 + 4*count)
+    data = data.reshape(count, 3).astype(np.float64)
+    # undo the ticks wraparound before converting to seconds
+    steps = np.diff(ticks) % TICKS_PERIOD
+    t = np.concatenate(([0], np.cumsum(steps)))/1e6
+    return StepLog(t, data[:, 0], data[:, 1], data[:, 2])
+
+
+def _resample(log, dt=None):
+    """!
+    This function puts a log on an evenly spaced time grid and works out the
+    velocity by differencing the position.
+    @returns a tuple (dt, velocity, effort) where velocity[k] is the mean
+             velocity between samples k and k+1
+    """
+    if dt is None:
+        dt = float(np.median(np.diff(log.t)))
+    t = np.arange(log.t[0], log.t[-1], dt)
+    pos = np.interp(t, log.t, log.position)
+    # the drivers saturate the effort at +/-100%
+    eff = np.clip(np.interp(t, log.t, log.effort), -100, 100)
+    vel = np.diff(pos)/dt
+    return dt, vel, eff[:-1]
+
+
+def _r_squared(target, fitted):
+    residual = np.sum((target - fitted)**2)
+    total = np.sum((target - np.mean(target))**2)
+    return float(1 - residual/total) if total > 0 else 0.0
+
+
+def fit_first_order(log, dt=None):
+    """!
+    This function fits w[k+1] = a*w[k] + b*u[k] + c*sign(w[k]) to the log,
+    where w is the axis velocity and u the effort, and converts it to a
+    continuous time gain and time constant.
+    @param log - a StepLog
+    @param dt - the sample time to resample to, default the median log spacing
+    @returns a MotorFit
+    """
+    dt, vel, eff = _resample(log, dt)
+    regressors = np.column_stack((vel[:-1], eff[:-1], np.sign(vel[:-1])))
+    target = vel[1:]
+    (a, b, c), *_ = np.linalg.lstsq(regressors, target, rcond=None)
+    a, b, c = float(a), float(b), float(c)
+    gain = b/(1 - a)
+    tau = -dt/math.log(a) if 0 < a < 1 else float("nan")
+    return MotorFit(1, gain, tau, None, None, -c/b, dt,
+                    _r_squared(target, regressors @ (a, b, c)))
+
+
+def fit_second_order(log, dt=None):
+    """!
+    This function fits w[k+1] = a1*w[k] + a2*w[k-1] + b*u[k] + c*sign(w[k])
+    to the log and converts the discrete poles to a natural frequency and
+    damping ratio.
+    @param log - a StepLog
+    @param dt - the sample time to resample to, default the median log spacing
+    @returns a MotorFit
+    """
+    dt, vel, eff = _resample(log, dt)
+    regressors = np.column_stack((vel[1:-1], vel[:-2], eff[1:-1], np.sign(vel[1:-1])))
+    target = vel[2:]
+    (a1, a2, b, c), *_ = np.linalg.lstsq(regressors, target, rcond=None)
+    a1, a2, b, c = float(a1), float(a2), float(b), float(c)
+    gain = b/(1 - a1 - a2)
+    # map the discrete poles back to the s plane
+    poles = np.log(np.roots((1, -a1, -a2)).astype(complex))/dt
+    wn = math.sqrt(abs(poles[0]*poles[1]))
+    zeta = -float(np.real(poles[0] + poles[1]))/(2*wn)
+    return MotorFit(2, gain, 2*zeta/wn, zeta, wn, -c/b, dt,
+                    _r_squared(target, regressors @ (a1, a2, b, c)))
+
+
+def design_gains(fit, zeta=0.9, wn=None, period=0.015):
+    """!
+    This function picks PD gains for a position loop around the fitted axis,
+    treated as gain/(s*(tau*s + 1)).  With kp alone the damping ratio sets the
+    gain.  If a closed loop natural frequency is also given, a derivative gain
+    is added to reach it.
+    @param fit - a MotorFit
+    @param zeta - the closed loop damping ratio wanted
+    @param wn - the closed loop natural frequency wanted in rad/s, optional
+    @param period - the control task period in s, used to convert kd to
+                    CLController units
+    @returns a tuple (kp, kd) for CLController
+    """
+    if wn is None:
+        # tau*s^2 + s + gain*kp, damping ratio 1/(2*sqrt(tau*gain*kp))
+        return 1/(4*zeta*zeta*fit.tau*fit.gain), 0.0
+    # tau*s^2 + (1 + gain*kd)*s + gain*kp
+    kp = fit.tau*wn*wn/fit.gain
+    kd = max((2*zeta*wn*fit.tau - 1)/fit.gain, 0.0)
+    # CLController takes the error slope over its last 10 errors as
+    # (e[9] - e[0])/100, which is the error rate in deg/s times 9*period/100
+    return kp, kd*100/(9*period)
+
+
+def model_args(fit, belt_ratio, supply=12.0, resistance=2.5):
+    """!
+    This function works out MotorModel parameters that reproduce the fit, for
+    use by host/plant.py and host/tuner.py.  The armature resistance can't be
+    told apart from the other constants by a velocity fit, so it is assumed.
+    @param fit - a MotorFit
+    @param belt_ratio - the ratio of the belt, output/input
+    @param supply - the H-bridge supply voltage in V
+    @param resistance - the armature resistance to assume in ohms
+    @returns a dictionary of keyword arguments for MotorModel
+    """
+    ratio = MOTOR_GEARBOX*belt_ratio
+    # steady state axis speed is degrees(supply*u/100/k_motor)/ratio
+    k_motor = math.degrees(supply/100)/(fit.gain*ratio)
+    inertia = fit.tau*k_motor*k_motor/resistance
+    coulomb = k_motor*supply*abs(fit.friction)/100/resistance
+    return {"supply": supply, "resistance": resistance, "k_motor": k_motor,
+            "j_motor": inertia, "j_load": 0.0, "viscous": 0.0, "coulomb": coulomb}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Fit a motor model to a step response log")
+    parser.add_argument("log", help="binary log from StepLogger.dump()")
+    parser.add_argument("--order", type=int, choices=(1, 2), default=1)
+    parser.add_argument("--belt-ratio", type=float, default=1, help="belt ratio, output/input")
+    parser.add_argument("--zeta", type=float, default=0.9, help="closed loop damping ratio")
+    parser.add_argument("--wn", type=float, default=None, help="closed loop natural frequency in rad/s")
+    parser.add_argument("--period", type=float, default=0.015, help="control task period in s")
+    parser.add_argument("--out", help="JSON file to write the fit and model parameters to")
+    args = parser.parse_args()
+
+    log = load_log(args.log)
+    fit = (fit_first_order if args.order == 1 else fit_second_order)(log)
+    kp, kd = design_gains(fit, args.zeta, args.wn, args.period)
+    print(f"{len(log.t)} samples over {log.t[-1]:.3f} s, fit at dt = {fit.dt*1000:.2f} ms")
+    print(f"gain {fit.gain:.3f} (deg/s)/%, tau {fit.tau*1000:.1f} ms, "
+          f"friction {fit.friction:.2f} %, R^2 {fit.r_squared:.4f}")
+    if fit.order == 2:
+        print(f"wn {fit.wn:.2f} rad/s, zeta {fit.zeta:.3f}")
+    print(f"suggested gains: kp {kp:.3f}, kd {kd:.3f}")
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump({"fit": fit._asdict(), "kp": kp, "kd": kd,
+                       "model_args": model_args(fit, args.belt_ratio)}, file, indent=2)
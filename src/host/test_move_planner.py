@@ -0,0 +1,110 @@
+"""!
+@file test_move_planner.py
+    Tests of the move planner: every profile it plans, including ones
+    replanned part way through a move, keeps inside the velocity and
+    acceleration limits, starts where and how fast the axis was going and
+    ends at rest on the target on time.  Run from the src directory:
+    @code
+    python -m pytest -q host/test_move_planner.py
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+import random
+import utime
+from motor_drivers.move_planner import AxisProfile, MovePlanner
+
+VMAX = 120
+AMAX = 600
+## How far a profile may stray from a limit or a target through rounding
+EPSILON = 1e-6
+
+
+def check_profile(profile, start, target, velocity, duration):
+    assert abs(profile.position(0) - start) < EPSILON
+    if duration > 0:
+        assert abs(profile.velocity(0) - velocity) < EPSILON
+    assert abs(profile.position(duration) - target) < EPSILON
+    assert profile.velocity(duration) == 0
+    # the acceleration is constant in each segment, so the velocity is
+    # largest at one end of one of them
+    end = 0.0
+    for n in range(profile._count):
+        begin = end
+        end = profile._ends[n]
+        assert abs(profile._accels[n]) <= AMAX + EPSILON
+        for v in (profile._velocities[n], profile._velocities[n] + profile._accels[n]*(end - begin)):
+            assert abs(v) <= max(VMAX, abs(velocity)) + EPSILON
+    assert end <= duration + EPSILON
+    # and the segments join up with the move, so it arrives at rest on time
+    if profile._count:
+        n = profile._count - 1
+        begin = profile._ends[n - 1] if n else 0.0
+        length = profile._ends[n] - begin
+        v = profile._velocities[n]
+        last = profile._positions[n] + v*length + 0.5*profile._accels[n]*length*length
+        assert abs(last - target) < 1e-4
+        assert abs(v + profile._accels[n]*length) < 1e-4
+
+
+def test_random_replans_keep_to_limits():
+    rng = random.Random(405)
+    profile = AxisProfile(VMAX, AMAX)
+    for n in range(20000):
+        start = rng.uniform(-180, 180)
+        target = rng.choice((start, rng.uniform(-180, 180)))
+        velocity = rng.choice((0, rng.uniform(-VMAX, VMAX)))
+        duration = profile.min_time(target - start, velocity)*rng.choice((1, rng.uniform(1, 3)))
+        profile.plan(start, target, duration, velocity)
+        check_profile(profile, start, target, velocity, duration)
+
+
+def test_replan_mid_move_reversing():
+    utime.reset()
+    planner = MovePlanner(VMAX, AMAX, VMAX, AMAX)
+    planner.plan(90, 30)
+    utime.advance_ms(300)
+    yaw_start = planner.get_yaw_setpoint()
+    yaw_vel = planner.yaw.velocity(0.3)
+    assert yaw_vel > 0
+    # turn back past where it started while still heading the other way
+    arrival = planner.plan(-45, 30)
+    duration = utime.ticks_diff(arrival, utime.ticks_ms())/1000
+    check_profile(planner.yaw, yaw_start, -45, yaw_vel, planner.yaw.duration)
+    assert planner.yaw.duration <= duration
+    assert abs(planner.get_yaw_setpoint() - yaw_start) < EPSILON
+    utime.advance_ms(int(duration*1000) + 1)
+    assert planner.get_yaw_setpoint() == -45
+    assert planner.time_to_arrival() < 0
+
+
+def test_replan_to_current_position():
+    utime.reset()
+    planner = MovePlanner(VMAX, AMAX, VMAX, AMAX, 10, -5)
+    arrival = planner.plan(10, -5)
+    assert arrival == utime.ticks_ms()
+    assert planner.predicted_errors(10, 0, -5, 0, 40) == (0, 0)
+    # moving, a new target where the axis is now means stopping and coming back
+    planner.plan(60, -5)
+    utime.advance_ms(200)
+    here = planner.get_yaw_setpoint()
+    yaw_vel = planner.yaw.velocity(0.2)
+    planner.plan(here, -5)
+    check_profile(planner.yaw, here, here, yaw_vel, planner.yaw.duration)
+    assert planner.yaw.duration > 0
+
+
+def test_predicted_errors_on_profile():
+    utime.reset()
+    planner = MovePlanner(VMAX, AMAX, VMAX, AMAX)
+    planner.plan(40, 10)
+    utime.advance_ms(100)
+    t = 0.1
+    # an axis following the profile exactly is predicted to be where the
+    # profile will be
+    yaw_err, pitch_err = planner.predicted_errors(planner.yaw.position(t), planner.yaw.velocity(t),
+                                                  planner.pitch.position(t), planner.pitch.velocity(t), 40)
+    assert abs(yaw_err - (40 - planner.yaw.position(t + 0.04))) < EPSILON
+    assert abs(pitch_err - (10 - planner.pitch.position(t + 0.04))) < EPSILON
@@ -0,0 +1,157 @@
+"""!
+@file test_shared_record.py
+    Tests of the shared record: a write that fails leaves the record as it
+    was, readable and with interrupts on, a read that a write in an
+    interrupt gets into reads again, and only a write which changes a field
+    wakes the tasks waiting on it.  Run from the src directory:
+    @code
+    python -m pytest -q host/test_shared_record.py
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+import struct
+import pyb
+import pytest
+from shared_record import SharedRecord
+
+
+class Waiter:
+    # stands in for a task, counting the times it is woken
+    def __init__(self):
+        self.runs = 0
+
+    def go(self):
+        self.runs += 1
+
+
+class Irq:
+    # stands in for the interrupt switch, keeping track of whether they are off
+    def __init__(self):
+        self.off = 0
+
+    def disable(self):
+        self.off += 1
+        return True
+
+    def enable(self, state=True):
+        self.off -= 1
+
+
+@pytest.fixture
+def irq(monkeypatch):
+    irq = Irq()
+    monkeypatch.setattr(pyb, "disable_irq", irq.disable)
+    monkeypatch.setattr(pyb, "enable_irq", irq.enable)
+    return irq
+
+
+def make_status():
+    return SharedRecord((("run", "B"), ("yaw_done", "B"), ("pitch_done", "B"),
+                         ("returning", "B")), name="Test status")
+
+
+def make_setpoints():
+    return SharedRecord((("yaw", "f"), ("pitch", "f"), ("arrival", "L")), name="Test setpoints")
+
+
+def test_put_and_get():
+    record = make_setpoints()
+    assert record.get() == (0.0, 0.0, 0)
+    record.put(12.5, -4.0, 1000)
+    assert record.get() == (12.5, -4.0, 1000)
+    assert record.get("pitch") == -4.0
+    # as stored, rounded to a float
+    record.put(0.1, 0.0, 0)
+    assert record.get("yaw") == struct.unpack("<f", struct.pack("<f", 0.1))[0]
+
+
+def test_set_leaves_other_fields():
+    record = make_status()
+    record.put(1, 0, 0, 0)
+    record.set("yaw_done", 1, "pitch_done", 1)
+    assert record.get() == (1, 1, 1, 0)
+    assert record.get("returning") == 0
+
+
+def test_failed_writes_leave_record(irq):
+    record = make_status()
+    record.put(1, 1, 0, 0)
+    seq = record._seq
+    with pytest.raises(KeyError):
+        record.set("yaw_done", 0, "fired", 1)
+    with pytest.raises(struct.error):
+        record.set("yaw_done", 0, "pitch_done", 256)
+    with pytest.raises(struct.error):
+        record.put(0, 0, 0, -1)
+    with pytest.raises(struct.error):
+        record.put(0, 0)
+    assert irq.off == 0
+    assert record._seq == seq
+    assert record.get() == (1, 1, 0, 0)
+    record.set("returning", 1)
+    assert record.get() == (1, 1, 0, 1)
+    assert irq.off == 0
+
+
+def test_unknown_field():
+    record = make_status()
+    with pytest.raises(KeyError):
+        record.get("fired")
+    with pytest.raises(KeyError):
+        record.wake(Waiter(), "fired")
+
+
+def test_read_again_after_write_in_interrupt(irq):
+    record = make_setpoints()
+    record.put(10.0, 20.0, 100)
+
+    class Interrupted(list):
+        # a write in an interrupt gets in while a read copies the values
+        writes = 0
+
+        def __iter__(self):
+            if not Interrupted.writes:
+                Interrupted.writes += 1
+                record.put(30.0, 40.0, 200, in_ISR=True)
+            return super().__iter__()
+
+    record._values = Interrupted(record._values)
+    assert record.get() == (30.0, 40.0, 200)
+    assert Interrupted.writes == 1
+    assert irq.off == 0
+
+
+def test_wakes_on_changed_fields():
+    record = make_status()
+    done = Waiter()
+    anything = Waiter()
+    record.wake(done, "yaw_done", "pitch_done")
+    record.wake(anything)
+    record.set("run", 1)
+    assert (done.runs, anything.runs) == (0, 1)
+    record.set("yaw_done", 1)
+    assert (done.runs, anything.runs) == (1, 2)
+    # the same values again change nothing
+    record.set("yaw_done", 1, "run", 1)
+    record.put(1, 1, 0, 0)
+    assert (done.runs, anything.runs) == (1, 2)
+    # woken once however many of its fields change
+    record.put(1, 0, 1, 0)
+    assert (done.runs, anything.runs) == (2, 3)
+    record.ignore(done)
+    record.set("pitch_done", 0)
+    assert (done.runs, anything.runs) == (2, 4)
+
+
+def test_float_rounding_to_same_value_wakes_nobody():
+    record = make_setpoints()
+    waiter = Waiter()
+    record.put(0.1, 0.0, 0)
+    record.wake(waiter, "yaw")
+    record.put(0.1 + 1e-12, 0.0, 0)
+    assert waiter.runs == 0
+    record.set("yaw", 0.2)
+    assert waiter.runs == 1
@@ -0,0 +1,115 @@
+"""!
+@file test_shims.py
+    Tests that the host shims behave like the board where the turret code
+    depends on them: uctypes bitfields decode the MLX90640 registers as the
+    datasheet lays them out, an encoder timer's count wraps at 16 bits and
+    the utime ticks wrap as they do on the board.  Run from the src
+    directory:
+    @code
+    python -m pytest -q host/test_shims.py
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+import pyb
+import uctypes
+import utime
+from bench import FakeBus
+from mlx90640.regmap import RegisterMap, CameraInterface, REGISTER_MAP, EEPROM_MAP
+from motor_drivers.encoder_reader import Encoder
+
+
+def make_registers(words, register_map=REGISTER_MAP):
+    bus = FakeBus()
+    bus.words.update(words)
+    return bus, RegisterMap(CameraInterface(bus, 0x33), register_map)
+
+
+def test_control_register_decodes():
+    # 0x1901 is the power-on value: subpages on, 2 Hz, 18 bits, chess pattern
+    bus, registers = make_registers({0x800D: 0x1901})
+    assert registers["subpage_enable"] == 1
+    assert registers["data_hold"] == 0
+    assert registers["subpage_repeat"] == 0
+    assert registers["repeat_select"] == 0
+    assert registers["refresh_rate"] == 2
+    assert registers["adc_resolution"] == 2
+    assert registers["read_pattern"] == 1
+
+
+def test_control_register_write_keeps_other_fields():
+    bus, registers = make_registers({0x800D: 0x1901})
+    registers["refresh_rate"] = 4
+    assert bus.words[0x800D] == 0x1A01
+    registers["read_pattern"] = 0
+    assert bus.words[0x800D] == 0x0A01
+
+
+def test_status_and_byte_fields_decode():
+    bus, registers = make_registers({0x8000: 0x0009, 0x8010: 0xBE33})
+    assert registers["last_subpage"] == 1
+    assert registers["data_available"] == 1
+    assert registers["overwrite_enable"] == 0
+    assert registers["i2c_address"] == 0x33
+
+
+def test_signed_fields_decode():
+    # kv_ptat is the top 6 bits and kt_ptat the low 10, both two's complement
+    bus, registers = make_registers({0x070A: 0xFFFE})
+    assert registers["gain"] == -2
+    bus, registers = make_registers({0x2432: 0xFE01}, EEPROM_MAP)
+    assert registers["kv_ptat"] == -1
+    assert registers["kt_ptat"] == -511
+
+
+def test_uctypes_byte_order():
+    buf = bytearray(b"\x12\x34")
+    layout = {"word": uctypes.UINT16 | 0,
+              "low": uctypes.BFUINT16 | 0 | 0 << uctypes.BF_POS | 4 << uctypes.BF_LEN}
+    big = uctypes.struct(uctypes.addressof(buf), layout, uctypes.BIG_ENDIAN)
+    little = uctypes.struct(uctypes.addressof(buf), layout, uctypes.LITTLE_ENDIAN)
+    assert big.word == 0x1234
+    assert big.low == 0x4
+    assert little.word == 0x3412
+    assert little.low == 0x2
+
+
+def test_encoder_counter_wraps_at_16_bits():
+    timer = pyb.Timer(8, prescaler=0, period=65535)
+    timer.channel(1, pyb.Timer.ENC_AB)
+    encoder = Encoder(pyb.Pin(pyb.Pin.cpu.C6, pyb.Pin.IN), pyb.Pin(pyb.Pin.cpu.C7, pyb.Pin.IN),
+                      timer, conversion_factor=1)
+    timer.counter(65534)
+    encoder.read()
+    start = encoder.pos
+    timer.counter(timer.counter() + 5)
+    assert timer.counter() == 3
+    encoder.read()
+    assert encoder.pos - start == 5
+    timer.counter(timer.counter() - 10)
+    assert timer.counter() == 65529
+    encoder.read()
+    assert encoder.pos - start == -5
+
+
+def test_free_running_timer_wraps_at_period():
+    utime.reset()
+    timer = pyb.Timer(14, prescaler=79, period=999)
+    assert timer.counter() == 0
+    utime.advance_us(1500)
+    assert timer.counter() == 500
+
+
+def test_ticks_wrap():
+    top = utime.TICKS_PERIOD - 10
+    assert utime.ticks_add(top, 20) == 10
+    assert utime.ticks_diff(10, top) == 20
+    assert utime.ticks_diff(top, 10) == -20
+    utime.reset((utime.TICKS_PERIOD - 1)*1000)
+    before = utime.ticks_ms()
+    utime.advance_ms(2)
+    assert utime.ticks_ms() == 1
+    assert utime.ticks_diff(utime.ticks_ms(), before) == 2
+    utime.reset()
@@ -0,0 +1,52 @@
+"""!
+@file test_smoke.py
+    Smoke tests for the host shims: the turret modules import through them
+    and one engagement of main.py's tasks runs from start to shot.  Run from
+    the src directory, where conftest.py installs the shims:
+    @code
+    python -m pytest -q
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+import importlib
+import os
+import host
+
+
+def test_modules_import():
+    for name in ("mlx90640", "mlx90640.image", "mlx_cam", "motor_drivers.encoder_reader",
+                 "motor_drivers.motor_driver", "motor_drivers.controller",
+                 "motor_drivers.servo_driver", "motor_drivers.move_planner",
+                 "cam2setpoint", "cam2turret", "main"):
+        importlib.import_module(name)
+
+
+def test_cam2setpoint_finds_person():
+    from ulab import numpy as np
+    from cam2setpoint import cam2setpoint
+    from host.mlx_device import read_frames
+    label, frame = read_frames(os.path.join(host.SRC_DIR, "new_test_ims.txt"))[2]
+    target = cam2setpoint(np.array(frame, dtype=np.uint8))
+    assert target is not None, label
+
+
+def test_engagement_fires():
+    from host.engagement import EngagementRunner
+    from host.mlx_device import read_frames
+    label, frame = read_frames(os.path.join(host.SRC_DIR, "new_test_ims.txt"))[2]
+    result = EngagementRunner(timeout=5.0).run(frame, label)
+    assert result.fire_time is not None
+    assert abs(result.yaw_error) < 1 and abs(result.pitch_error) < 1
+    assert sum(result.misses.values()) == 0
+
+
+def test_engagement_holds_fire_without_target():
+    from host.engagement import EngagementRunner
+    from host.mlx_device import read_frames
+    label, frame = read_frames(os.path.join(host.SRC_DIR, "blank_ims.txt"))[0]
+    result = EngagementRunner(timeout=20.0, shots=0).run(frame, label)
+    assert result.fire_time is None
+    assert result.end_time < 20000
@@ -0,0 +1,132 @@
+"""!
+@file test_target_queue.py
+    Tests of the target queue for engaging more than one person: it is
+    loaded in greedy least-slew order, follows the target being engaged and
+    runs out after the last one, and in main.py each target gets its own
+    time limit and nothing is shot while the queue is empty.  Run from the
+    src directory:
+    @code
+    python -m pytest -q host/test_target_queue.py
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+import os
+import host
+import main
+from motor_drivers.move_planner import MovePlanner
+from target_queue import TargetQueue, TRACK_TIME
+
+VMAX = 120
+AMAX = 600
+
+
+def make_queue(size=3, pitch_scale=1):
+    return TargetQueue(MovePlanner(VMAX, AMAX, VMAX/pitch_scale, AMAX/pitch_scale), size)
+
+
+def queued(queue):
+    return [(queue.yaw[n], queue.pitch[n]) for n in range(queue.count)]
+
+
+def test_load_orders_greedily():
+    queue = make_queue()
+    # nearest the turret first, then nearest that, not nearest the turret
+    assert queue.load([(-10, 0), (12, 0), (-30, 0)], 0, 0) == (-10, 0)
+    assert queued(queue) == [(-10, 0), (-30, 0), (12, 0)]
+    assert queue.loaded()
+    assert queue.index == 0
+
+
+def test_load_orders_by_slower_axis():
+    # pitch is four times slower, so 10 degrees of pitch takes longer than
+    # 20 of yaw
+    queue = make_queue(pitch_scale=4)
+    queue.load([(0, 10), (20, 0)], 0, 0)
+    assert queued(queue) == [(20, 0), (0, 10)]
+
+
+def test_load_leaves_out_targets_past_size():
+    queue = make_queue(size=2)
+    queue.load([(30, 0), (20, 0), (10, 0)], 0, 0)
+    assert queued(queue) == [(20, 0), (30, 0)]
+
+
+def test_advance_runs_out():
+    queue = make_queue()
+    queue.load([(10, 0), (20, 0)], 0, 0)
+    assert queue.advance() == (20, 0)
+    assert queue.advance() is None
+    assert queue.advance() is None
+    assert queue.index == queue.count == 2
+    assert queue.track([(20, 0)]) is None
+    queue.reset()
+    assert not queue.loaded()
+    assert queue.current() is None
+
+
+def test_empty_queue():
+    queue = make_queue()
+    assert queue.load([], 0, 0) is None
+    assert not queue.loaded()
+    assert queue.advance() is None
+    assert queue.track([(10, 0)]) is None
+
+
+def test_track_follows_nearest():
+    queue = make_queue()
+    queue.load([(10, 0), (40, 0)], 0, 0)
+    yaw, pitch = queue.track([(40, 0), (11, 0.5), (10.5, 0.25)])
+    assert abs(yaw - 10.5) < 1e-6 and abs(pitch - 0.25) < 1e-6
+    # too far to slew in TRACK_TIME, so someone else
+    far = 10.5 + VMAX*TRACK_TIME
+    yaw, pitch = queue.track([(far, 0)])
+    assert abs(yaw - 10.5) < 1e-6
+    # the rest of the queue stays put
+    assert queue.advance() == (40, 0)
+
+
+def two_person_scene():
+    from host.engagement import make_scene
+    from host.mlx_device import read_frames
+    frames = read_frames(os.path.join(host.SRC_DIR, "new_test_ims.txt"))
+    return make_scene(frames, ["jojo left", "jojo right"])
+
+
+def test_engagement_shoots_each_target(monkeypatch):
+    from host.engagement import EngagementRunner
+    monkeypatch.setattr(main, "ENGAGE_TARGETS", 3)
+    label, scene = two_person_scene()
+    result = EngagementRunner(timeout=20.0, shots=0).run(scene, label)
+    assert len(result.shots) == 2
+    for fire_time, yaw_error, pitch_error in result.shots:
+        assert abs(yaw_error) < 1 and abs(pitch_error) < 1
+    assert result.end_time < 20000
+
+
+def test_engagement_times_out_each_target(monkeypatch):
+    from host.engagement import EngagementRunner
+    # too short to reach the second person, who gets their own WAIT_TIME
+    # from when the trigger moves on to them, not what is left of the first's
+    monkeypatch.setattr(main, "ENGAGE_TARGETS", 3)
+    monkeypatch.setattr(main, "WAIT_TIME", 600)
+    label, scene = two_person_scene()
+    result = EngagementRunner(timeout=20.0, shots=0).run(scene, label)
+    assert len(result.shots) == 2
+    first, second = result.shots[0][0], result.shots[1][0]
+    assert abs(result.shots[0][1]) < 1
+    assert abs(result.shots[1][1]) > 1
+    gap = main.TRIGGER_HOLD + main.WAIT_TIME
+    assert gap <= second - first < gap + 50
+
+
+def test_engagement_holds_fire_on_empty_queue(monkeypatch):
+    from host.engagement import EngagementRunner
+    from host.mlx_device import read_frames
+    monkeypatch.setattr(main, "ENGAGE_TARGETS", 3)
+    label, frame = read_frames(os.path.join(host.SRC_DIR, "blank_ims.txt"))[0]
+    result = EngagementRunner(timeout=20.0, shots=0).run(frame, label)
+    assert result.shots == []
+    assert result.end_time < 20000
@@ -0,0 +1,209 @@
+"""!
+@file tuner.py
+    This file contains a gain tuner for the yaw and pitch controllers.  Every
+    candidate (kp, ki, kd) is run through a simulated closed loop step response
+    of CLController against the plant model in plant.py, and the candidates are
+    ranked by settle time, overshoot and steady state error.  Candidates are
+    spread over a process pool so a sweep uses every core on the PC.
+
+    Sweep the pitch gains on a grid, then refine around the best candidate
+    twice, and write the table to a file:
+    @code
+    python -m host.tuner pitch --kp 5:45:5 --ki 0,0.05,0.1 --kd 0:4:1 --refine 2 --out pitch.txt
+    @endcode
+    Measure how the sweep speeds up as cores are added:
+    @code
+    python -m host.tuner pitch --bench
+    @endcode
+    Tune against a motor model fitted to a logged step response by sysid.py
+    instead of the nominal one:
+    @code
+    python -m host.tuner pitch --plant pitch_fit.json
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-20
+"""
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from host.plant import SimulatedAxis, step_response, step_metrics
+from motor_drivers.controller import CLController
+
+## The two turret axes as they are set up in main.py
+AXES = {
+    "yaw": {"belt_ratio": 1, "pwm_timer": 1, "encoder_timer": 3,
+            "home": -180, "target": 0, "gains": (35, 0, 0)},
+    "pitch": {"belt_ratio": 4, "pwm_timer": 4, "encoder_timer": 2,
+              "home": 30, "target": 0, "gains": (25, 0.1, 2)},
+}
+
+## How much each percent of overshoot and each degree of steady state error
+#  cost, in seconds of settle time
+OVERSHOOT_WEIGHT = 0.01
+SS_ERROR_WEIGHT = 1.0
+
+
+def evaluate(job):
+    """!
+    This function runs one candidate through a simulated step response.  It
+    is run in the worker processes, so everything it needs is in the job.
+    @param job - a tuple (axis name, kp, ki, kd, duration, band, model_args)
+    @returns a tuple (kp, ki, kd, settle_time, overshoot, ss_error, cost)
+    """
+    axis_name, kp, ki, kd, duration, band, model_args = job
+    setup = AXES[axis_name]
+    # the drivers print when they are created, which would swamp the output
+    with contextlib.redirect_stdout(io.StringIO()):
+        axis = SimulatedAxis(setup["belt_ratio"], pwm_timer=setup["pwm_timer"],
+                             encoder_timer=setup["encoder_timer"], **model_args)
+        axis.encoder.set_pos(setup["home"])
+        con = CLController(kp, ki, kd, setup["target"])
+        t, pos, eff = step_response(con, axis, setup["target"], duration=duration)
+    settle, overshoot, ss_err = step_metrics(t, pos, setup["home"], setup["target"], band)
+    # never settling costs as much as settling at the very end of the run
+    cost = ((duration if settle is None else settle) + OVERSHOOT_WEIGHT*overshoot
+            + SS_ERROR_WEIGHT*ss_err)
+    return kp, ki, kd, settle, overshoot, ss_err, cost
+
+
+def parse_values(text):
+    """!
+    This function turns a command line gain specification into a list.
+    @param text - either a comma separated list "0,0.1,0.2" or a range
+                  "start:stop:step" which includes the stop value
+    @returns a list of floats
+    """
+    if ":" in text:
+        start, stop, step = (float(v) for v in text.split(":"))
+        count = int(round((stop - start)/step)) + 1
+        return [round(start + n*step, 10) for n in range(count)]
+    return [float(v) for v in text.split(",")]
+
+
+def sweep(axis_name, kps, kis, kds, processes=None, duration=2.0, band=0.5, model_args=None):
+    """!
+    This function evaluates every combination of the given gains.
+    @param axis_name - "yaw" or "pitch"
+    @param kps - the proportional gains to try
+    @param kis - the integral gains to try
+    @param kds - the derivative gains to try
+    @param processes - how many worker processes to use, default one per core
+    @param duration - how long each step response runs for in s
+    @param band - the settling band in degrees
+    @param model_args - keyword arguments for the MotorModel
+    @returns a list of result tuples (see evaluate()) sorted best first
+    """
+    model_args = model_args or {}
+    jobs = [(axis_name, kp, ki, kd, duration, band, model_args)
+            for kp, ki, kd in itertools.product(kps, kis, kds)]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        results = [evaluate(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(evaluate, jobs, chunksize=max(len(jobs)//(processes*4), 1))
+    results.sort(key=lambda r: r[6])
+    return results
+
+
+def refine(axis_name, best, steps, processes=None, duration=2.0, band=0.5, model_args=None):
+    """!
+    This function sweeps a small grid centered on a candidate, with the grid
+    spacing given for each gain.  Gains are not allowed to go negative.
+    @param axis_name - "yaw" or "pitch"
+    @param best - the (kp, ki, kd) to search around
+    @param steps - the grid spacing for (kp, ki, kd)
+    @returns a list of result tuples sorted best first
+    """
+    grids = []
+    for value, step in zip(best, steps):
+        grids.append(sorted(set(max(round(value + n*step, 10), 0) for n in (-1, 0, 1))))
+    return sweep(axis_name, *grids, processes=processes, duration=duration,
+                 band=band, model_args=model_args)
+
+
+def format_table(results, count=None):
+    """!
+    This function lays the results out as a fixed width text table.
+    @param results - result tuples from sweep()
+    @param count - only include this many of the best results
+    @returns the table as a string
+    """
+    lines = [f"{'rank':>4} {'kp':>8} {'ki':>8} {'kd':>8} {'settle_s':>9} "
+             f"{'overshoot_%':>11} {'ss_err_deg':>10} {'cost':>8}"]
+    for rank, (kp, ki, kd, settle, overshoot, ss_err, cost) in enumerate(results[:count], 1):
+        settle = "-" if settle is None else f"{settle:.3f}"
+        lines.append(f"{rank:>4} {kp:>8g} {ki:>8g} {kd:>8g} {settle:>9} "
+                     f"{overshoot:>11.1f} {ss_err:>10.3f} {cost:>8.3f}")
+    return "\n".join(lines)
+
+
+def benchmark(axis_name, kps, kis, kds, duration=2.0, model_args=None):
+    """!
+    This function times the same sweep with one worker process, then two,
+    and so on up to one per core, and prints the speedup for each.
+    """
+    cores = os.cpu_count() or 1
+    count = len(kps)*len(kis)*len(kds)
+    print(f"{count} candidates, {cores} cores")
+    base = None
+    for processes in range(1, cores + 1):
+        starttime = time.perf_counter()
+        sweep(axis_name, kps, kis, kds, processes=processes, duration=duration,
+              model_args=model_args)
+        totaltime = time.perf_counter() - starttime
+        base = base or totaltime
+        print(f"{processes:>3} processes: {totaltime:7.2f} s, "
+              f"{count/totaltime:7.1f} candidates/s, speedup {base/totaltime:.2f}x")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Tune the turret controller gains in simulation")
+    parser.add_argument("axis", choices=sorted(AXES))
+    parser.add_argument("--kp", default="5:50:5", help="kp values, a,b,c or start:stop:step")
+    parser.add_argument("--ki", default="0,0.05,0.1,0.2")
+    parser.add_argument("--kd", default="0:4:1")
+    parser.add_argument("--refine", type=int, default=0,
+                        help="number of times to refine around the best candidate")
+    parser.add_argument("--duration", type=float, default=2.0, help="length of each step response in s")
+    parser.add_argument("--band", type=float, default=0.5, help="settling band in degrees")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20, help="how many candidates to print")
+    parser.add_argument("--out", help="file to write the full result table to")
+    parser.add_argument("--bench", action="store_true", help="measure speedup against core count")
+    parser.add_argument("--plant", help="JSON motor fit written by host/sysid.py")
+    args = parser.parse_args()
+
+    plant = {}
+    if args.plant:
+        with open(args.plant) as file:
+            plant = json.load(file)["model_args"]
+
+    kps, kis, kds = parse_values(args.kp), parse_values(args.ki), parse_values(args.kd)
+    if args.bench:
+        benchmark(args.axis, kps, kis, kds, args.duration, plant)
+    else:
+        results = sweep(args.axis, kps, kis, kds, args.processes, args.duration, args.band, plant)
+        # each refinement halves the grid spacing around the best candidate
+        steps = [(max(v) - min(v))/max(len(v) - 1, 1) for v in (kps, kis, kds)]
+        for n in range(args.refine):
+            steps = [s/2 for s in steps]
+            results = sorted(set(results + refine(args.axis, results[0][:3], steps,
+                                                  args.processes, args.duration, args.band,
+                                                  plant)),
+                             key=lambda r: r[6])
+        current = evaluate((args.axis, *AXES[args.axis]["gains"], args.duration, args.band, plant))
+        print("Current gains from main.py:")
+        print(format_table([current]))
+        print("Best candidates:")
+        print(format_table(results, args.top))
+        if args.out:
+            with open(args.out, "w") as file:
+                file.write(format_table(results) + "\n")
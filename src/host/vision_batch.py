@@ -0,0 +1,241 @@
+"""!
+@file vision_batch.py
+    This file contains a batched version of cam2setpoint() for going back over
+    recorded sessions on a PC.  It takes a stack of N images and does the
+    noise subtraction, contrast, histogram, threshold, confidence and centroid of all
+    of them at once with whole array NumPy operations, using the same noise filter,
+    histogram and X-Y planes as cam2setpoint.py.  Each step is done in the same order
+    and precision as cam2setpoint() does it, so the angles are bit for bit
+    the same as calling it once per image.  It needs three dimensional
+    arrays, so it is for the PC only; ulab on the board only has two.
+
+    Check it against cam2setpoint() and measure its throughput on the
+    recorded images at a few batch sizes:
+    @code
+    python -m host.vision_batch
+    python -m host.vision_batch --sizes 1,32,1024 frames
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-22
+"""
+import time
+import numpy
+import host
+host.install()
+
+from cam2setpoint import (cam2setpoint, NOISE_FILTER, X_PLANE, Y_PLANE, IMAGE_PIXELS, HIST_SHIFT,
+                          HIST_BINS, PATCH_ROWS, PATCH_COLS, CONTRAST_LOW, CONTRAST_HIGH, AREA_MIN, AREA_GOOD, AREA_MAX,
+                          COMPACT_GOOD, MIN_CONFIDENCE, PIXEL_COLS, PIXEL_ROWS, PIXEL_COLS2,
+                          PIXEL_ROWS2, PIXEL_SPREAD)
+
+## The background and planes as plain NumPy arrays, flattened so each
+#  image's are summed as one run of 768 values, the same as np.sum() sums
+#  one image's
+_NOISE = numpy.asarray(NOISE_FILTER).reshape(-1)
+_X, _Y, _PX, _PY, _PX2, _PY2 = (numpy.asarray(plane, dtype=float).reshape(-1)
+                                for plane in (X_PLANE, Y_PLANE, PIXEL_COLS, PIXEL_ROWS,
+                                              PIXEL_COLS2, PIXEL_ROWS2))
+_BINS = numpy.arange(HIST_BINS)
+## How many images are worked on in each step
+CHUNK = 64
+
+
+def _ramp(value, low, high):
+    # the same as cam2setpoint._ramp() on arrays
+    return numpy.clip((value - low) / (high - low), 0.0, 1.0)
+
+
+def _measure_chunk(frames, patch_rows, patch_cols):
+    """!
+    Measures a chunk of flattened images the way cam2setpoint() does: the
+    contrast of the warmest patch, histogram, median and hottest bins,
+    Otsu's split of the bins from the median up, the area above it and its
+    compactness, then the centroid of what is above the split.
+    @param frames - an (N, 768) uint8 array
+    @param patch_rows - rows in the contrast patch
+    @param patch_cols - columns in the contrast patch
+    @returns the contrast, area, compactness, X angle and Y angle arrays
+    """
+    boy = frames - _NOISE
+    # the warmest patch above the mean of its rows, summed in the same order
+    level = boy.reshape(-1, 24, 32)
+    level = level - level.mean(axis=2, keepdims=True)
+    rows = 24 - patch_rows + 1
+    down = level[:, 0:rows, :]
+    for r in range(1, patch_rows):
+        down = down + level[:, r:r + rows, :]
+    cols = 32 - patch_cols + 1
+    patch = down[:, :, 0:cols]
+    for c in range(1, patch_cols):
+        patch = patch + down[:, :, c:c + cols]
+    contrast = patch.max(axis=(1, 2)) / (patch_rows * patch_cols)
+    bins = numpy.clip(boy >> HIST_SHIFT, 0, HIST_BINS - 1)
+    rows = numpy.arange(len(frames))[:, None]
+    hist = numpy.bincount((bins + rows*HIST_BINS).ravel(),
+                          minlength=len(frames)*HIST_BINS).reshape(len(frames), HIST_BINS)
+    median = numpy.argmax(hist.cumsum(axis=1) >= IMAGE_PIXELS // 2, axis=1)
+    top = HIST_BINS - 1 - numpy.argmax(hist[:, ::-1] > 0, axis=1)
+    # Otsu's split, with the same sums in the same order as cam2setpoint()
+    upper = hist * (_BINS >= median[:, None])
+    back = upper.cumsum(axis=1)
+    back_sum = (_BINS*upper).cumsum(axis=1)
+    front = back[:, -1:] - back
+    diff = back_sum / back - (back_sum[:, -1:] - back_sum) / front
+    var = back * front * diff * diff
+    var[(_BINS < median[:, None]) | (_BINS >= top[:, None])] = -numpy.inf
+    split = numpy.argmax(var, axis=1)
+    area = (hist * (_BINS > split[:, None])).sum(axis=1)
+    mask = boy >= (split[:, None] + 1) << HIST_SHIFT
+    mean_x = (mask*_PX).sum(axis=1) / area
+    mean_y = (mask*_PY).sum(axis=1) / area
+    spread = ((mask*_PX2).sum(axis=1) / area - mean_x * mean_x
+              + (mask*_PY2).sum(axis=1) / area - mean_y * mean_y + PIXEL_SPREAD)
+    compactness = area / (2 * 3.14159265 * spread)
+    roi = boy * mask
+    roi_sum = roi.sum(axis=1)
+    x = (roi*_X).sum(axis=1) / roi_sum
+    y = (roi*_Y).sum(axis=1) / roi_sum
+    return contrast, area, compactness, x, y
+
+
+def measure(frames, patch_rows=PATCH_ROWS, patch_cols=PATCH_COLS):
+    """!
+    This function measures everything cam2setpoint() scores a stack of
+    images on, and the centroid it would aim at, without deciding whether
+    there is anyone there.  None of it depends on the confidence settings,
+    so vision_sweep.py measures once and scores many settings.  Big stacks
+    are worked through CHUNK images at a time, which keeps the temporary
+    arrays in the cache and runs about twice as fast as one huge step.
+    @param frames - an (N, 24, 32) array of images as MLX_Cam.get_array()
+                    returns them, or anything NumPy can make into one
+    @param patch_rows - rows in the contrast patch
+    @param patch_cols - columns in the contrast patch
+    @returns a (5, N) array of the contrast, area, compactness, X angle and
+             Y angle of each image
+    """
+    # uint8 images as cam2setpoint() is given, made int16 by the subtraction
+    frames = numpy.asarray(frames).astype(numpy.uint8).reshape(len(frames), -1)
+    results = numpy.empty((5, len(frames)))
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        for start in range(0, len(frames), CHUNK):
+            results[:, start:start + CHUNK] = _measure_chunk(frames[start:start + CHUNK],
+                                                             patch_rows, patch_cols)
+    return results
+
+
+def confidence(contrast, area, compactness, contrast_low=CONTRAST_LOW, contrast_high=CONTRAST_HIGH,
+               area_good=AREA_GOOD, area_max=AREA_MAX, compact_good=COMPACT_GOOD):
+    """!
+    This function scores measurements from measure() the way cam2setpoint()
+    scores its confidence, in the same order so it is bit for bit the same.
+    Images with less than AREA_MIN above the threshold score 0.
+    @returns an array of confidences
+    """
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        score = (_ramp(contrast, contrast_low, contrast_high) * (1.0 - _ramp(area, area_good, area_max))
+                 * _ramp(compactness, 0, compact_good))
+    return numpy.where(area >= AREA_MIN, score, 0.0)
+
+
+def cam2setpoint_batch(frames, min_confidence=MIN_CONFIDENCE):
+    """!
+    This function finds the target in a stack of images at once.  The
+    contrast, area and compactness only ever lower the confidence, so
+    scoring them all then comparing once gives what cam2setpoint()'s early
+    exits do.
+    @param frames - an (N, 24, 32) array of images as MLX_Cam.get_array()
+                    returns them, or anything NumPy can make into one
+    @param min_confidence - the least confidence to return a target for
+    @returns three arrays of N values, the X and Y angles and confidence, the
+             same as cam2setpoint() would return for each image, with nan
+             where it returns None
+    """
+    contrast, area, compactness, x, y = measure(frames)
+    score = confidence(contrast, area, compactness)
+    present = (area >= AREA_MIN) & (score >= min_confidence)
+    for values in (x, y, score):
+        values[~present] = numpy.nan
+    return x, y, score
+
+
+def check(frames, min_confidence=0.0):
+    """!
+    This function checks the batched results against cam2setpoint() run on
+    each image.  By default every image with any confidence is checked, not
+    just the confident ones.
+    @param frames - the (N, 24, 32) images
+    @param min_confidence - the least confidence to return a target for
+    @returns the numbers of the images whose results differ at all
+    """
+    batch = cam2setpoint_batch(frames, min_confidence)
+    differ = []
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        for n, frame in enumerate(frames):
+            found = cam2setpoint(numpy.asarray(frame, dtype=numpy.uint8), min_confidence)
+            if found is None:
+                found = (numpy.nan,)*3
+            if not all(_same(values[n], value) for values, value in zip(batch, found)):
+                differ.append(n)
+    return differ
+
+
+def _same(a, b):
+    return a == b or (a != a and b != b)
+
+
+def throughput(frames, batch_size, seconds=0.5):
+    """!
+    This function measures how many images per second are located in batches
+    of a given size.  The images are repeated to fill the batch if there are
+    too few.
+    @param frames - the (N, 24, 32) images
+    @param batch_size - images per call
+    @param seconds - about how long to measure for
+    @returns images per second
+    """
+    reps = -(-batch_size // len(frames))
+    batch = numpy.concatenate([frames]*reps)[:batch_size]
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        cam2setpoint_batch(batch)
+        calls += 1
+    return calls*batch_size/(time.perf_counter() - start)
+
+
+def single_throughput(frames, seconds=0.5):
+    """!
+    This function measures how many images per second cam2setpoint() locates
+    one call at a time.
+    @param frames - the (N, 24, 32) images
+    @param seconds - about how long to measure for
+    @returns images per second
+    """
+    images = [numpy.asarray(frame, dtype=numpy.uint8) for frame in frames]
+    count = 0
+    start = time.perf_counter()
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        while time.perf_counter() - start < seconds:
+            for image in images:
+                cam2setpoint(image)
+            count += len(images)
+    return count/(time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    import argparse
+    from host.vision_eval import DEFAULT_FILES, load_images
+    parser = argparse.ArgumentParser(description="Check and time the batched locator")
+    parser.add_argument("sources", nargs="*", default=list(DEFAULT_FILES),
+                        help="recorded .txt files or corpus.py stores")
+    parser.add_argument("--sizes", default="1,8,32,256,1024", help="batch sizes to time")
+    args = parser.parse_args()
+
+    frames = numpy.array([frame for source, label, frame in load_images(args.sources)])
+    differ = check(frames) + check(frames, MIN_CONFIDENCE)
+    print(f"{len(frames)} images, {len(differ)} differ from cam2setpoint()")
+    print(f"{'one at a time':>14s} {single_throughput(frames):10.0f} images/s")
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"{'batch of ' + str(size):>14s} {throughput(frames, size):10.0f} images/s")
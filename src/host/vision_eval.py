@@ -0,0 +1,272 @@
+"""!
+@file vision_eval.py
+    This file scores a target locator, such as cam2setpoint(), against every
+    recorded camera image, so a change to the vision code can be judged by
+    what it does to the aim rather than by looking at a few numbers.  For
+    each image it records the angles found (or that nothing was found) and
+    how long the call took.  The images are split into ones with nobody in
+    them (the blank*, nothing* and "nat no" images) and ones with somebody in
+    them, and the run reports the aim angles per label, how often a target
+    was found in an empty image (false positives) or not found in a full one
+    (misses), and percentiles of the time per call.  A locator which finds
+    every target, such as find_targets(), has its first target scored, and
+    any more counted as extra targets; every recorded image has one person
+    at most, so each of them is wrong.
+
+    A run can be saved as a reference, and a later run compared with it
+    image by image, so an optimization which should not change the aim can
+    be shown not to:
+    @code
+    python -m host.vision_eval --save host/vision_ref.json
+    python -m host.vision_eval --reference host/vision_ref.json
+    python -m host.vision_eval --locator my_locator:find_target --reference host/vision_ref.json
+    python -m host.vision_eval --option refine=true --reference host/vision_ref.json
+    python -m host.vision_eval --locator cam2setpoint:find_targets --option max_targets=3
+    @endcode
+    Keep reference runs in the host directory, as above, so they aren't
+    copied to the board with the source.  Images come from the recorded text files by default, or from a store
+    made by corpus.py if one is named instead of a .txt file.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-22
+"""
+import fnmatch
+import functools
+import importlib
+import json
+import math
+import os
+import time
+import numpy
+import host
+host.install()
+
+from ulab import numpy as np
+from host.corpus import FrameCorpus
+from host.mlx_device import iter_frames
+
+## The recorded image files used unless others are given
+DEFAULT_FILES = ("test_ims.txt", "new_test_ims.txt", "test_ims_light.txt", "blank_ims.txt")
+## The locator used unless another is given, as module:function
+DEFAULT_LOCATOR = "cam2setpoint:cam2setpoint"
+## Labels of the images with nobody in them
+NO_TARGET_PATTERNS = ("blank*", "nothing*", "nat no")
+## The latency percentiles reported
+PERCENTILES = (50, 90, 99)
+## How far in degrees an angle may move from the reference before it is
+#  reported as changed
+ANGLE_TOLERANCE = 1e-6
+
+
+def load_locator(spec, options=()):
+    """!
+    This function finds a locator function from its name.  A locator takes
+    a 24 x 32 uint8 image as MLX_Cam.get_array() returns it and gives back
+    the (x, y) angles of the target in degrees, or None if there isn't one.
+    It may give a confidence from 0 to 1 after the angles, which is kept.
+    It may instead give a list of such targets, best first.
+    @param spec - the locator as module:function, such as cam2setpoint:cam2setpoint
+    @param options - NAME=VALUE keyword arguments to call it with; values
+                     are read as JSON if they can be, so refine=true is True
+    @returns the function
+    """
+    module_name, _, function_name = spec.partition(":")
+    locator = getattr(importlib.import_module(module_name), function_name or module_name)
+    kwargs = {}
+    for option in options:
+        name, _, value = option.partition("=")
+        try:
+            kwargs[name] = json.loads(value)
+        except ValueError:
+            kwargs[name] = value
+    return functools.partial(locator, **kwargs) if kwargs else locator
+
+
+def load_images(sources):
+    """!
+    This function reads the images to score.
+    @param sources - recorded .txt files and corpus.py stores
+    @returns a list of (source, label, frame) tuples
+    """
+    images = []
+    for source in sources:
+        if source.endswith(".txt"):
+            name = os.path.basename(source)
+            images.extend((name, label, frame) for label, frame in iter_frames(source))
+        else:
+            corpus = FrameCorpus(source)
+            images.extend(zip(corpus.sources, corpus.labels, corpus.frames))
+    return images
+
+
+def is_empty(label):
+    """!
+    Tells whether an image's label says there is nobody in it.
+    """
+    return any(fnmatch.fnmatchcase(label, p) for p in NO_TARGET_PATTERNS)
+
+
+def frame_keys(images):
+    """!
+    This function names every image so runs can be compared image by image.
+    A label can appear more than once in a file, so repeats get #2, #3...
+    @param images - the (source, label, frame) tuples
+    @returns a list of names like "test_ims.txt/nat left"
+    """
+    keys = []
+    seen = {}
+    for source, label, frame in images:
+        key = f"{source}/{label}"
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return keys
+
+
+def evaluate(locator, images, repeat=5):
+    """!
+    This function runs a locator over every image.
+    @param locator - the locator function
+    @param images - the (source, label, frame) tuples from load_images()
+    @param repeat - how many times each image is located; the time kept for
+                    the image is the fastest call
+    @returns a dictionary with an entry per image, the false positive and
+             miss rates, and the latency percentiles in us
+    """
+    frames = []
+    times = []
+    with numpy.errstate(all="ignore"):
+        for key, (source, label, frame) in zip(frame_keys(images), images):
+            image = np.array(frame, dtype=np.uint8)
+            best = None
+            for n in range(repeat):
+                start = time.perf_counter()
+                found = locator(image)
+                elapsed = (time.perf_counter() - start)*1000000
+                best = elapsed if best is None else min(best, elapsed)
+            times.append(best)
+            extra = 0
+            if isinstance(found, list):
+                extra = max(len(found) - 1, 0)
+                found = found[0] if found else None
+            x = y = confidence = None
+            if found is not None:
+                x, y = float(found[0]), float(found[1])
+                if len(found) > 2:
+                    confidence = float(found[2])
+                if not (math.isfinite(x) and math.isfinite(y)):
+                    # a nan centroid is as good as nothing found
+                    x = y = confidence = None
+            frames.append({"key": key, "source": source, "label": label, "empty": is_empty(label),
+                           "x": x, "y": y, "confidence": confidence, "extra": extra, "us": best})
+    empty = [f for f in frames if f["empty"]]
+    full = [f for f in frames if not f["empty"]]
+    ordered = sorted(times)
+    latency = {f"p{p}": ordered[min(len(ordered) - 1, int(len(ordered)*p/100))] for p in PERCENTILES}
+    latency["max"] = ordered[-1]
+    latency["mean"] = sum(times)/len(times)
+    return {
+        "frames": frames,
+        "false_positive_rate": sum(f["x"] is not None for f in empty)/len(empty) if empty else None,
+        "miss_rate": sum(f["x"] is None for f in full)/len(full) if full else None,
+        "extra_target_images": sum(f["extra"] > 0 for f in frames),
+        "empty_images": len(empty),
+        "target_images": len(full),
+        "latency_us": latency,
+    }
+
+
+def compare(result, reference, tolerance=ANGLE_TOLERANCE):
+    """!
+    This function compares a run with a reference run image by image.
+    @param result - the run from evaluate()
+    @param reference - an earlier run, as saved
+    @param tolerance - how far an angle may move in degrees unnoticed
+    @returns a list of lines describing every difference; empty if the aim
+             is the same for every image
+    """
+    old = {f["key"]: f for f in reference["frames"]}
+    new = {f["key"]: f for f in result["frames"]}
+    lines = []
+    for key, frame in new.items():
+        before = old.get(key)
+        if before is None:
+            lines.append(f"new image {key}")
+        elif (before["x"] is None) != (frame["x"] is None):
+            lines.append(f"{key}: {_angles(before)} -> {_angles(frame)}")
+        elif frame["x"] is not None and (abs(frame["x"] - before["x"]) > tolerance
+                                         or abs(frame["y"] - before["y"]) > tolerance):
+            lines.append(f"{key}: {_angles(before)} -> {_angles(frame)}")
+    lines.extend(f"missing image {key}" for key in old if key not in new)
+    for rate in ("false_positive_rate", "miss_rate"):
+        if result[rate] != reference[rate]:
+            lines.append(f"{rate}: {_rate(reference[rate])} -> {_rate(result[rate])}")
+    return lines
+
+
+def _angles(frame):
+    if frame["x"] is None:
+        return "no target"
+    return f"({frame['x']:7.2f}, {frame['y']:6.2f})"
+
+
+def _rate(rate):
+    return "n/a" if rate is None else f"{100*rate:.0f}%"
+
+
+def report(result, reference=None):
+    """!
+    This function prints a run as a table, with the latency change from the
+    reference if one is given.
+    @param result - the run from evaluate()
+    @param reference - an earlier run to compare the latency with
+    """
+    print(f"{'image':44s} {'empty':5s} {'angles':17s} {'conf':>5s} {'extra':>5s} {'us':>8s}")
+    for frame in result["frames"]:
+        confidence = "" if frame.get("confidence") is None else f"{frame['confidence']:.2f}"
+        extra = f"{frame['extra']}" if frame.get("extra") else ""
+        print(f"{frame['key']:44s} {'yes' if frame['empty'] else '':5s} "
+              f"{_angles(frame):17s} {confidence:>5s} {extra:>5s} {frame['us']:8.1f}")
+    print(f"false positives {_rate(result['false_positive_rate'])} of {result['empty_images']} empty images, "
+          f"misses {_rate(result['miss_rate'])} of {result['target_images']} images with a target, "
+          f"extra targets in {result.get('extra_target_images', 0)} images")
+    latency = result["latency_us"]
+    line = "latency " + ", ".join(f"{name} {value:.1f}" for name, value in latency.items()) + " us"
+    if reference is not None:
+        line += f" (p50 was {reference['latency_us']['p50']:.1f} us)"
+    print(line)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Score a target locator against the recorded images")
+    parser.add_argument("sources", nargs="*", default=list(DEFAULT_FILES),
+                        help="recorded .txt files or corpus.py stores")
+    parser.add_argument("--locator", default=DEFAULT_LOCATOR, help="the locator as module:function")
+    parser.add_argument("--option", action="append", default=[], metavar="NAME=VALUE",
+                        help="keyword argument for the locator, such as refine=true")
+    parser.add_argument("--repeat", type=int, default=5, help="calls per image, the fastest counting")
+    parser.add_argument("--reference", help="JSON run to compare with; differences exit with status 1")
+    parser.add_argument("--tolerance", type=float, default=ANGLE_TOLERANCE,
+                        help="how far an angle may move in degrees unnoticed")
+    parser.add_argument("--save", help="JSON file to save the run to, to use as a reference")
+    args = parser.parse_args()
+
+    result = evaluate(load_locator(args.locator, args.option), load_images(args.sources), args.repeat)
+    result["locator"] = args.locator
+    result["options"] = args.option
+    reference = None
+    if args.reference:
+        with open(args.reference) as file:
+            reference = json.load(file)
+    report(result, reference)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(result, file, indent=1)
+    if reference is not None:
+        differences = compare(result, reference, args.tolerance)
+        for line in differences:
+            print(line)
+        print(f"{len(differences)} differences from {args.reference}")
+        sys.exit(1 if differences else 0)
@@ -0,0 +1,396 @@
+"""!
+@file vision_sweep.py
+    This file sweeps the settings of the vision step over the recorded images
+    to find the best ones, the way tuner.py does for the controller gains.
+    A candidate is the size of the contrast patch and the confidence
+    settings of cam2setpoint.py: where the contrast score starts and ends,
+    the area where the area score starts to fall and reaches 0, the
+    compactness which scores 1, and the least confidence to call a target.
+    CURRENT holds the settings cam2setpoint.py has now.
+
+    Nothing cam2setpoint() measures depends on the confidence settings, so
+    each image is measured once per patch size with vision_batch.measure()
+    and every setting is scored from those numbers.  The measuring is
+    spread over a process pool, and what is measured in each image is cached
+    in a file, keyed by the image's contents, the patch size and the source
+    of the measuring code, so a rerun with a few more settings or images
+    only measures the new ones.
+
+    Each candidate is scored on the recorded images by:
+    - false positives, the fraction of empty images (blank*, nothing*,
+      "nat no") in which it finds a target
+    - misses, the fraction of images with someone in them where it doesn't
+    - side errors, the fraction of "left" and "right" images whose target
+      is not on that side of the "mid" or "cent" image of the same file
+    - margins, the least fraction by which any empty image's contrast, and
+      any other image's, would have to change for it to be called the other
+      way, negative when an image is already called wrong.  They are in
+      contrast rather than confidence so a steep contrast score can't make
+      them look wide.  Among candidates of the same cost, the one which
+      keeps every empty image at least EMPTY_MARGIN below the cut and then
+      leaves the most room for people wins.  Widening both margins evenly
+      puts the cut half way between the sessions recorded so far, and a
+      session of people further from the camera falls below it; a turret
+      which misses a new session does nothing at all
+    - if a file of true turret setpoints is given, the RMS aim error after
+      mapping camera angles to setpoints with yaw_gain*x + yaw_offset and
+      pitch_gain*y + pitch_offset, like the hand tuned 16*x + 11.5 and
+      y/2 + 2 of cam2turret.py.  The mapping is only swept when there is
+      something to score it against; fit_mapping.py fits a full polynomial
+      mapping from the same truth file.
+    @code
+    python -m host.vision_sweep --patch-rows 6,8,10 --min-confidence 0.2:0.6:0.05
+    python -m host.vision_sweep --truth aim_truth.json --yaw-gain 12:20:0.5 --yaw-offset 0:20:1
+    @endcode
+    The truth file maps image names as vision_eval.py gives them, such as
+    "test_ims.txt/nat left", to the [yaw, pitch] setpoints which hit them.
+
+    The settings are fitted on the images they are scored on, so
+    --cross-validate also sweeps with each recorded file held out in turn
+    and scores the winner on the file it didn't see:
+    @code
+    python -m host.vision_sweep --cross-validate
+    @endcode
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-22
+"""
+import hashlib
+import inspect
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import numpy
+import host
+host.install()
+
+import cam2setpoint
+from host import vision_batch
+from host.tuner import parse_values
+from host.vision_eval import DEFAULT_FILES, load_images, frame_keys, is_empty
+
+## The confidence settings swept, in the order candidates give them
+SETTINGS = ("contrast_low", "contrast_high", "area_good", "area_max", "compact_good", "min_confidence")
+## The settings cam2setpoint.py has now, and the hand tuned mapping
+#  cam2turret.py uses without a fitted one
+CURRENT = {"patch_rows": cam2setpoint.PATCH_ROWS, "patch_cols": cam2setpoint.PATCH_COLS,
+           "contrast_low": cam2setpoint.CONTRAST_LOW, "contrast_high": cam2setpoint.CONTRAST_HIGH,
+           "area_good": cam2setpoint.AREA_GOOD, "area_max": cam2setpoint.AREA_MAX,
+           "compact_good": cam2setpoint.COMPACT_GOOD, "min_confidence": cam2setpoint.MIN_CONFIDENCE,
+           "yaw_gain": 16.0, "yaw_offset": 11.5, "pitch_gain": 0.5, "pitch_offset": 2.0}
+## How much each score adds to the cost; aim error is per degree
+FP_WEIGHT = 1.0
+MISS_WEIGHT = 1.0
+SIDE_WEIGHT = 1.0
+AIM_WEIGHT = 0.01
+## How far below the cut, as a fraction of its contrast, every empty image
+#  should be before the room left for people counts
+EMPTY_MARGIN = 0.1
+## File the per image measurements are cached in, kept with the host tools
+#  so it isn't copied to the board with the source
+CACHE_FILE = os.path.join(host.HOST_DIR, "vision_sweep_cache.json")
+
+## Changes whenever the measuring code does, so stale cache entries are not used
+CODE_VERSION = hashlib.sha1(inspect.getsource(vision_batch._measure_chunk).encode()
+                            + numpy.asarray(cam2setpoint.NOISE_FILTER).tobytes()
+                            + numpy.asarray(cam2setpoint.X_PLANE, dtype=float).tobytes()
+                            + numpy.asarray(cam2setpoint.Y_PLANE, dtype=float).tobytes()).hexdigest()[:12]
+## Images handed to each worker process when the pool starts
+_frames = None
+
+
+def _init_worker(frames):
+    global _frames
+    _frames = frames
+
+
+def _run_job(job):
+    """!
+    Measures the images given by number with one patch size.  It runs in
+    the worker processes, which were handed the images at start.
+    """
+    (patch_rows, patch_cols), numbers = job
+    return vision_batch.measure(_frames[numbers], patch_rows, patch_cols)
+
+
+def patch_key(patch_rows, patch_cols):
+    return f"{CODE_VERSION}:{patch_rows:g}x{patch_cols:g}"
+
+
+def find_measurements(frames, patches, processes=None, cache=None):
+    """!
+    This function measures every image with every patch size, taking what it
+    can from the cache and spreading the rest over a process pool.
+    @param frames - an (N, 24, 32) array of images
+    @param patches - a list of (patch_rows, patch_cols) tuples
+    @param processes - how many worker processes to use, default one per core
+    @param cache - a dictionary of cached measurements, updated with new ones
+    @returns a dictionary of (5, N) arrays as vision_batch.measure() gives
+             them, keyed by patch size, and the number of (patch, image)
+             measurements which had to be worked out
+    """
+    frames = numpy.asarray(frames).astype(numpy.uint8).reshape(len(frames), 24, 32)
+    hashes = [hashlib.sha1(frame.tobytes()).hexdigest()[:16] for frame in frames]
+    cache = {} if cache is None else cache
+    jobs = []
+    for patch in patches:
+        entries = cache.setdefault(patch_key(*patch), {})
+        numbers = [n for n, h in enumerate(hashes) if h not in entries]
+        if numbers:
+            jobs.append((patch, numbers))
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(jobs) < 2:
+        _init_worker(frames)
+        results = [_run_job(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes, _init_worker, (frames,)) as pool:
+            results = pool.map(_run_job, jobs, chunksize=max(len(jobs)//(processes*4), 1))
+    for (patch, numbers), values in zip(jobs, results):
+        entries = cache[patch_key(*patch)]
+        for n, column in zip(numbers, values.T):
+            # JSON has no nan, so an image with nothing above the threshold is None
+            entries[hashes[n]] = [None if math.isnan(v) else float(v) for v in column]
+    measurements = {}
+    for patch in patches:
+        entries = cache[patch_key(*patch)]
+        measurements[patch] = numpy.array([[numpy.nan if v is None else v for v in entries[h]]
+                                           for h in hashes]).T
+    return measurements, sum(len(numbers) for patch, numbers in jobs)
+
+
+def margin(contrast, rest, settings, empty):
+    """!
+    This function works out how far each image's contrast is from the
+    contrast at which it would be called the other way, with the other two
+    scores as they are.
+    @param contrast - the N contrasts
+    @param rest - the N products of the area and compactness scores
+    @param settings - the candidate's settings by name
+    @param empty - which images have nobody in them
+    @returns the least margin over the empty images and over the others, as
+             fractions of the contrast; inf where there are none
+    """
+    low = settings["contrast_low"]
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        # where the contrast score times the rest is the least confidence
+        flip = low + settings["min_confidence"] / rest * (settings["contrast_high"] - low)
+        margins = numpy.where(empty, flip - contrast, contrast - flip) / contrast
+    return (float(numpy.min(margins[empty], initial=numpy.inf)),
+            float(numpy.min(margins[~empty], initial=numpy.inf)))
+
+
+def score(angles, found, images, truth=None, mapping=None):
+    """!
+    This function scores the targets one candidate found.
+    @param angles - the (N, 2) angles of each image's centroid
+    @param found - which images it found a target in
+    @param images - the (source, label, frame) tuples they were found in
+    @param truth - a dictionary of true [yaw, pitch] setpoints by image name
+    @param mapping - (yaw_gain, yaw_offset, pitch_gain, pitch_offset)
+    @returns a dictionary of the false positive, miss and side error rates,
+             the RMS aim error (None without truth) and the cost
+    """
+    empty = numpy.array([is_empty(label) for source, label, frame in images])
+    fp = found[empty].mean() if empty.any() else 0.0
+    miss = (~found[~empty]).mean() if (~empty).any() else 0.0
+    # the middle of each file is where its mid or cent images were found
+    middles = {}
+    for n, (source, label, frame) in enumerate(images):
+        if found[n] and ("mid" in label or "cent" in label):
+            middles.setdefault(source, []).append(angles[n, 0])
+    sides = []
+    for n, (source, label, frame) in enumerate(images):
+        side = -1 if "left" in label else 1 if "right" in label else 0
+        if side and source in middles:
+            middle = sum(middles[source])/len(middles[source])
+            sides.append(bool(found[n]) and (angles[n, 0] - middle)*side > 0)
+    side_error = 1 - sum(sides)/len(sides) if sides else 0.0
+    aim = None
+    if truth and mapping:
+        yaw_gain, yaw_offset, pitch_gain, pitch_offset = mapping
+        errors = []
+        for key, n in zip(frame_keys(images), range(len(images))):
+            if key in truth and found[n]:
+                yaw = yaw_gain*angles[n, 0] + yaw_offset
+                pitch = pitch_gain*angles[n, 1] + pitch_offset
+                errors.append((yaw - truth[key][0])**2 + (pitch - truth[key][1])**2)
+        aim = math.sqrt(sum(errors)/len(errors)) if errors else None
+    cost = FP_WEIGHT*fp + MISS_WEIGHT*miss + SIDE_WEIGHT*side_error
+    if aim is not None:
+        cost += AIM_WEIGHT*aim
+    return {"false_positives": float(fp), "misses": float(miss), "side_errors": float(side_error),
+            "aim_rms": aim, "cost": float(cost)}
+
+
+def sweep(images, patches, grids, mappings, truth=None, processes=None, cache=None):
+    """!
+    This function scores every combination of the given settings.
+    Combinations where a score would end before it starts are left out.
+    @param images - the (source, label, frame) tuples from load_images()
+    @param patches - (patch_rows, patch_cols) to try
+    @param grids - a list of values to try for each of SETTINGS, in order
+    @param mappings - (yaw_gain, yaw_offset, pitch_gain, pitch_offset) to try
+    @param truth - true setpoints by image name, or None
+    @param processes - how many worker processes to use
+    @param cache - the measurement cache
+    @returns a list of (settings, scores) sorted best first, and the number
+             of measurements worked out rather than taken from the cache
+    """
+    frames = numpy.array([frame for source, label, frame in images])
+    empty = numpy.array([is_empty(label) for source, label, frame in images])
+    measurements, computed = find_measurements(frames, patches, processes, cache)
+    results = []
+    for patch in patches:
+        contrast, area, compactness, x, y = measurements[patch]
+        angles = numpy.stack((x, y), axis=1)
+        for candidate in itertools.product(*grids):
+            settings = dict(zip(SETTINGS, candidate))
+            if (settings["contrast_high"] <= settings["contrast_low"]
+                    or settings["area_max"] <= settings["area_good"]):
+                continue
+            found = vision_batch.confidence(contrast, area, compactness,
+                                            *candidate[:-1]) >= settings["min_confidence"]
+            # the area and compactness scores, with the contrast scoring 1
+            rest = vision_batch.confidence(numpy.inf, area, compactness, *candidate[:-1])
+            empty_margin, target_margin = margin(contrast, rest, settings, empty)
+            for mapping in (mappings if truth else mappings[:1]):
+                entry = {"patch_rows": patch[0], "patch_cols": patch[1]}
+                entry.update(settings)
+                entry.update(zip(("yaw_gain", "yaw_offset", "pitch_gain", "pitch_offset"), mapping))
+                scores = score(angles, found, images, truth, mapping)
+                scores["margin"] = min(empty_margin, target_margin)
+                scores["empty_margin"] = empty_margin
+                scores["target_margin"] = target_margin
+                results.append((entry, scores))
+    results.sort(key=rank)
+    return results, computed
+
+
+def rank(result):
+    """!
+    Sorts results best first: the least cost, then the empty images at least
+    EMPTY_MARGIN below the cut, then the most room for people.
+    @param result - a (settings, scores) tuple
+    """
+    scores = result[1]
+    return scores["cost"], -min(scores["empty_margin"], EMPTY_MARGIN), -scores["target_margin"]
+
+
+def cross_validate(images, patches, grids, mappings, truth=None, processes=None, cache=None):
+    """!
+    This function sweeps with each recorded file held out in turn, and
+    scores the best settings on the images of the file left out.
+    @param images - the (source, label, frame) tuples from load_images()
+    @param patches, grids, mappings, truth, processes, cache - as for sweep()
+    @returns a list of (held out source, best settings, scores on the rest,
+             scores on the held out images)
+    """
+    folds = []
+    for source in sorted(set(image[0] for image in images), key=[image[0] for image in images].index):
+        rest = [image for image in images if image[0] != source]
+        held = [image for image in images if image[0] == source]
+        results, computed = sweep(rest, patches, grids, mappings, truth, processes, cache)
+        best, scores = results[0]
+        mapping = tuple(best[k] for k in ("yaw_gain", "yaw_offset", "pitch_gain", "pitch_offset"))
+        held_out, computed = sweep(held, [(best["patch_rows"], best["patch_cols"])],
+                                   [[best[setting]] for setting in SETTINGS], [mapping], truth, 1, cache)
+        folds.append((source, best, scores, held_out[0][1]))
+    return folds
+
+
+def format_table(results, count=None):
+    """!
+    This function lays the results out as a fixed width text table.
+    @param results - (settings, scores) tuples from sweep()
+    @param count - only include this many of the best results
+    @returns the table as a string
+    """
+    lines = [f"{'rank':>4} {'patch':>5} {'contrast':>9} {'area':>9} {'compact':>7} {'conf':>5} "
+             f"{'yaw map':>13} {'pitch map':>13} {'fp_%':>5} {'miss_%':>6} {'side_%':>6} "
+             f"{'e_marg':>6} {'t_marg':>6} {'aim_rms':>7} {'cost':>6}"]
+    for rank, (s, r) in enumerate(results[:count], 1):
+        aim = "-" if r["aim_rms"] is None else f"{r['aim_rms']:.2f}"
+        lines.append(f"{rank:>4} {s['patch_rows']:>2g}x{s['patch_cols']:<2g} "
+                     f"{s['contrast_low']:>4g}:{s['contrast_high']:<4g} {s['area_good']:>4g}:{s['area_max']:<4g} "
+                     f"{s['compact_good']:>7g} {s['min_confidence']:>5g} "
+                     f"{s['yaw_gain']:>6g}x+{s['yaw_offset']:<6g} {s['pitch_gain']:>6g}x+{s['pitch_offset']:<6g} "
+                     f"{100*r['false_positives']:>5.0f} {100*r['misses']:>6.0f} "
+                     f"{100*r['side_errors']:>6.0f} {r['empty_margin']:>6.3f} {r['target_margin']:>6.3f} "
+                     f"{aim:>7} {r['cost']:>6.3f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Sweep the vision settings over the recorded images")
+    parser.add_argument("sources", nargs="*", default=list(DEFAULT_FILES),
+                        help="recorded .txt files or corpus.py stores")
+    # the defaults hold the settings cam2setpoint.py has, so a sweep with
+    # them finds those settings again
+    parser.add_argument("--patch-rows", default="6,8,10", help="a,b,c or start:stop:step")
+    parser.add_argument("--patch-cols", default="2,3,4")
+    parser.add_argument("--contrast-low", default="0:30:5")
+    parser.add_argument("--contrast-high", default="40:80:5")
+    parser.add_argument("--area-good", default="100,150,200")
+    parser.add_argument("--area-max", default="200,300,400")
+    parser.add_argument("--compact-good", default="0.05,0.2")
+    parser.add_argument("--min-confidence", default="0.1:0.9:0.025")
+    parser.add_argument("--yaw-gain", default=str(CURRENT["yaw_gain"]))
+    parser.add_argument("--yaw-offset", default=str(CURRENT["yaw_offset"]))
+    parser.add_argument("--pitch-gain", default=str(CURRENT["pitch_gain"]))
+    parser.add_argument("--pitch-offset", default=str(CURRENT["pitch_offset"]))
+    parser.add_argument("--truth", help="JSON of true [yaw, pitch] setpoints by image name")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--cache", default=CACHE_FILE, help="measurement cache file")
+    parser.add_argument("--top", type=int, default=15, help="how many candidates to print")
+    parser.add_argument("--out", help="JSON file to write the best settings and scores to")
+    parser.add_argument("--cross-validate", action="store_true",
+                        help="also sweep with each file held out and score the winner on it")
+    args = parser.parse_args()
+
+    images = load_images(args.sources)
+    truth = None
+    if args.truth:
+        with open(args.truth) as file:
+            truth = json.load(file)
+    try:
+        with open(args.cache) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        cache = {}
+    mappings = list(itertools.product(parse_values(args.yaw_gain), parse_values(args.yaw_offset),
+                                      parse_values(args.pitch_gain), parse_values(args.pitch_offset)))
+    patches = [(int(rows), int(cols)) for rows, cols in itertools.product(parse_values(args.patch_rows),
+                                                                           parse_values(args.patch_cols))]
+    grids = [parse_values(getattr(args, setting)) for setting in SETTINGS]
+
+    starttime = time.perf_counter()
+    results, computed = sweep(images, patches, grids, mappings, truth, args.processes, cache)
+    totaltime = time.perf_counter() - starttime
+    with open(args.cache, "w") as file:
+        json.dump(cache, file)
+
+    current_mapping = tuple(CURRENT[k] for k in ("yaw_gain", "yaw_offset", "pitch_gain", "pitch_offset"))
+    current, _ = sweep(images, [(CURRENT["patch_rows"], CURRENT["patch_cols"])],
+                       [[CURRENT[setting]] for setting in SETTINGS], [current_mapping], truth, 1, cache)
+    print(f"{len(results)} candidates on {len(images)} images in {totaltime:.2f} s, "
+          f"{computed} of {len(patches)*len(images)} measurements worked out, the rest cached")
+    print("Settings as cam2setpoint.py has them, with main.py's mapping:")
+    print(format_table(current))
+    print("Best candidates:")
+    print(format_table(results, args.top))
+    if args.cross_validate:
+        print("Each file held out in turn, the best settings on the rest scored on it:")
+        for source, best, scores, held in cross_validate(images, patches, grids, mappings, truth,
+                                                         args.processes, cache):
+            print(f"{source} held out: fp {100*held['false_positives']:.0f}% "
+                  f"miss {100*held['misses']:.0f}% side {100*held['side_errors']:.0f}% "
+                  f"margins {held['empty_margin']:.3f}/{held['target_margin']:.3f}")
+            print(format_table([(best, scores)]))
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump({"settings": results[0][0], "scores": results[0][1]}, file, indent=1)
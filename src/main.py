@@ -45,12 +45,43 @@ from motor_drivers.encoder_reader import Encoder
 from motor_drivers.motor_driver import MotorDriver
 from motor_drivers.controller import CLController
 from motor_drivers.servo_driver import Servo
+from motor_drivers.move_planner import MovePlanner
 from mlx_cam import MLX_Cam as Cam
 from ulab import numpy as np
 from machine import Pin, I2C
-from cam2setpoint import cam2setpoint
+from cam2setpoint import find_targets
+from cam2turret import cam2turret
+from frame_filter import FrameFilter, MotionDetector
+from target_queue import TargetQueue
+from task_events import EventShare, Alarm
+from shared_record import SharedRecord
 
 WAIT_TIME = 13000 #wait time (ms) to stop program after starting code
+# velocity (deg/s) and acceleration (deg/s^2) limits used by the move planner,
+# in the same units as the motor setpoints
+YAW_VMAX = 720
+YAW_AMAX = 3600
+PITCH_VMAX = 90
+PITCH_AMAX = 450
+HOME_YAW = -180 #yaw setpoint the turret starts at and returns to
+HOME_PITCH = 30 #pitch setpoint the turret starts at and returns to
+PLAN_TOLERANCE = 0.5 #how far (setpoint deg) a target can move before the move is replanned; a replan carries on at the axes' current velocity
+TRIGGER_LEAD = 150 #how long (ms) before the predicted arrival to arm the trigger
+TRIGGER_ARM_ANGLE = 10 #servo angle that takes up the trigger slack without firing
+TRIGGER_FIRE_ANGLE = 25 #servo angle that fires the gun
+FIRE_DELAY = 40 #time (ms) from the servo being told to fire to the shot leaving the barrel
+YAW_FIRE_TOLERANCE = 0.5 #predicted yaw error (deg) the shot may leave with
+PITCH_FIRE_TOLERANCE = 1 #predicted pitch error (deg) the shot may leave with
+ENGAGE_TARGETS = 1 #the switch for multi-target mode: the most people shot in one run, 1 to fire once and go home;
+                   # more has the camera look for that many with find_targets() and the trigger shoot each in
+                   # slew order, each with its own WAIT_TIME. Keep it at 1 until python -m host.vision_eval
+                   # --locator cam2setpoint:find_targets --option max_targets=3 shows no extra targets on the
+                   # images you've recorded. cam2setpoint.MAX_TARGETS is only find_targets()'s default
+RETURN_TIME = 1050 #time (ms) given to the return home before the program ends
+TRIGGER_HOLD = 450 #time (ms) the servo holds the trigger pulled after a shot
+ALARM_TIMER = 7 #timer that wakes the tasks without a period
+ALARM_TICK = 5 #how often (ms) the alarm checks for tasks to wake
+CAMERA_RETRY = 5 #time (ms) to check the camera again when a subpage is late
 class MotorContainer:
     """! 
     This class implements all the motors needed for our death machine.
@@ -108,9 +139,73 @@ def get_conversion_factor(belt_ratio):
     co_fac = counts_per_tick*ticks_per_rev*rev_per_deg*mech_advantage # the conversion factor in counts/degree
     return co_fac
 
+def command_move(yaw_setpoint, pitch_setpoint):
+    """!
+    This function plans a coordinated move of both axes to new setpoints and
+    publishes the targets and the predicted time of arrival together, so
+    the motors never see half of a new move.
+    @param yaw_setpoint - the yaw motor setpoint to move to
+    @param pitch_setpoint - the pitch motor setpoint to move to
+    """
+    arrival = planner.plan(yaw_setpoint, pitch_setpoint, PLAN_TOLERANCE)
+    motor_setpoints.put(yaw_setpoint, pitch_setpoint, arrival)
+
+def make_shares():
+    """!
+    This function makes the shares, the move planner, the target queue and
+    the alarm the tasks use, as globals of this file, clears the shares and
+    plans the first move.  It is called before the tasks are made, here and
+    by the PC tools which run the tasks.
+    """
+    global turret_status, motor_setpoints, yaw_position, pitch_position
+    global yaw_velocity, pitch_velocity, planner, target_queue, alarm
+    # the run motors, yaw/pitch motor reached location and returning to home
+    # booleans, which are read and written together
+    turret_status = SharedRecord((("run", "B"), ("yaw_done", "B"), ("pitch_done", "B"),
+                                  ("returning", "B")), name="Turret status")
+    # the motor setpoints and the predicted arrival time (ms) of the move to them
+    motor_setpoints = SharedRecord((("yaw", "f"), ("pitch", "f"), ("arrival", "L")),
+                                   name="Motor setpoints")
+    yaw_position = EventShare("f", name="Yaw encoder position")
+    pitch_position = EventShare("f", name="Pitch encoder position")
+    yaw_velocity = task_share.Share("f", name="Yaw encoder velocity")
+    pitch_velocity = task_share.Share("f", name="Pitch encoder velocity")
+    # plans the coordinated yaw/pitch moves, starting from the home position
+    planner = MovePlanner(YAW_VMAX, YAW_AMAX, PITCH_VMAX, PITCH_AMAX, HOME_YAW, HOME_PITCH)
+    # the people to shoot, in the order they are shot
+    target_queue = TargetQueue(planner, ENGAGE_TARGETS)
+    #clearing shares
+    turret_status.put(0, 0, 0, 0)
+    yaw_position.put(HOME_YAW)
+    pitch_position.put(HOME_PITCH)
+    yaw_velocity.put(0)
+    pitch_velocity.put(0)
+    # the turret starts at home and first turns around to face forward
+    command_move(0, 0)
+    # wakes the tasks without a period at the times they ask for
+    alarm = Alarm(ALARM_TIMER, ALARM_TICK)
+
+def wake_on_events():
+    """!
+    This function sets up what wakes the tasks that have no period, and
+    wakes each once so it runs its setup.  The trigger task runs when the
+    motors start or report they are done or a new move is planned, and
+    while it is aiming when the motors move; the timing task when the motors
+    are done or the turret starts home; and all three when the alarm goes
+    off for them.
+    """
+    turret_status.wake(task4, "run", "yaw_done", "pitch_done")
+    motor_setpoints.wake(task4, "arrival")
+    turret_status.wake(task5, "yaw_done", "pitch_done", "returning")
+    task1.go()
+    task4.go()
+    task5.go()
+
 def camera_handler_fun():
     """!
-    This function implements the camera handler task and its finite state machine
+    This function implements the camera handler task and its finite state machine.
+    The task has no period: it wakes when the camera should have a subpage
+    ready, reads it, and goes straight on to the vision once it has both.
     """
     t1state = 0 #set state variable to 0 to ensure it inits
     #zero camera parameters 
@@ -118,32 +213,63 @@ def camera_handler_fun():
     im_arr = None
     camera = None
     regions = None
-    target = None
+    targets = None
+    frame_filter = FrameFilter() #averages out the pixel noise between images
+    motion_detector = MotionDetector() #finds the pixels that moved since the last image
+    motion = None
     if t1state == 0: #state zero
         i2c_bus = I2C(1, freq = 400000, timeout=1000000) #creating bus object
         i2c_address = 0x33 #assigning address per data sheet
         camera = Cam(i2c_bus) #creating camera object from MLX_Cam class
         camera._camera.refresh_rate = 10.0 #frequency of image gathering
+        subpage_ms = int(1000/camera._camera.refresh_rate) #time between subpages
         t1state = 1
+        alarm.wake_after(task1, subpage_ms) #the first subpage takes a whole subpage
         yield t1state
     else:
         raise ValueError(f"Invalid State in Task 1.  Current state is {t1state}")
     while True:
         if t1state == 1:
-            while not image:
-                image = camera.get_image_nonblocking()
+            if not camera._camera.has_data:
+                # a little early for this subpage, so look again soon
+                alarm.wake_after(task1, CAMERA_RETRY)
                 yield t1state
+                continue
+            image = camera.get_image_nonblocking()
+            if not image:
+                # that was the first subpage, the second is a subpage later
+                alarm.wake_after(task1, subpage_ms)
+                yield t1state
+                continue
             im_arr = camera.get_array(image)
+            motion = motion_detector.update(im_arr) #from the raw image, so it isn't slowed by the filter
+            im_arr = frame_filter.update(im_arr)
             t1state = 2
+            task1.go()
             yield t1state
         elif t1state == 2:
-            yaw_angle, pitch_angle = cam2setpoint(im_arr)
-            print(f"{yaw_angle}, {pitch_angle}")
-            if not returning.get() == 1:
-                yaw_motor_setpoint.put(16*yaw_angle+11.5)
-                pitch_motor_setpoint.put(pitch_angle/2+2)
+            targets = find_targets(im_arr, target_queue.size, motion=motion)
+            # an empty list means nobody is in the image, so leave the motors alone
+            if targets:
+                for yaw_angle, pitch_angle, confidence in targets:
+                    print(f"{yaw_angle}, {pitch_angle}, {confidence}")
+                if not turret_status.get("returning") == 1:
+                    setpoints = [cam2turret(yaw_angle, pitch_angle)
+                                 for yaw_angle, pitch_angle, confidence in targets]
+                    if not target_queue.loaded():
+                        # shoot everyone in the order that slews the least
+                        # from wherever the turret is now
+                        target = target_queue.load(setpoints, yaw_position.get(), pitch_position.get())
+                        # the motors are only done once they reach the first person,
+                        # not the place they turned to before anyone was seen
+                        turret_status.set("yaw_done", 0, "pitch_done", 0)
+                    else:
+                        target = target_queue.track(setpoints)
+                    if target is not None:
+                        command_move(*target)
             image = None
             t1state = 1
+            alarm.wake_after(task1, subpage_ms)
             yield t1state
             
             
@@ -177,7 +303,9 @@ def yaw_motor_fun():
         timer = pyb.Timer(3, prescaler = 0, period = 65535)
         # create the encoder object
         encoder = Encoder(pin1, pin2, timer, conversion_factor = co_fac1)
-        encoder.set_pos(-180)
+        encoder.set_pos(HOME_YAW)
+        last_angle = HOME_YAW
+        last_time = utime.ticks_us()
         # create controller object
         con = CLController(35, 0,0, 180)
         t2state = 1
@@ -188,21 +316,27 @@ def yaw_motor_fun():
         #print("State 2")
         if t2state == 1:
             motor.set_duty_cycle(0)
-            if run_motors.get() != 0:
+            if turret_status.get("run") != 0:
                 t2state = 2
             yield t2state
         elif t2state == 2:
-            y_sp = yaw_motor_setpoint.get()
-            con.set_setpoint(y_sp)
+            y_sp = motor_setpoints.get("yaw")
+            # follow the planned profile, the error is still against the target
+            con.set_setpoint(planner.get_yaw_setpoint())
             #print(y_sp)
             encoder_angle = encoder.read()
+            now = utime.ticks_us()
+            yaw_position.put(encoder_angle)
+            yaw_velocity.put((encoder_angle-last_angle)*1000000/max(utime.ticks_diff(now, last_time), 1))
+            last_angle = encoder_angle
+            last_time = now
             #der_angle}")
             yaw_err = y_sp-encoder_angle
             yaw_err_list.append(abs(yaw_err))
             if len(yaw_err_list)>=yaw_err_len:
                 avg_yaw_err = sum(yaw_err_list)/yaw_err_len
                 if abs(avg_yaw_err)<yaw_motor_threshold:
-                    yaw_motor_done.put(1)
+                    turret_status.set("yaw_done", 1)
                 yaw_err_list = []
             eff = con.run(encoder_angle)
             motor.set_duty_cycle(eff)
@@ -240,7 +374,9 @@ def pitch_motor_fun():
         timer = pyb.Timer(2, prescaler = 0, period = 65535)
         # create the encoder object
         encoder = Encoder(pin1, pin2, timer, conversion_factor = co_fac2)
-        encoder.set_pos(30)
+        encoder.set_pos(HOME_PITCH)
+        last_angle = HOME_PITCH
+        last_time = utime.ticks_us()
         # create controller object
         con = CLController(25, 0.1, 2, 180)
         t3state = 1
@@ -251,19 +387,25 @@ def pitch_motor_fun():
         #print("State 3")
         if t3state == 1:
             motor.set_duty_cycle(0)
-            if run_motors.get() != 0:
+            if turret_status.get("run") != 0:
                 t3state = 2
             yield t3state
         elif t3state == 2:
-            p_sp = pitch_motor_setpoint.get()
-            con.set_setpoint(p_sp)
+            p_sp = motor_setpoints.get("pitch")
+            # follow the planned profile, the error is still against the target
+            con.set_setpoint(planner.get_pitch_setpoint())
             encoder_angle = encoder.read()
+            now = utime.ticks_us()
+            pitch_position.put(encoder_angle)
+            pitch_velocity.put((encoder_angle-last_angle)*1000000/max(utime.ticks_diff(now, last_time), 1))
+            last_angle = encoder_angle
+            last_time = now
             pitch_err = p_sp-encoder_angle
             pitch_err_list.append(pitch_err)
             if len(pitch_err_list)>=5:
                 avg_pitch_err = sum(pitch_err_list)/5
                 if avg_pitch_err<pitch_motor_threshold:
-                    pitch_motor_done.put(1)
+                    turret_status.set("pitch_done", 1)
                 pitch_err_list.pop(0)
             eff = con.run(encoder_angle)
             motor.set_duty_cycle(eff)
@@ -274,11 +416,20 @@ def pitch_motor_fun():
 
 def trigger_fun():
     """!
-    This function controls the yaw motor as part of the second task
-    It runs the motor from 0 degrees to 180 degrees using a proportional controller
+    This function controls the trigger servo.  It arms the trigger (takes up
+    the slack) once the planner predicts the turret is about to arrive on
+    target.  It fires FIRE_DELAY early, as soon as the errors predicted for
+    when the shot leaves the barrel are inside the fire tolerances, or once
+    both motors report they are done if that comes first.  The task has no
+    period: it wakes when the motors start or finish, when a new move is
+    planned, when the alarm it sets goes off, and while it is aiming every
+    time the motors move.  Until the camera queues a target it only waits,
+    so the first move to face forward is never shot at.  After each shot it
+    moves on to the next target in the queue, and once there are none left
+    it sends the turret home.
     """
     t4state = 0
-    counter = 0
+    hold_end = 0
     if t4state == 0:
         # Defining a different pin with an alternate function for Timer 2
         servo_pin = pyb.Pin(pyb.Pin.cpu.E5, pyb.Pin.OUT_PP)
@@ -286,27 +437,73 @@ def trigger_fun():
         timer = pyb.Timer(15, freq=50)  # Timer 2 with a frequency of 50 Hz
         servo = Servo(servo_pin,timer)
         t4state = 1
+        task4.go()
         yield t4state
     else:
         raise ValueError(f"Invalid State in Task 4.  Current state is {t4state}")
     while True:
         #print("State 4")
         if t4state == 1:
-            if yaw_motor_done.get() > 0 and pitch_motor_done.get() > 0:
-                print("pew")
-                servo.set_servo(25)
-                run_motors.put(0)
+            if target_queue.current() is None:
+                # nobody to shoot yet; the camera queueing someone plans a
+                # move, which wakes the task
+                yield t4state
+                continue
+            # arm ahead of the predicted arrival so the shot goes off sooner
+            to_arm = utime.ticks_diff(motor_setpoints.get("arrival"), utime.ticks_ms()) - TRIGGER_LEAD
+            run, yaw_done, pitch_done, returning = turret_status.get()
+            if run != 0 and to_arm <= 0:
+                servo.set_servo(TRIGGER_ARM_ANGLE)
+                t4state = 2
+            if yaw_done > 0 and pitch_done > 0:
                 t4state = 2
+            if t4state == 2:
+                # aiming, so look again every time the motors move
+                yaw_position.wake(task4)
+                pitch_position.wake(task4)
+                task4.go()
+            elif to_arm > 0:
+                alarm.wake_after(task4, to_arm)
             yield t4state
         elif t4state == 2:
-            if counter == 30:
-                servo.set_servo(0)
-                run_motors.put(1)
-                returning.put(1)
+            # where the turret will be when the shot leaves, not where it is
+            # now; while it is still swinging through the target the
+            # prediction can't be trusted, so it also has to be settling
+            run, yaw_done, pitch_done, returning = turret_status.get()
+            yaw_vel = yaw_velocity.get()
+            pitch_vel = pitch_velocity.get()
+            yaw_err, pitch_err = planner.predicted_errors(yaw_position.get(), yaw_vel,
+                                                          pitch_position.get(), pitch_vel,
+                                                          FIRE_DELAY)
+            if ((abs(yaw_err) <= YAW_FIRE_TOLERANCE and abs(pitch_err) <= PITCH_FIRE_TOLERANCE
+                    and abs(yaw_vel)*FIRE_DELAY <= YAW_FIRE_TOLERANCE*1000
+                    and abs(pitch_vel)*FIRE_DELAY <= PITCH_FIRE_TOLERANCE*1000)
+                    or (yaw_done > 0 and pitch_done > 0)):
+                print("pew")
+                servo.set_servo(TRIGGER_FIRE_ANGLE)
+                turret_status.set("run", 0)
+                yaw_position.ignore(task4)
+                pitch_position.ignore(task4)
+                hold_end = utime.ticks_add(utime.ticks_ms(), TRIGGER_HOLD)
+                alarm.wake_after(task4, TRIGGER_HOLD)
                 t4state = 3
-            counter += 1
             yield t4state
         elif t4state == 3:
+            # the motors can wake the task before the hold is up
+            if utime.ticks_diff(utime.ticks_ms(), hold_end) >= 0:
+                servo.set_servo(0)
+                target = target_queue.advance()
+                if target is not None:
+                    # on to the next person, who isn't aimed at yet
+                    command_move(*target)
+                    turret_status.set("yaw_done", 0, "pitch_done", 0, "run", 1)
+                    t4state = 1
+                    task4.go()
+                else:
+                    turret_status.set("returning", 1, "run", 1)
+                    t4state = 4
+            yield t4state
+        elif t4state == 4:
             yield t4state
         else:
             raise ValueError(f"Invalid State in Task 4.  Current state is {t4state}")
@@ -315,41 +512,65 @@ def timing_handler_fun():
     """!
     This is a generator function which defines the timing of tasks so that after
     the motor turn and shoot, the device returns back to its starting position.
+    Each target in the queue gets WAIT_TIME to be shot, counted from when the
+    trigger moves on to it; when that runs out the turret shoots wherever it
+    is, or goes home if nobody was ever found.
+    The task has no period: it wakes when the motors are done or the turret
+    starts home, and when the alarm it sets for its time limits goes off.
     """
     t5state = 0
     tstart = utime.ticks_ms()
     tend = tstart
+    engaged = 0 #the queue index of the target the time limit is for
     if t5state == 0:
         t5state = 1
+        task5.go()
         yield t5state
     while True:
         #print("State 5")
         if t5state == 1:
             curr_time = utime.ticks_ms() #set wait time
             if curr_time >= tend: 
-                run_motors.put(1) #put a 1 into the run motors queue
+                turret_status.set("run", 1) #start the motors
                 tstart = utime.ticks_ms()
                 tend = tstart + WAIT_TIME #define new start time
+                alarm.wake_after(task5, WAIT_TIME)
+                engaged = target_queue.index
                 t5state = 2
             yield t5state
         elif t5state == 2:
-            if utime.ticks_ms() > tend: #if 15 seconds has passed (without shooting)
+            if target_queue.index != engaged:
+                # the trigger moved on to the next person, who gets their own time
+                engaged = target_queue.index
+                tend = utime.ticks_ms() + WAIT_TIME
+                alarm.wake_after(task5, WAIT_TIME)
+            elif utime.ticks_ms() >= tend: #if the wait time has passed (without shooting)
                 print("here")
-                yaw_motor_done.put(1)
-                pitch_motor_done.put(1)
-                t5state = 3
-            if yaw_motor_done.get() == 1 and pitch_motor_done.get() == 1: #or both pitch and yaw are complete
-                tstart = utime.ticks_ms()  #set new start time
-                tend = tstart + 1500 #set new end time
+                if target_queue.current() is None:
+                    # nobody was found, so there is nothing to shoot
+                    turret_status.set("returning", 1, "run", 1)
+                else:
+                    # shoot wherever the turret is, then the next person gets their own time
+                    turret_status.set("yaw_done", 1, "pitch_done", 1)
+                    tend = utime.ticks_ms() + WAIT_TIME
+                    alarm.wake_after(task5, WAIT_TIME)
+            if turret_status.get("returning") == 1: #every target is done
                 t5state = 3
+                task5.go()
             yield t5state
         elif t5state == 3:
-            if returning.get()==1:   #if share: returning ==1
-                yaw_motor_setpoint.put(-180)
-                pitch_motor_setpoint.put(30)
-                if utime.ticks_ms() >= tend:
-                    returning.put(0)
-                    raise KeyboardInterrupt
+            if turret_status.get("returning") == 1:   #if the trigger sent the turret home
+                # every target is done, the return gets its own time
+                tend = utime.ticks_ms() + RETURN_TIME
+                alarm.wake_after(task5, RETURN_TIME)
+                t5state = 4
+                task5.go()
+            yield t5state
+        elif t5state == 4:
+            command_move(HOME_YAW, HOME_PITCH)
+            if utime.ticks_ms() >= tend:
+                turret_status.set("returning", 0)
+                raise KeyboardInterrupt
             yield t5state
         else:
             raise ValueError(f"Invalid State in Task 5.  Current state is {t5state}")
@@ -366,29 +587,19 @@ if __name__ == "__main__":
     # allocated for state transition tracing, and the application will run out
     # of memory after a while and quit. Therefore, use tracing only for 
     # debugging and set trace to False when it's not needed
-    run_motors = task_share.Share("B", name="Run the motors boolean") #boolean
-    yaw_motor_done = task_share.Share("B", name="Yaw motor reached location boolean")
-    pitch_motor_done = task_share.Share("B", name="Pitch motor reached location boolean")
-    returning = task_share.Share("B", name="Returning to home boolean")
-    yaw_motor_setpoint = task_share.Share("f", name="Yaw motor setpoint")
-    pitch_motor_setpoint = task_share.Share("f", name="Pitch motor setpoint") #float
-    #clearing shares
-    run_motors.put(0)
-    yaw_motor_done.put(0)
-    pitch_motor_done.put(0)
-    yaw_motor_setpoint.put(0)
-    pitch_motor_setpoint.put(0)
-    returning.put(0)
-    task1 = cotask.Task(camera_handler_fun, name="Task 1: Camera Handler", priority=5,period=50,
+    make_shares()
+    # the camera, trigger and timing tasks have no period, they run when woken
+    task1 = cotask.Task(camera_handler_fun, name="Task 1: Camera Handler", priority=5,period=None,
                         profile=True, trace=False)
     task2 = cotask.Task(yaw_motor_fun, name="Task 2: Yaw Motor Handler", priority=9,period=15,
                         profile=True, trace=False)
     task3 = cotask.Task(pitch_motor_fun, name="Task 3: Pitch Motor Handler", priority=9,period=15,
                         profile=True, trace=False)
-    task4 = cotask.Task(trigger_fun, name="Task 4: Trigger Handler", priority=10,period=15,
+    task4 = cotask.Task(trigger_fun, name="Task 4: Trigger Handler", priority=10,period=None,
                         profile=True, trace=False)
-    task5 = cotask.Task(timing_handler_fun, name="Task 5: Timing Handler", priority=10,period=15,
+    task5 = cotask.Task(timing_handler_fun, name="Task 5: Timing Handler", priority=10,period=None,
                         profile=True, trace=False)  
+    wake_on_events()
     # adding the tasks to task list (the scheduler)
     cotask.task_list.append(task1) 
     cotask.task_list.append(task2) 
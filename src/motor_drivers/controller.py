@@ -3,7 +3,8 @@
 This file contains the class implementation for controlling a plant based on a sensor.
 The controller class implements a PID controller to control a sensor input based on a setpoint.
 This file also creates a test file to run an Ametek Pittman Motor to a set position based on
-an encoder input reading.
+an encoder input reading.  The step response is logged and written to step_log.bin so that
+a motor model can be fit to it with host/sysid.py.
 
 @author Jared Sinasohn, Sydney Ulvick, Sean Nakashimo
 @date 22-Feb-2024
@@ -14,6 +15,7 @@ import pyb
 import utime
 from motor_drivers.encoder_reader import Encoder
 from motor_drivers.motor_driver import MotorDriver
+from motor_drivers.step_logger import StepLogger
 
 class CLController:
     """! 
@@ -161,16 +163,24 @@ if __name__ == "__main__":
     
     # create controller object
     con = CLController(1.63, 0, 0.3, 90)
-    while True:
+    
+    # create the step response log, 2000 samples is a couple of seconds
+    logger = StepLogger(2000)
+    while not logger.full():
         try:
             encoder_reading = encoder.read()
             encoder_angle = encoder_reading/16/256/4*360
             eff = con.run(encoder_angle)
             motor.set_duty_cycle(eff)
+            logger.log(utime.ticks_us(), con.setpoint, encoder_angle, eff)
         except KeyboardInterrupt:
             motor.set_duty_cycle(0)
+            logger.dump("step_log.bin")
             raise KeyboardInterrupt
         except ValueError:
             motor.set_duty_cycle(0)
             raise ValueError
         utime.sleep_ms(1)
+    motor.set_duty_cycle(0)
+    logger.dump("step_log.bin")
+    print(f"Logged {logger.count} samples to step_log.bin")
@@ -26,6 +26,7 @@ class MotorDriver:
         @param timer: timer that the motor uses for the PWM
         @param ch1: where the timer is being channeled to send to pin1
         @param ch2: where the timer is being channeled to send to pin2
+        @param counts_per_percent: timer compare counts for one percent of duty cycle
         """
         print ("Creating a motor driver")
         # defining parameters needed to characterize motor
@@ -36,8 +37,18 @@ class MotorDriver:
         self.en_pin.low() #disable the motor (for safety)
         self.ch1 = self.timer.channel(1, pyb.Timer.PWM, pin=self.in1pin)
         self.ch2 = self.timer.channel(2, pyb.Timer.PWM, pin=self.in2pin)
-        self.ch1.pulse_width_percent(0)
-        self.ch2.pulse_width_percent(0)
+        # the timer counts from 0 to its period, so a 100% duty cycle is a
+        # compare value of period+1.  Work this out once here so each call to
+        # set_duty_cycle can write raw compare values instead of percentages
+        self.full_scale = self.timer.period() + 1
+        self.counts_per_percent = self.full_scale / 100
+        self.ch1.pulse_width(0)
+        self.ch2.pulse_width(0)
+        # cache of what was last written to the hardware so that we only
+        # touch the pins and timer registers when something actually changes
+        self.direction = 0
+        self.compare = 0
+        self.enabled = False
     
         
     def set_duty_cycle (self, level):
@@ -47,44 +58,61 @@ class MotorDriver:
         cause torque in one direction, negative values
         in the opposite direction.  This function also
         saturates the level if the level is greater than 100
-        or -100
+        or -100.  The level is converted to a raw timer compare
+        value and the hardware is only written when the direction,
+        the compare value or the enable pin state has changed.
         @param level A signed integer holding the duty
                cycle of the voltage sent to the motor 
         """
         #setting the duty cycle
         try:
-            level = float(level)
-            if level < 0: #for negative in range
-                self.en_pin.high() #enable the motor
-                self.ch1.pulse_width_percent(0) #set in2 to zero
-                # if the level is greater than -100, nothing happens
-                # if it is less than -100, set the PWM to 100
-                # this saturates the level to -100 regardless of how big the level is
-                if level >= -100:
-                    self.ch2.pulse_width_percent(abs(level))
-                else:
-                    self.ch2.pulse_width_percent(100)
-            elif level > 0: #for positive in range
-                self.en_pin.high() #enable the motor
-                self.ch2.pulse_width_percent(0) #set in1 to zero
-                # if the level is less than 100, nothing happens
-                # if it is greater than 100, set the PWM to 100
-                # this saturates the level to 100 regardless of how big the level is
-                if level <= 100:
-                    self.ch1.pulse_width_percent(level)
-                else:
-                    self.ch1.pulse_width_percent(100)  
-            else:
-                self.ch1.pulse_width_percent(0)
-                self.ch2.pulse_width_percent(0)
-        except ValueError:
-            self.ch1.pulse_width_percent(0)
-            self.ch2.pulse_width_percent(0)
+            compare = int(level*self.counts_per_percent)
+        except (TypeError, ValueError, OverflowError):
+            self.disable()
             raise ValueError
+        if compare > 0: #for positive in range
+            direction = 1
+            # saturates the level to 100 regardless of how big the level is
+            if compare > self.full_scale:
+                compare = self.full_scale
+        elif compare < 0: #for negative in range
+            direction = -1
+            compare = -compare
+            # saturates the level to -100 regardless of how big the level is
+            if compare > self.full_scale:
+                compare = self.full_scale
+        else:
+            direction = 0
+        # if the direction changed, zero the channel that was driving first
+        if direction != self.direction:
+            if self.direction > 0:
+                self.ch1.pulse_width(0)
+            elif self.direction < 0:
+                self.ch2.pulse_width(0)
+            self.direction = direction
+            self.compare = 0
+        if direction == 0:
+            return
+        if not self.enabled:
+            self.en_pin.high() #enable the motor
+            self.enabled = True
+        if compare != self.compare:
+            if direction > 0:
+                self.ch1.pulse_width(compare)
+            else:
+                self.ch2.pulse_width(compare)
+            self.compare = compare
+
     def disable(self):
-        self.ch1.pulse_width_percent(0)
-        self.ch2.pulse_width_percent(0)
+        """!
+        This method turns both PWM channels off and sets the enable pin low.
+        """
+        self.ch1.pulse_width(0)
+        self.ch2.pulse_width(0)
         self.en_pin.low()
+        self.direction = 0
+        self.compare = 0
+        self.enabled = False
 
 if __name__ == "__main__":
     # power the motor for five seconds 
@@ -96,9 +124,16 @@ if __name__ == "__main__":
     motor.set_duty_cycle(100)
     utime.sleep(2)
     motor.set_duty_cycle(0)
-    
-
-
-
-
-
+    # time set_duty_cycle when the effort changes every call (hardware is
+    # written every time) and when it holds steady (nothing is written)
+    starttime = utime.ticks_us()
+    for n in range(1000):
+        motor.set_duty_cycle(20 + n % 2)
+    changing = utime.ticks_diff(utime.ticks_us(), starttime)
+    starttime = utime.ticks_us()
+    for n in range(1000):
+        motor.set_duty_cycle(20)
+    steady = utime.ticks_diff(utime.ticks_us(), starttime)
+    motor.disable()
+    print(f"set_duty_cycle, changing effort: {changing/1000} us per call")
+    print(f"set_duty_cycle, steady effort: {steady/1000} us per call")
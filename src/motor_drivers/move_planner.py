@@ -0,0 +1,318 @@
+"""!
+@file move_planner.py
+This file contains the class implementation for planning coordinated moves of the
+yaw and pitch axes.  Each axis follows a trapezoidal (or triangular) velocity
+profile limited by its own maximum velocity and acceleration.  The profile of the
+faster axis is stretched so that both axes arrive at their targets at the same
+time, and the predicted time of arrival is made available so that other tasks
+(the trigger) can get ready before the turret is on target.
+
+@author Jared Sinasohn, Sydney Ulvick, Sean Nakashimo
+@date 20-Mar-2024
+"""
+import math
+import utime
+
+class AxisProfile:
+    """!
+    This class implements a trapezoidal velocity profile for a single axis.
+    Positions and velocities are in the same units as the axis setpoint
+    (degrees), times are in seconds from the start of the move.  A move may
+    start with the axis already moving, such as when the target changes part
+    way through a move, so the profile is kept as up to four segments of
+    constant acceleration: braking to a stop if the axis is heading away
+    from the target or too fast to stop on it, changing to the cruise
+    velocity, cruising and slowing to a stop on the target.
+    """
+
+    def __init__(self, vmax, amax, pos=0):
+        """!
+        Creates a profile resting at the given position.
+        @param vmax - the maximum velocity of the axis in degrees per second
+        @param amax - the maximum acceleration of the axis in degrees per second squared
+        @param pos - the initial position of the axis in degrees
+        """
+        self.vmax = vmax
+        self.amax = amax
+        ## The positions the current move starts from and ends at, and its
+        #  length in seconds
+        self.start = pos
+        self.target = pos
+        self.duration = 0
+        # the end time, acceleration, and starting position and velocity of
+        # each segment of the current move
+        self._ends = [0.0] * 4
+        self._accels = [0.0] * 4
+        self._positions = [0.0] * 4
+        self._velocities = [0.0] * 4
+        self._count = 0
+
+    def _rest_time(self, distance):
+        # the shortest time to cover a distance starting and ending at rest;
+        # if the axis can't reach vmax before it has to slow down again the
+        # profile is a triangle, otherwise it is a trapezoid
+        d = abs(distance)
+        if d*self.amax <= self.vmax*self.vmax:
+            return 2*math.sqrt(d/self.amax)
+        return d/self.vmax + self.vmax/self.amax
+
+    def min_time(self, distance, velocity=0):
+        """!
+        This method calculates the shortest time the axis can cover a distance
+        in, starting at a velocity and ending at rest.
+        @param distance - the signed distance to travel in degrees
+        @param velocity - the signed velocity at the start in degrees per second
+        @returns the minimum move time in seconds
+        """
+        a = self.amax
+        if velocity == 0:
+            return self._rest_time(distance)
+        stop = velocity*abs(velocity)/(2*a)
+        if (distance - stop)*velocity < 0:
+            # the axis would pass the target before it could stop, so it
+            # stops first and comes back
+            return abs(velocity)/a + self._rest_time(distance - stop)
+        d = abs(distance)
+        u = abs(velocity)
+        peak = math.sqrt(a*d + u*u/2)
+        if peak <= self.vmax:
+            return (2*peak - u)/a
+        return (2*self.vmax - u)/a + (d - (2*self.vmax*self.vmax - u*u)/(2*a))/self.vmax
+
+    def plan(self, start, target, duration, velocity=0):
+        """!
+        This method plans a move that takes exactly the given duration.  The
+        duration must be at least min_time(target-start, velocity).  The axis
+        changes velocity at amax to a reduced cruise velocity so that it
+        arrives on time, so it never has to change velocity faster than amax
+        whatever it was doing when the move was planned.
+        @param start - the position to start the move from in degrees
+        @param target - the position to end the move at in degrees
+        @param duration - the length of the move in seconds
+        @param velocity - the velocity of the axis at the start in degrees per second
+        """
+        self.start = start
+        self.target = target
+        self.duration = duration
+        self._count = 0
+        self._positions[0] = start
+        self._velocities[0] = velocity
+        a = self.amax
+        d = target - start
+        if duration <= 0 or (d == 0 and velocity == 0):
+            return
+        stop = velocity*abs(velocity)/(2*a)
+        if velocity != 0 and (d - stop)*velocity < 0:
+            # brake to a stop, then make a move from rest in the time left
+            brake = abs(velocity)/a
+            self._add(brake, -a if velocity > 0 else a)
+            self._plan_rest(target - self._positions[1], duration - brake)
+            return
+        direction = 1 if velocity > 0 or (velocity == 0 and d > 0) else -1
+        u = abs(velocity)
+        d = abs(d)
+        # speeding up from u to a cruise velocity v, cruising and stopping
+        # in T covers d when v^2 - (aT + u)v + u^2/2 + ad = 0; take the
+        # smaller root
+        b = a*duration + u
+        disc = b*b - 4*(u*u/2 + a*d)
+        if disc < 0:
+            disc = 0
+        vpeak = (b - math.sqrt(disc))/2
+        if vpeak < u:
+            # slowing down to the cruise velocity instead, d = u^2/(2a) + v(T - u/a)
+            vpeak = (d - u*u/(2*a))/(duration - u/a) if duration > u/a else 0
+            vpeak = max(vpeak, 0)
+        change = abs(vpeak - u)/a
+        self._add(change, direction*a if vpeak > u else -direction*a)
+        self._add(max(duration - change - vpeak/a, 0), 0)
+        self._add(vpeak/a, -direction*a)
+
+    def _plan_rest(self, distance, duration):
+        # a move from rest to rest, after any segments already planned
+        direction = 1 if distance >= 0 else -1
+        d = abs(distance)
+        # the distance covered by a profile of peak velocity v is
+        # d = v*T - v^2/a, solve for the smaller root
+        disc = (self.amax*duration)**2 - 4*self.amax*d
+        if disc < 0:
+            disc = 0
+        vpeak = (self.amax*duration - math.sqrt(disc))/2
+        t_acc = vpeak/self.amax
+        self._add(t_acc, direction*self.amax)
+        self._add(max(duration - 2*t_acc, 0), 0)
+        self._add(t_acc, -direction*self.amax)
+
+    def _add(self, length, accel):
+        # adds a segment of constant acceleration and works out where the
+        # next one starts
+        n = self._count
+        begin = self._ends[n - 1] if n else 0.0
+        self._ends[n] = begin + length
+        self._accels[n] = accel
+        self._count = n + 1
+        if n + 1 < len(self._ends):
+            v = self._velocities[n]
+            self._positions[n + 1] = self._positions[n] + v*length + 0.5*accel*length*length
+            self._velocities[n + 1] = v + accel*length
+
+    def position(self, t):
+        """!
+        This method returns the profile position at a time into the move.
+        @param t - the time since the start of the move in seconds
+        @returns the position of the axis in degrees
+        """
+        if t <= 0:
+            return self.start
+        if t >= self.duration:
+            return self.target
+        begin = 0.0
+        for n in range(self._count):
+            if t < self._ends[n]:
+                dt = t - begin
+                return self._positions[n] + self._velocities[n]*dt + 0.5*self._accels[n]*dt*dt
+            begin = self._ends[n]
+        return self.target
+
+    def velocity(self, t):
+        """!
+        This method returns the profile velocity at a time into the move.
+        @param t - the time since the start of the move in seconds
+        @returns the velocity of the axis in degrees per second
+        """
+        if t < 0 or t >= self.duration:
+            return 0
+        begin = 0.0
+        for n in range(self._count):
+            if t < self._ends[n]:
+                return self._velocities[n] + self._accels[n]*(t - begin)
+            begin = self._ends[n]
+        return 0
+
+    def predict(self, t, lead, pos, vel):
+        """!
+        This method predicts where the axis will be a little later from where
+        it is and how fast it is going.  The axis is taken to keep lagging the
+        profile by what it lags it now, so on top of carrying on at its own
+        velocity it speeds up or slows down over the lead as the profile does.
+        @param t - the time since the start of the move in seconds
+        @param lead - how far ahead to predict in seconds
+        @param pos - the position of the axis now in degrees
+        @param vel - the velocity of the axis now in degrees per second
+        @returns the predicted position in degrees
+        """
+        return pos + vel*lead + self.position(t+lead) - self.position(t) - self.velocity(t)*lead
+
+
+class MovePlanner:
+    """!
+    This class implements a planner that moves the yaw and pitch axes to a
+    target together so that they both arrive at the same time.
+    """
+
+    def __init__(self, yaw_vmax, yaw_amax, pitch_vmax, pitch_amax, yaw_pos=0, pitch_pos=0):
+        """!
+        Creates a planner with both axes resting at their initial positions.
+        @param yaw_vmax - the maximum velocity of the yaw axis in degrees per second
+        @param yaw_amax - the maximum acceleration of the yaw axis in degrees per second squared
+        @param pitch_vmax - the maximum velocity of the pitch axis in degrees per second
+        @param pitch_amax - the maximum acceleration of the pitch axis in degrees per second squared
+        @param yaw_pos - the initial yaw position in degrees
+        @param pitch_pos - the initial pitch position in degrees
+        @param start_ms - the time in ms that the current move started at
+        @param arrival_ms - the predicted time in ms that both axes reach the target
+        """
+        self.yaw = AxisProfile(yaw_vmax, yaw_amax, yaw_pos)
+        self.pitch = AxisProfile(pitch_vmax, pitch_amax, pitch_pos)
+        self.start_ms = utime.ticks_ms()
+        self.arrival_ms = self.start_ms
+
+    def plan(self, yaw_target, pitch_target, tolerance=0):
+        """!
+        This method plans a coordinated move from the current commanded position
+        and velocity to a new target.  If the target is within the tolerance of the current
+        target on both axes, the move in progress is left alone so that repeated
+        commands to the same spot don't restart the profile.
+        @param yaw_target - the yaw position to move to in degrees
+        @param pitch_target - the pitch position to move to in degrees
+        @param tolerance - how far the target may move (degrees) without replanning
+        @returns the predicted time of arrival in ms, comparable to utime.ticks_ms()
+        """
+        if (abs(yaw_target-self.yaw.target) <= tolerance
+                and abs(pitch_target-self.pitch.target) <= tolerance):
+            return self.arrival_ms
+        now = utime.ticks_ms()
+        t = utime.ticks_diff(now, self.start_ms)/1000
+        # carry on from where the profiles are and how fast they are going,
+        # so a new target part way through a move doesn't jerk the axes
+        yaw_start = self.yaw.position(t)
+        pitch_start = self.pitch.position(t)
+        yaw_vel = self.yaw.velocity(t)
+        pitch_vel = self.pitch.velocity(t)
+        duration = max(self.yaw.min_time(yaw_target-yaw_start, yaw_vel),
+                       self.pitch.min_time(pitch_target-pitch_start, pitch_vel))
+        self.yaw.plan(yaw_start, yaw_target, duration, yaw_vel)
+        self.pitch.plan(pitch_start, pitch_target, duration, pitch_vel)
+        self.start_ms = now
+        self.arrival_ms = utime.ticks_add(now, int(math.ceil(duration*1000)))
+        return self.arrival_ms
+
+    def move_time(self, yaw_start, pitch_start, yaw_target, pitch_target):
+        """!
+        This method calculates how long a coordinated move between two
+        positions takes, starting and ending at rest, without planning it.
+        @param yaw_start - the yaw position to start from in degrees
+        @param pitch_start - the pitch position to start from in degrees
+        @param yaw_target - the yaw position to move to in degrees
+        @param pitch_target - the pitch position to move to in degrees
+        @returns the move time in seconds
+        """
+        # the slower axis sets the length of the move
+        return max(self.yaw.min_time(yaw_target-yaw_start),
+                   self.pitch.min_time(pitch_target-pitch_start))
+
+    def get_yaw_setpoint(self):
+        """!
+        This method returns where the yaw axis should be right now.
+        @returns the yaw setpoint in degrees
+        """
+        return self.yaw.position(utime.ticks_diff(utime.ticks_ms(), self.start_ms)/1000)
+
+    def get_pitch_setpoint(self):
+        """!
+        This method returns where the pitch axis should be right now.
+        @returns the pitch setpoint in degrees
+        """
+        return self.pitch.position(utime.ticks_diff(utime.ticks_ms(), self.start_ms)/1000)
+
+    def predicted_errors(self, yaw_pos, yaw_vel, pitch_pos, pitch_vel, lead_ms):
+        """!
+        This method predicts how far off target both axes will be a little
+        later, from their positions and velocities now and what is left of
+        the planned move.
+        @param yaw_pos - the yaw position now in degrees
+        @param yaw_vel - the yaw velocity now in degrees per second
+        @param pitch_pos - the pitch position now in degrees
+        @param pitch_vel - the pitch velocity now in degrees per second
+        @param lead_ms - how far ahead to predict in ms
+        @returns the predicted yaw and pitch errors in degrees, target less position
+        """
+        t = utime.ticks_diff(utime.ticks_ms(), self.start_ms)/1000
+        lead = lead_ms/1000
+        return (self.yaw.target - self.yaw.predict(t, lead, yaw_pos, yaw_vel),
+                self.pitch.target - self.pitch.predict(t, lead, pitch_pos, pitch_vel))
+
+    def get_arrival_time(self):
+        """!
+        This method returns the predicted time of arrival of the current move.
+        @returns the arrival time in ms, comparable to utime.ticks_ms()
+        """
+        return self.arrival_ms
+
+    def time_to_arrival(self):
+        """!
+        This method returns how long until the current move is predicted to
+        finish.  The value is negative once the move is over.
+        @returns the time to arrival in ms
+        """
+        return utime.ticks_diff(self.arrival_ms, utime.ticks_ms())
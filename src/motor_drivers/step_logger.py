@@ -0,0 +1,81 @@
+"""!
+@file step_logger.py
+This file contains the class implementation for logging step responses of a motor.
+All of the memory for the log is allocated when the logger is created, so logging
+a sample inside a control loop doesn't allocate anything.  After the run the log
+is written to a binary file which can be copied to a PC and fit with host/sysid.py.
+
+The file is little endian: the four bytes b"STEP", the number of samples as a
+uint32, then that many int32 ticks_us values, then that many groups of three
+float32 values (setpoint, position, effort).
+
+@author Jared Sinasohn, Sydney Ulvick, Sean Nakashimo
+@date 20-Mar-2024
+"""
+import struct
+from array import array
+
+## Marks the start of a step log file
+LOG_MAGIC = b"STEP"
+
+class StepLogger:
+    """!
+    This class implements a fixed size log of (time, setpoint, position, effort) samples.
+    """
+
+    def __init__(self, size):
+        """!
+        Creates a logger and allocates room for all of its samples.
+        @param size - the number of samples the log can hold
+        @param ticks - the utime.ticks_us() time of each sample
+        @param data - the setpoint, position and effort of each sample, one after another
+        @param count - the number of samples logged so far
+        """
+        self.size = size
+        self.ticks = array('i', (0 for i in range(size)))
+        self.data = array('f', (0 for i in range(3*size)))
+        self.count = 0
+
+    def log(self, ticks_us, setpoint, position, effort):
+        """!
+        This method adds a sample to the log.  Once the log is full new samples
+        are dropped.
+        @param ticks_us - the time of the sample from utime.ticks_us()
+        @param setpoint - the controller setpoint
+        @param position - the measured position
+        @param effort - the effort sent to the motor
+        @returns True if the sample was logged, False if the log is full
+        """
+        n = self.count
+        if n >= self.size:
+            return False
+        self.ticks[n] = ticks_us
+        n3 = 3*n
+        self.data[n3] = setpoint
+        self.data[n3+1] = position
+        self.data[n3+2] = effort
+        self.count = n + 1
+        return True
+
+    def full(self):
+        """!
+        This method checks if there is room left in the log.
+        @returns True if the log is full
+        """
+        return self.count >= self.size
+
+    def reset(self):
+        """!
+        This method empties the log without freeing its memory.
+        """
+        self.count = 0
+
+    def dump(self, filename):
+        """!
+        This method writes the logged samples to a binary file.
+        @param filename - the name of the file to write
+        """
+        with open(filename, "wb") as file:
+            file.write(struct.pack("<4sI", LOG_MAGIC, self.count))
+            file.write(memoryview(self.ticks)[:self.count])
+            file.write(memoryview(self.data)[:3*self.count])
@@ -0,0 +1,185 @@
+"""!
+@file shared_record.py
+    This file contains a share of several values which are written and read
+    together, such as the two motor setpoints of a move or the status flags
+    of the turret.  With a share per value a task reads each one with its
+    own call, and nothing says the values it gets belong together; a record
+    keeps them all together, typed by a fixed struct layout, so one put()
+    changes every field at once and one get() gives a set of values that
+    were all there at the same time.
+
+    A write packs its values into a scratch buffer and reads them back as
+    they are stored, so a bad value or a field the record doesn't have
+    raises before the record is touched.  Only then are interrupts turned
+    off, the decoded values copied in, and the sequence number added to
+    before and after, so the number is odd while a write is under way.
+    Writes in an interrupt use the same scratch buffer, so a record must
+    not be written both by a task and in an interrupt.  A read of every
+    field notes the number, copies the values and checks the number again;
+    if a write in an interrupt got in between, it reads again.  A read of
+    one field is one list lookup.  Reads never turn interrupts off.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+import struct
+import pyb
+import task_share
+
+class SharedRecord(task_share.BaseShare):
+    """!
+    This class implements a share of a fixed set of named fields.  The
+    values are kept in a list, as they unpack from the record's struct
+    layout; the list, and the scratch buffer writes are packed into, are
+    made when the record is made.  Like an EventShare, a record can wake
+    tasks waiting on some of its fields when a write changes them.
+    """
+    ser_num = 0
+
+    def __init__(self, fields, thread_protect=True, name=None):
+        """!
+        Creates a record with every field zero.
+        @param fields - (name, type code) pairs of the fields, in the order
+                        put() and get() take them; the type codes are those
+                        of struct, such as "f" or "B"
+        @param thread_protect - whether to turn interrupts off around writes;
+                                without it an interrupt must not read a record
+                                a task writes
+        @param name - a name for the record, for diagnostics
+        """
+        self._format = "<" + "".join(code for field, code in fields)
+        super().__init__(self._format, thread_protect, name)
+        self._name = str(name) if name is not None else "Record" + str(SharedRecord.ser_num)
+        SharedRecord.ser_num += 1
+        ## The names of the fields, in order
+        self.fields = tuple(field for field, code in fields)
+        self._indices = {field: n for n, field in enumerate(self.fields)}
+        self._field_formats = tuple("<" + code for field, code in fields)
+        self._offsets = []
+        offset = 0
+        for field_format in self._field_formats:
+            self._offsets.append(offset)
+            offset += struct.calcsize(field_format)
+        self._scratch = bytearray(offset)
+        ## The value of every field as stored, and the new values of a set()
+        #  before they are stored
+        self._values = list(struct.unpack_from(self._format, self._scratch, 0))
+        self._new = list(self._values)
+        self._seq = 0
+        self._waiting = []
+
+    def _index(self, field):
+        try:
+            return self._indices[field]
+        except KeyError:
+            raise KeyError(f"{self._name} has no field {field}") from None
+
+    def _mask(self, fields):
+        if not fields:
+            return (1 << len(self.fields)) - 1
+        mask = 0
+        for field in fields:
+            mask |= 1 << self._index(field)
+        return mask
+
+    def wake(self, task, *fields):
+        """!
+        Makes a task run whenever a write changes some of the fields.
+        @param task - the cotask Task to wake
+        @param fields - the names of the fields it waits on, or none for all
+        """
+        mask = self._mask(fields)
+        for waiting in self._waiting:
+            if waiting[0] is task:
+                waiting[1] |= mask
+                return
+        self._waiting.append([task, mask])
+
+    def ignore(self, task):
+        """!
+        Stops a task being woken by the record.
+        @param task - the cotask Task
+        """
+        for waiting in self._waiting:
+            if waiting[0] is task:
+                self._waiting.remove(waiting)
+                return
+
+    def put(self, *values, in_ISR=False):
+        """!
+        Writes every field at once.
+        @param values - the value of each field, in order
+        @param in_ISR - True when called from an interrupt
+        """
+        struct.pack_into(self._format, self._scratch, 0, *values)
+        new = struct.unpack_from(self._format, self._scratch, 0)
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq()
+        stored = self._values
+        changed = 0
+        self._seq += 1
+        for n in range(len(stored)):
+            # compared as stored, so a float that rounds to the same value
+            # is no change
+            if stored[n] != new[n]:
+                stored[n] = new[n]
+                changed |= 1 << n
+        self._seq += 1
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq(irq_state)
+        self._wake_changed(changed)
+
+    def set(self, *pairs, in_ISR=False):
+        """!
+        Writes some of the fields at once and leaves the others as they are.
+        @param pairs - a field name then its value, for each field written,
+                       such as set("yaw_done", 1, "pitch_done", 1)
+        @param in_ISR - True when called from an interrupt
+        """
+        new = self._new
+        for n in range(0, len(pairs), 2):
+            index = self._index(pairs[n])
+            field_format = self._field_formats[index]
+            offset = self._offsets[index]
+            struct.pack_into(field_format, self._scratch, offset, pairs[n + 1])
+            new[index] = struct.unpack_from(field_format, self._scratch, offset)[0]
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq()
+        stored = self._values
+        indices = self._indices
+        changed = 0
+        self._seq += 1
+        for n in range(0, len(pairs), 2):
+            index = indices[pairs[n]]
+            if stored[index] != new[index]:
+                stored[index] = new[index]
+                changed |= 1 << index
+        self._seq += 1
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq(irq_state)
+        self._wake_changed(changed)
+
+    def get(self, field=None):
+        """!
+        Reads the record.
+        @param field - the name of one field to read, or None for all of them
+        @returns the field's value, or a tuple of every field's value in order
+        """
+        if field is not None:
+            return self._values[self._index(field)]
+        while True:
+            seq = self._seq
+            values = tuple(self._values)
+            # a write in an interrupt got in part way through, so read again
+            if seq == self._seq and not seq & 1:
+                return values
+
+    def _wake_changed(self, changed):
+        if changed:
+            for task, mask in self._waiting:
+                if changed & mask:
+                    task.go()
+
+    def __repr__(self):
+        return f"{self._name:<16s}: record<{', '.join(self.fields)}> seq {self._seq}"
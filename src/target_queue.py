@@ -0,0 +1,125 @@
+"""!
+@file target_queue.py
+    This file contains the queue of targets for engaging more than one
+    person in a run.  The camera task loads it with the setpoints of every
+    person find_targets() finds, and the trigger task works through it, one
+    shot per target, before the turret goes home.  The targets are put in
+    the order that takes the least slewing, worked out with the move
+    planner's move times from where the encoders say the turret is.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+from array import array
+
+## How far in s of slewing a person found in a later image may be from the
+#  current target to be taken as the same person, and followed
+TRACK_TIME = 0.2
+
+class TargetQueue:
+    """!
+    This class implements the target queue.  The setpoints are kept in two
+    float arrays made when the queue is made, so loading it doesn't
+    allocate.
+    """
+
+    def __init__(self, planner, size=3):
+        """!
+        Creates an empty queue.
+        @param planner - the MovePlanner whose move times order the targets
+        @param size - the most targets the queue holds
+        """
+        self.planner = planner
+        self.size = size
+        ## The yaw and pitch setpoints of the targets, in the order they are engaged
+        self.yaw = array("f", [0.0] * size)
+        self.pitch = array("f", [0.0] * size)
+        ## How many targets are loaded and which one is being engaged
+        self.count = 0
+        self.index = 0
+
+    def reset(self):
+        """!
+        Empties the queue, so the next targets found are loaded.
+        """
+        self.count = 0
+        self.index = 0
+
+    def loaded(self):
+        """!
+        Tells whether the queue holds targets, engaged or not.
+        """
+        return self.count > 0
+
+    def load(self, setpoints, yaw, pitch):
+        """!
+        This method fills the queue and orders it.  Starting from the turret's
+        position, the target that takes the least time to slew to is taken
+        next, then the one nearest that, and so on.  There are only a few
+        targets, so this greedy order is the same as the best one almost
+        every time.
+        @param setpoints - (yaw, pitch) setpoints of the targets; any past
+                           the size of the queue are left out
+        @param yaw - the yaw position the turret is at, from the encoder
+        @param pitch - the pitch position the turret is at, from the encoder
+        @returns the setpoints of the first target, or None if there are none
+        """
+        self.count = min(len(setpoints), self.size)
+        self.index = 0
+        for n in range(self.count):
+            self.yaw[n], self.pitch[n] = setpoints[n]
+        for n in range(self.count):
+            best = n
+            best_time = None
+            for m in range(n, self.count):
+                t = self.planner.move_time(yaw, pitch, self.yaw[m], self.pitch[m])
+                if best_time is None or t < best_time:
+                    best = m
+                    best_time = t
+            self.yaw[n], self.yaw[best] = self.yaw[best], self.yaw[n]
+            self.pitch[n], self.pitch[best] = self.pitch[best], self.pitch[n]
+            yaw = self.yaw[n]
+            pitch = self.pitch[n]
+        return self.current()
+
+    def current(self):
+        """!
+        This method gives the target being engaged.
+        @returns its yaw and pitch setpoints, or None if every target is done
+        """
+        if self.index >= self.count:
+            return None
+        return self.yaw[self.index], self.pitch[self.index]
+
+    def advance(self):
+        """!
+        This method moves on to the next target once one has been shot.
+        @returns its yaw and pitch setpoints, or None if that was the last one
+        """
+        if self.index < self.count:
+            self.index += 1
+        return self.current()
+
+    def track(self, setpoints):
+        """!
+        This method follows the target being engaged as it moves: the person
+        found in a later image nearest it, if within TRACK_TIME, takes its
+        place.
+        @param setpoints - (yaw, pitch) setpoints of the people found
+        @returns the setpoints of the target being engaged, or None if every
+                 target is done
+        """
+        target = self.current()
+        if target is None:
+            return None
+        best = None
+        best_time = TRACK_TIME
+        for yaw, pitch in setpoints:
+            t = self.planner.move_time(target[0], target[1], yaw, pitch)
+            if t <= best_time:
+                best = (yaw, pitch)
+                best_time = t
+        if best is not None:
+            self.yaw[self.index], self.pitch[self.index] = best
+        return self.current()
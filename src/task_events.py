@@ -0,0 +1,129 @@
+"""!
+@file task_events.py
+    This file lets cotask tasks run when something happens instead of every
+    period.  A task made without a period only runs after its go() method is
+    called, so a task which spends most of its runs finding nothing new in
+    its shares can be made that way and woken by:
+    - an EventShare it waits on, which wakes it whenever its value changes
+    - an Alarm, which wakes it at a set time from one hardware timer, for
+      the waits that are on the clock rather than on another task
+    cotask and task_share themselves are left as they are.
+@author Jared Sinasohn
+@author Sydney Ulvick
+@author Sean Nakashimo
+@date   2024-March-23
+"""
+from array import array
+import pyb
+import utime
+import task_share
+
+class EventShare(task_share.Share):
+    """!
+    This class implements a share which wakes the tasks waiting on it when a
+    put() changes its value.  Putting the same value again wakes nobody, so
+    a task that publishes every period only wakes its readers when there is
+    something new.
+    """
+
+    def __init__(self, type_code, thread_protect=True, name=None):
+        """!
+        Creates a share.
+        @param type_code - the array type code of the value, such as "f"
+        @param thread_protect - whether to turn interrupts off around puts and gets
+        @param name - a name for the share, for diagnostics
+        """
+        super().__init__(type_code, thread_protect, name)
+        self._waiting = []
+
+    def wake(self, task):
+        """!
+        Makes a task run whenever the value changes.
+        @param task - the cotask Task to wake
+        """
+        if task not in self._waiting:
+            self._waiting.append(task)
+
+    def ignore(self, task):
+        """!
+        Stops a task being woken when the value changes.
+        @param task - the cotask Task
+        """
+        if task in self._waiting:
+            self._waiting.remove(task)
+
+    def put(self, data, in_ISR=False):
+        """!
+        Puts a value in the share and wakes the waiting tasks if it changed.
+        @param data - the value
+        @param in_ISR - True when called from an interrupt
+        """
+        # compared as stored, so a float that rounds to the same value is no change
+        old = self._buffer[0]
+        super().put(data, in_ISR)
+        if self._buffer[0] != old:
+            for task in self._waiting:
+                task.go()
+
+class Alarm:
+    """!
+    This class implements timed wakeups for tasks from one hardware timer.
+    The timer interrupts every tick and wakes each task whose time has come,
+    so a task is woken up to a tick late.  Each task has at most one time
+    set; setting another replaces it.
+    """
+
+    def __init__(self, timer, tick_ms=5, size=4):
+        """!
+        Creates an alarm and starts its timer.
+        @param timer - the number of a timer nothing else uses
+        @param tick_ms - how often the timer interrupts in ms
+        @param size - the most tasks with a time set at once
+        """
+        self.tick_ms = tick_ms
+        self._tasks = [None] * size
+        self._due = array("l", [0] * size)
+        self._timer = pyb.Timer(timer, freq=1000 // tick_ms)
+        self._timer.callback(self._tick)
+
+    def wake_after(self, task, ms):
+        """!
+        Sets the time a task is woken.
+        @param task - the cotask Task to wake
+        @param ms - how long from now in ms; 0 or less wakes it on the next tick
+        """
+        irq_state = pyb.disable_irq()
+        # the task's own slot if it has one, otherwise the first free one
+        slot = None
+        for n in range(len(self._tasks)):
+            if self._tasks[n] is task:
+                slot = n
+                break
+            if slot is None and self._tasks[n] is None:
+                slot = n
+        if slot is None:
+            pyb.enable_irq(irq_state)
+            raise ValueError("no room in the alarm for another task")
+        self._tasks[slot] = task
+        self._due[slot] = utime.ticks_add(utime.ticks_ms(), int(ms))
+        pyb.enable_irq(irq_state)
+
+    def cancel(self, task):
+        """!
+        Clears the time set for a task, if there is one.
+        @param task - the cotask Task
+        """
+        irq_state = pyb.disable_irq()
+        for n in range(len(self._tasks)):
+            if self._tasks[n] is task:
+                self._tasks[n] = None
+        pyb.enable_irq(irq_state)
+
+    def _tick(self, timer):
+        # runs in the timer interrupt, so it mustn't allocate
+        now = utime.ticks_ms()
+        for n in range(len(self._tasks)):
+            task = self._tasks[n]
+            if task is not None and utime.ticks_diff(now, self._due[n]) >= 0:
+                self._tasks[n] = None
+                task.go()